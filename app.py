@@ -5,26 +5,37 @@ import os
 import time
 import sqlite3
 from pathlib import Path
-from typing import List, Dict, Optional, Any
+from typing import List, Dict, Optional, Any, Tuple
 from datetime import datetime
 
 from fastapi import FastAPI, HTTPException, Depends, Query, Request
-from fastapi.responses import HTMLResponse, FileResponse, JSONResponse
+from fastapi.responses import HTMLResponse, FileResponse, JSONResponse, StreamingResponse, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from pydantic import BaseModel
 
-from config import DB_PATH, PORT, HOST, API_TOKEN
+from config import DB_PATH, PORT, HOST, API_TOKEN, CORP_ID, WECOM_CALLBACK_TOKEN, WECOM_CALLBACK_AES_KEY
 from wecom_client import wecom_client
 from exporter import CustomerExporter
-from sync_service import SyncService
+from sync_service import SyncService, write_customers
 from group_tags_api import router as group_tags_router
-
-# 创建同步服务实例（10线程并发）
-sync_service = SyncService(wecom_client, max_workers=10)
+import customer_index
+import customer_snapshot
+import tag_bitmap
+import tag_classifier
+import fast_json
+from fast_json import FastJSONResponse
+import migrations
+import rate_limiter
+from wecom_crypto import WeComCrypto, WeComCryptoError
+from database import get_connection, offload, run_blocking
+from query_cache import cached, query_cache, bump_generation, conditional_get
+
+# 创建同步服务实例（并发按企业微信接口限流自适应）
+sync_service = SyncService(wecom_client)
 
 # 创建 FastAPI 应用
-app = FastAPI(title="企业微信 CRM", version="1.0")
+app = FastAPI(title="企业微信 CRM", version="1.0", default_response_class=FastJSONResponse)
 
 # CORS 配置
 app.add_middleware(
@@ -39,6 +50,9 @@ app.add_middleware(
 from auth_middleware import auth_middleware
 app.middleware("http")(auth_middleware)
 
+# 画像接口的 ETag / 304
+app.middleware("http")(conditional_get)
+
 # 引入客户群标签路由
 app.include_router(group_tags_router)
 
@@ -74,7 +88,7 @@ def init_database():
     """初始化数据库"""
     Path(DB_PATH).parent.mkdir(parents=True, exist_ok=True)
     
-    conn = sqlite3.connect(DB_PATH)
+    conn = get_connection()
     cursor = conn.cursor()
     
     # 创建客户表
@@ -403,6 +417,25 @@ def init_database():
                         print(f"[警告] SQL执行出错: {str(e)[:100]}")
     print("[数据库] 源数据管理表初始化完成")
     
+    # 客户标签关联表（替代 enterprise_tags LIKE 扫描）
+    customer_index.init_tag_link_table(cursor)
+    # 客户全文搜索索引（替代 name/remark/corp_name 前导通配 LIKE）
+    customer_index.init_search_index(cursor)
+    conn.commit()
+    
+    # 版本化迁移（索引、汇总表等增量结构变更），执行后自动 ANALYZE；派生数据的回填依赖这些表，放在迁移之后
+    migrations.run_migrations(conn)
+    
+    customer_index.ensure_tag_links(conn)
+    # 标签分类表（重点卡片/省份/增长分类）：每次启动按当前规则重新分类（规则文件修改后生效），之后再回填依赖分类的汇总表
+    customer_index.rebuild_tag_classes(conn)
+    # 标签统计汇总表（替代画像接口逐客户解析标签 JSON）
+    customer_index.ensure_tag_stats(conn)
+    # 每日新增客户汇总表（替代时间统计、增长趋势的全表扫描）
+    customer_index.ensure_daily_adds(conn)
+    # 标签组合共现统计表（替代热门组合的逐客户枚举）
+    customer_index.ensure_tag_combo_stats(conn)
+    
     conn.commit()
     conn.close()
     print("[数据库] 初始化完成")
@@ -410,11 +443,20 @@ def init_database():
 # 启动时初始化数据库
 init_database()
 
+
+@app.on_event("startup")
+async def warm_tag_index():
+    """启动后在数据库线程池中构建标签位图索引与客户列式快照，不阻塞服务启动"""
+    import asyncio
+    loop = asyncio.get_running_loop()
+    loop.create_task(run_blocking(tag_bitmap.tag_index.ensure_built))
+    loop.create_task(run_blocking(customer_snapshot.snapshot.ensure_fresh))
+
 # ========== 工具函数 ==========
 
 def get_db():
     """获取数据库连接"""
-    conn = sqlite3.connect(DB_PATH)
+    conn = get_connection()
     conn.row_factory = sqlite3.Row
     return conn
 
@@ -458,6 +500,126 @@ def get_wecom_config():
         'agentid': ''
     }
 
+def encode_cursor(sort_value: Optional[int], row_id: str) -> str:
+    """将 (排序时间, 主键) 编码为不透明的分页游标（排序时间为 NULL 时编码为 null）"""
+    import json
+    import base64
+    raw = json.dumps([sort_value, row_id], ensure_ascii=False).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+def decode_cursor(cursor: str) -> tuple:
+    """解析分页游标，返回 (排序时间或 None, 主键)；格式错误时返回 400"""
+    import json
+    import base64
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        sort_value, row_id = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        return (int(sort_value) if sort_value is not None else None), str(row_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="无效的分页游标")
+
+def keyset_rows(db_cursor, select_sql: str, where_sql: str, params: list, sort_column: str, id_column: str,
+                last_sort: Optional[int], last_id: str, limit: int) -> list:
+    """
+    游标分页：ORDER BY sort_column DESC, id_column DESC 中位于 (last_sort, last_id) 之后的 limit 行
+    排序列为 NULL 的行排在最后，但不满足行值比较，单独按主键接在非 NULL 行之后查询（两段都走索引）
+    """
+    rows = []
+    if last_sort is not None:
+        rows = db_cursor.execute(f"""
+            {select_sql}
+            WHERE {where_sql} AND ({sort_column}, {id_column}) < (?, ?)
+            ORDER BY {sort_column} DESC, {id_column} DESC
+            LIMIT ?
+        """, params + [last_sort, last_id, limit]).fetchall()
+        if len(rows) >= limit:
+            return rows
+        tail_sql, tail_params = f"{sort_column} IS NULL", []
+    else:
+        tail_sql, tail_params = f"{sort_column} IS NULL AND {id_column} < ?", [last_id]
+    rows += db_cursor.execute(f"""
+        {select_sql}
+        WHERE {where_sql} AND {tail_sql}
+        ORDER BY {id_column} DESC
+        LIMIT ?
+    """, params + tail_params + [limit - len(rows)]).fetchall()
+    return rows
+
+def build_customer_filters(
+    current_user: Optional[dict],
+    owner_userid: Optional[str] = None,
+    user_type: Optional[str] = None,
+    add_way: Optional[str] = None,
+    date_start: Optional[str] = None,
+    date_end: Optional[str] = None,
+    gender: Optional[str] = None,
+    tags: Optional[str] = None,
+    provinces: Optional[str] = None
+) -> Optional[tuple]:
+    """
+    构建客户列表的筛选条件（数据隔离 + 筛选参数，不含关键词搜索）
+    返回 (where_clauses, params)；用户没有任何数据权限时返回 None
+    """
+    where_clauses = []
+    params = []
+    
+    # 数据隔离：非超级管理员只能看到自己的客户
+    # 如果 current_user 为 None（使用旧API Token），跳过数据隔离（向后兼容）
+    if current_user and not current_user.get('is_super_admin'):
+        if current_user.get('wecom_user_id'):
+            # 强制过滤：只能看自己的客户
+            where_clauses.append("owner_userid = ?")
+            params.append(current_user['wecom_user_id'])
+        else:
+            # 没有绑定企微，无可见客户
+            return None
+    
+    if owner_userid:
+        where_clauses.append("owner_userid = ?")
+        params.append(owner_userid)
+    
+    if add_way:
+        where_clauses.append("add_way = ?")
+        params.append(add_way)
+    
+    if gender:
+        where_clauses.append("gender = ?")
+        params.append(gender)
+    
+    if date_start:
+        where_clauses.append("add_time >= ?")
+        params.append(int(datetime.strptime(date_start, '%Y-%m-%d').timestamp()))
+    
+    if date_end:
+        where_clauses.append("add_time <= ?")
+        params.append(int(datetime.strptime(date_end, '%Y-%m-%d').timestamp()) + 86400)
+    
+    # 用户属性筛选（通过标签关联表，支持多关键词，用 | 分隔，例如 "用户|客户"）
+    if user_type:
+        keywords = [k for k in user_type.split('|') if k]
+        if keywords:
+            clause, clause_params = customer_index.tag_name_keyword_filter(keywords)
+            where_clauses.append(clause)
+            params.extend(clause_params)
+    
+    # 企业标签筛选（按标签ID精确匹配）
+    if tags:
+        tag_list = [t for t in tags.split(',') if t]
+        if tag_list:
+            clause, clause_params = customer_index.tag_id_filter(tag_list)
+            where_clauses.append(clause)
+            params.extend(clause_params)
+    
+    # 省份筛选（省份标签名前缀匹配）
+    if provinces:
+        province_list = [p for p in provinces.split(',') if p]
+        if province_list:
+            clause, clause_params = customer_index.tag_name_prefix_filter(province_list)
+            where_clauses.append(clause)
+            params.extend(clause_params)
+    
+    return where_clauses, params
+
 # ========== Pydantic 模型 ==========
 
 class SyncCustomersRequest(BaseModel):
@@ -492,10 +654,21 @@ async def health():
         "port": PORT
     }
 
+@app.get("/api/cache/stats")
+async def get_cache_stats(token: str = Depends(check_token)):
+    """查询缓存命中统计"""
+    return {"success": True, "data": query_cache.stats()}
+
+@app.get("/api/sync/rate-limits")
+async def get_rate_limits(token: str = Depends(check_token)):
+    """企业微信各接口族的限流状态（当前并发上限、在途请求、被限流次数）"""
+    return {"success": True, "data": rate_limiter.stats()}
+
 @app.post("/api/sync/customers")
-async def sync_customers(request: SyncCustomersRequest, token: str = Depends(check_token)):
+@offload
+def sync_customers(request: SyncCustomersRequest, token: str = Depends(check_token)):
     """
-    同步客户数据（增量同步，支持10线程并发和后台队列）
+    同步客户数据（增量同步，支持自适应并发和后台队列）
     """
     try:
         print("[API] 开始增量同步客户...")
@@ -522,8 +695,73 @@ async def sync_customers(request: SyncCustomersRequest, token: str = Depends(che
         print(f"[API] 启动同步任务失败: {e}")
         return {"success": False, "message": str(e)}
 
+# ========== 企业微信回调 ==========
+
+import xml.etree.ElementTree as ET
+
+_wecom_crypto: Optional[WeComCrypto] = None
+
+def _get_wecom_crypto() -> WeComCrypto:
+    global _wecom_crypto
+    if _wecom_crypto is None:
+        if not sync_service.callback_enabled:
+            raise WeComCryptoError("未配置回调 Token / EncodingAESKey")
+        _wecom_crypto = WeComCrypto(WECOM_CALLBACK_TOKEN, WECOM_CALLBACK_AES_KEY, CORP_ID)
+    return _wecom_crypto
+
+def _dispatch_wecom_event(event: ET.Element):
+    """把客户/客户群变更事件登记到同步服务（合并窗口结束后只同步变更的ID）"""
+    event_type = event.findtext('Event', '')
+    change_type = event.findtext('ChangeType', '')
+    
+    if event_type == 'change_external_contact':
+        external_userid = event.findtext('ExternalUserID', '')
+        if not external_userid:
+            return
+        if change_type in ('del_external_contact', 'del_follow_user'):
+            # 本地不删除客户，保留历史数据
+            print(f"[回调] 忽略删除事件: {change_type} {external_userid}")
+            return
+        sync_service.enqueue_changes(customers={external_userid: event.findtext('UserID', '')})
+    elif event_type == 'change_external_chat':
+        chat_id = event.findtext('ChatId', '')
+        if not chat_id:
+            return
+        if change_type == 'dismiss':
+            print(f"[回调] 忽略解散事件: {chat_id}")
+            return
+        sync_service.enqueue_changes(chat_ids=[chat_id])
+
+@app.get("/api/wecom/callback")
+def verify_wecom_callback(msg_signature: str, timestamp: str, nonce: str, echostr: str):
+    """企业微信回调 URL 验证：校验签名并返回解密后的 echostr"""
+    try:
+        echo = _get_wecom_crypto().verify_and_decrypt(msg_signature, timestamp, nonce, echostr)
+    except WeComCryptoError as e:
+        print(f"[回调] URL 验证失败: {e}")
+        raise HTTPException(status_code=403, detail=str(e))
+    return PlainTextResponse(echo)
+
+@app.post("/api/wecom/callback")
+async def receive_wecom_callback(request: Request, msg_signature: str, timestamp: str, nonce: str):
+    """
+    企业微信回调事件（change_external_contact / change_external_chat）
+    签名校验通过后只登记变更的ID并立即应答，同步由后台任务合并执行
+    """
+    body = await request.body()
+    try:
+        encrypt = ET.fromstring(body).findtext('Encrypt', '')
+        event = ET.fromstring(_get_wecom_crypto().verify_and_decrypt(msg_signature, timestamp, nonce, encrypt))
+    except (WeComCryptoError, ET.ParseError) as e:
+        print(f"[回调] 事件校验失败: {e}")
+        raise HTTPException(status_code=403, detail=str(e))
+    
+    _dispatch_wecom_event(event)
+    return PlainTextResponse("success")
+
 @app.get("/api/sync/status/{task_id}")
-async def get_sync_status(task_id: str, token: str = Depends(check_token)):
+@offload
+def get_sync_status(task_id: str, token: str = Depends(check_token)):
     """
     获取同步任务状态
     """
@@ -546,7 +784,8 @@ async def get_sync_status(task_id: str, token: str = Depends(check_token)):
         return {"success": False, "message": str(e)}
 
 @app.post("/api/sync/stop/{task_id}")
-async def stop_sync(task_id: str, token: str = Depends(check_token)):
+@offload
+def stop_sync(task_id: str, token: str = Depends(check_token)):
     """
     停止同步任务
     """
@@ -569,7 +808,9 @@ async def stop_sync(task_id: str, token: str = Depends(check_token)):
         return {"success": False, "message": str(e)}
 
 @app.get("/api/customers")
-async def get_customers(
+@offload
+@cached("customers")
+def get_customers(
     request: Request,
     page: int = Query(1, ge=1),
     limit: int = Query(20, ge=1, le=100),
@@ -583,127 +824,105 @@ async def get_customers(
     tags: Optional[str] = None,
     provinces: Optional[str] = None,
     search: Optional[str] = None,
+    cursor: Optional[str] = Query(None, description="游标分页：上一页返回的 next_cursor"),
+    with_total: bool = Query(True, description="是否统计总数（无限滚动可传 false 跳过 COUNT）"),
+    order: str = Query("time", description="排序：time 按添加时间 / relevance 按搜索相关度"),
     token: str = Depends(check_token)
 ):
     """
     获取客户列表（分页 + 筛选）
     支持数据隔离：超级管理员看全部，普通员工只看自己的
+    支持两种分页：page/limit 页码分页；cursor 游标分页（按 add_time, id 定位，深翻页不变慢）
     """
     # 获取当前用户
     current_user = getattr(request.state, 'user', None)
     
-    conn = get_db()
-    cursor = conn.cursor()
-    
     # 构建查询条件
-    where_clauses = []
-    params = []
-    
-    # 数据隔离：非超级管理员只能看到自己的客户
-    # 如果 current_user 为 None（使用旧API Token），跳过数据隔离（向后兼容）
-    if current_user and not current_user.get('is_super_admin'):
-        if current_user.get('wecom_user_id'):
-            # 强制过滤：只能看自己的客户
-            where_clauses.append("owner_userid = ?")
-            params.append(current_user['wecom_user_id'])
-        else:
-            # 没有绑定企微，返回空
-            conn.close()
-            return {
-                "success": True,
-                "data": [],
-                "total": 0,
-                "page": page,
-                "limit": limit
-            }
-    
-    if owner_userid:
-        where_clauses.append("owner_userid = ?")
-        params.append(owner_userid)
-    
-    if add_way:
-        where_clauses.append("add_way = ?")
-        params.append(add_way)
-    
-    if gender:
-        where_clauses.append("gender = ?")
-        params.append(gender)
-    
-    if date_start:
-        where_clauses.append("add_time >= ?")
-        params.append(int(datetime.strptime(date_start, '%Y-%m-%d').timestamp()))
+    filters = build_customer_filters(
+        current_user, owner_userid, user_type, add_way,
+        date_start, date_end, gender, tags, provinces
+    )
+    if filters is None:
+        # 没有绑定企微，返回空
+        return {
+            "success": True,
+            "data": [],
+            "total": 0,
+            "page": page,
+            "limit": limit,
+            "next_cursor": None
+        }
+    where_clauses, params = filters
     
-    if date_end:
-        where_clauses.append("add_time <= ?")
-        params.append(int(datetime.strptime(date_end, '%Y-%m-%d').timestamp()) + 86400)
+    conn = get_db()
+    db_cursor = conn.cursor()
     
+    # 关键词搜索（走 FTS5 全文索引，放在最后以便相关度排序时单独处理）
+    base_where_sql = " AND ".join(where_clauses) if where_clauses else "1=1"
+    base_params = list(params)
+    ranked = bool(search) and order == 'relevance' and not cursor and customer_index.use_fts(db_cursor, search)
     if search:
-        where_clauses.append("(name LIKE ? OR remark LIKE ? OR corp_name LIKE ?)")
-        params.extend([f"%{search}%", f"%{search}%", f"%{search}%"])
-    
-    # 用户属性筛选（通过标签，支持多关键词）
-    if user_type:
-        if '|' in user_type:
-            # 支持多关键词，用 | 分隔，例如 "用户|客户"
-            keywords = user_type.split('|')
-            user_type_conditions = []
-            for keyword in keywords:
-                user_type_conditions.append("enterprise_tags LIKE ?")
-                params.append(f"%{keyword}%")
-            where_clauses.append(f"({' OR '.join(user_type_conditions)})")
-        else:
-            where_clauses.append("enterprise_tags LIKE ?")
-            params.append(f"%{user_type}%")
-    
-    # 企业标签筛选
-    if tags:
-        tag_list = tags.split(',')
-        tag_conditions = []
-        for tag_id in tag_list:
-            tag_conditions.append("enterprise_tags LIKE ?")
-            params.append(f"%{tag_id}%")
-        where_clauses.append(f"({' OR '.join(tag_conditions)})")
-    
-    # 省份筛选
-    if provinces:
-        province_list = provinces.split(',')
-        province_conditions = []
-        for province in province_list:
-            province_conditions.append("enterprise_tags LIKE ?")
-            params.append(f"%{province}%")
-        where_clauses.append(f"({' OR '.join(province_conditions)})")
+        clause, clause_params = customer_index.search_filter(db_cursor, search)
+        where_clauses.append(clause)
+        params.extend(clause_params)
     
     where_sql = " AND ".join(where_clauses) if where_clauses else "1=1"
     
-    # 查询总数
-    cursor.execute(f"SELECT COUNT(*) as total FROM customers WHERE {where_sql}", params)
-    total = cursor.fetchone()['total']
-    
-    # 查询列表
-    offset = (page - 1) * limit
-    cursor.execute(f"""
-        SELECT * FROM customers 
-        WHERE {where_sql}
-        ORDER BY add_time DESC
-        LIMIT ? OFFSET ?
-    """, params + [limit, offset])
-    
-    rows = cursor.fetchall()
-    customers = [dict(row) for row in rows]
+    # 查询总数（with_total=false 时跳过）
+    total = None
+    if with_total:
+        db_cursor.execute(f"SELECT COUNT(*) as total FROM customers WHERE {where_sql}", params)
+        total = db_cursor.fetchone()['total']
+    
+    # 查询列表：多取一条用于判断是否还有下一页
+    if ranked:
+        # 按相关度排序（只支持页码分页）
+        offset = (page - 1) * limit
+        db_cursor.execute(
+            customer_index.search_ranked_sql(base_where_sql),
+            [customer_index.fts_phrase(search)] + base_params + [limit + 1, offset]
+        )
+        rows = db_cursor.fetchall()
+    elif cursor:
+        # 游标分页：直接定位到上一页最后一条之后
+        last_add_time, last_id = decode_cursor(cursor)
+        rows = keyset_rows(db_cursor, "SELECT * FROM customers", where_sql, params,
+                           'add_time', 'id', last_add_time, last_id, limit + 1)
+    else:
+        offset = (page - 1) * limit
+        db_cursor.execute(f"""
+            SELECT * FROM customers 
+            WHERE {where_sql}
+            ORDER BY add_time DESC, id DESC
+            LIMIT ? OFFSET ?
+        """, params + [limit + 1, offset])
+        rows = db_cursor.fetchall()
+    
+    has_more = len(rows) > limit
+    customers = [dict(row) for row in rows[:limit]]
+    next_cursor = None
+    if has_more and not ranked:
+        next_cursor = encode_cursor(customers[-1]['add_time'], customers[-1]['id'])
+    
+    # 搜索命中高亮
+    if search:
+        highlights = customer_index.search_highlights(db_cursor, search, [c['id'] for c in customers])
+        for customer in customers:
+            customer['highlight'] = highlights.get(customer['id'], {})
     
     # 解析 JSON 字段
     import json
     for customer in customers:
         try:
-            customer['tags'] = json.loads(customer.get('tags') or '[]')
+            customer['tags'] = fast_json.loads(customer.get('tags') or '[]')
         except:
             customer['tags'] = []
         try:
-            customer['groups'] = json.loads(customer.get('groups') or '[]')
+            customer['groups'] = fast_json.loads(customer.get('groups') or '[]')
         except:
             customer['groups'] = []
         try:
-            customer['enterprise_tags'] = json.loads(customer.get('enterprise_tags') or '[]')
+            customer['enterprise_tags'] = fast_json.loads(customer.get('enterprise_tags') or '[]')
         except:
             customer['enterprise_tags'] = []
     
@@ -714,11 +933,140 @@ async def get_customers(
         "data": customers,
         "total": total,
         "page": page,
-        "limit": limit
+        "limit": limit,
+        "next_cursor": next_cursor
+    }
+
+# 流式导出每批读取的行数
+CUSTOMER_STREAM_BATCH = 500
+
+# CSV 导出列（enterprise_tags 输出为标签名，用 | 分隔）
+CUSTOMER_STREAM_CSV_COLUMNS = [
+    'id', 'name', 'remark', 'corp_name', 'position', 'gender', 'type',
+    'owner_userid', 'owner_name', 'add_time', 'add_way', 'description', 'enterprise_tags'
+]
+
+def _open_customer_stream(current_user: Optional[dict], filters: dict, search: Optional[str]):
+    """打开客户流式查询游标；没有数据权限时返回 None"""
+    built = build_customer_filters(current_user, **filters)
+    if built is None:
+        return None
+    where_clauses, params = built
+    
+    conn = get_db()
+    db_cursor = conn.cursor()
+    if search:
+        clause, clause_params = customer_index.search_filter(db_cursor, search)
+        where_clauses.append(clause)
+        params.extend(clause_params)
+    where_sql = " AND ".join(where_clauses) if where_clauses else "1=1"
+    
+    db_cursor.execute(f"""
+        SELECT * FROM customers 
+        WHERE {where_sql}
+        ORDER BY add_time DESC, id DESC
+    """, params)
+    return conn, db_cursor
+
+def _customer_ndjson_lines(rows) -> str:
+    """一批客户行 → NDJSON 文本"""
+    import json
+    lines = []
+    for row in rows:
+        customer = dict(row)
+        for field in ('tags', 'groups', 'enterprise_tags'):
+            try:
+                customer[field] = fast_json.loads(customer.get(field) or '[]')
+            except:
+                customer[field] = []
+        lines.append(fast_json.dumps(customer).decode('utf-8'))
+    return "\n".join(lines) + "\n"
+
+def _customer_csv_lines(rows, header: bool = False) -> str:
+    """一批客户行 → CSV 文本"""
+    import csv
+    import io
+    import json
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if header:
+        writer.writerow(CUSTOMER_STREAM_CSV_COLUMNS)
+    for row in rows:
+        customer = dict(row)
+        try:
+            tag_names = [t.get('tag_name', '') for t in fast_json.loads(customer.get('enterprise_tags') or '[]')]
+        except:
+            tag_names = []
+        customer['enterprise_tags'] = '|'.join(tag_names)
+        writer.writerow([customer.get(col, '') for col in CUSTOMER_STREAM_CSV_COLUMNS])
+    return buffer.getvalue()
+
+@app.get("/api/customers/stream")
+async def stream_customers(
+    request: Request,
+    format: str = Query("ndjson", description="导出格式：ndjson / csv"),
+    owner_userid: Optional[str] = None,
+    user_type: Optional[str] = None,
+    add_way: Optional[str] = None,
+    date_start: Optional[str] = None,
+    date_end: Optional[str] = None,
+    gender: Optional[str] = None,
+    tags: Optional[str] = None,
+    provinces: Optional[str] = None,
+    search: Optional[str] = None,
+    token: str = Depends(check_token)
+):
+    """
+    流式导出客户（筛选条件、数据隔离与 /api/customers 一致）
+    按批从数据库游标读取并边读边写，内存占用与导出行数无关
+    """
+    if format not in ('ndjson', 'csv'):
+        raise HTTPException(status_code=400, detail="format 只支持 ndjson 或 csv")
+    
+    current_user = getattr(request.state, 'user', None)
+    filters = {
+        "owner_userid": owner_userid, "user_type": user_type, "add_way": add_way,
+        "date_start": date_start, "date_end": date_end, "gender": gender,
+        "tags": tags, "provinces": provinces
     }
+    opened = await run_blocking(_open_customer_stream, current_user, filters, search)
+    
+    async def generate():
+        if opened is None:
+            if format == 'csv':
+                yield '\ufeff' + _customer_csv_lines([], header=True)
+            return
+        conn, db_cursor = opened
+        try:
+            first = True
+            while True:
+                rows = await run_blocking(db_cursor.fetchmany, CUSTOMER_STREAM_BATCH)
+                if format == 'csv':
+                    if first:
+                        # BOM 让 Excel 正确识别 UTF-8 中文
+                        yield '\ufeff' + _customer_csv_lines(rows, header=True)
+                    elif rows:
+                        yield _customer_csv_lines(rows)
+                elif rows:
+                    yield _customer_ndjson_lines(rows)
+                first = False
+                if not rows:
+                    break
+        finally:
+            await run_blocking(conn.close)
+    
+    if format == 'csv':
+        return StreamingResponse(
+            generate(),
+            media_type="text/csv",
+            headers={"Content-Disposition": "attachment; filename=customers.csv"}
+        )
+    return StreamingResponse(generate(), media_type="application/x-ndjson")
 
 @app.get("/api/customers/{customer_id}")
-async def get_customer_detail(customer_id: str, token: str = Depends(check_token)):
+@offload
+@cached("customer_detail")
+def get_customer_detail(customer_id: str, token: str = Depends(check_token)):
     """
     获取客户详情
     """
@@ -750,7 +1098,8 @@ async def get_customer_detail(customer_id: str, token: str = Depends(check_token
     return {"success": True, "data": customer}
 
 @app.put("/api/customers/{customer_id}/update")
-async def update_customer(
+@offload
+def update_customer(
     customer_id: str,
     request: dict,
     token: str = Depends(check_token)
@@ -772,7 +1121,7 @@ async def update_customer(
         old_tags = []
         if row and row['enterprise_tags']:
             try:
-                old_tags_data = json.loads(row['enterprise_tags'])
+                old_tags_data = fast_json.loads(row['enterprise_tags'])
                 old_tags = [t['tag_id'] for t in old_tags_data]
             except:
                 pass
@@ -781,12 +1130,13 @@ async def update_customer(
         current_time = int(time.time())
         cursor.execute("""
             UPDATE customers 
-            SET remark = ?, updated_at = ?
+            SET remark = ?, updated_at = ?, content_hash = NULL
             WHERE id = ?
         """, (remark, current_time, customer_id))
         
         conn.commit()
         conn.close()
+        bump_generation()
         
         # 3. 同步到企业微信
         if owner_userid:
@@ -839,8 +1189,47 @@ async def update_customer(
         traceback.print_exc()
         return {"success": False, "message": str(e)}
 
+EMPTY_EMPLOYEE_METRICS = {"group_count": 0, "customer_count": 0, "recent_customer_count": 0}
+
+
+def _employee_metrics(cursor, owner_ids: Optional[List[str]] = None) -> Dict[str, Dict[str, int]]:
+    """
+    员工统计：{userid: {group_count, customer_count, recent_customer_count}}
+    群数量一次分组查询；客户数与最近30天新增取自客户列式快照（与员工排行榜同源），与员工人数无关
+    owner_ids 为 None 时统计全部员工
+    """
+    metrics: Dict[str, Dict[str, int]] = {}
+    if owner_ids is not None and not owner_ids:
+        return metrics
+    
+    def metric(userid: str) -> Dict[str, int]:
+        if userid not in metrics:
+            metrics[userid] = dict(EMPTY_EMPLOYEE_METRICS)
+        return metrics[userid]
+    
+    if owner_ids is None:
+        cursor.execute("SELECT owner_userid, COUNT(*) FROM customer_groups GROUP BY owner_userid")
+    else:
+        placeholders = ','.join(['?'] * len(owner_ids))
+        cursor.execute(f"""
+            SELECT owner_userid, COUNT(*) FROM customer_groups
+            WHERE owner_userid IN ({placeholders})
+            GROUP BY owner_userid
+        """, owner_ids)
+    for userid, count in cursor.fetchall():
+        metric(userid)["group_count"] = count
+    
+    thirty_days_ago = int(time.time()) - (30 * 24 * 3600)
+    for userid, count in customer_snapshot.snapshot.owner_counts().items():
+        metric(userid)["customer_count"] = count
+    for userid, count in customer_snapshot.snapshot.owner_counts(since=thirty_days_ago).items():
+        metric(userid)["recent_customer_count"] = count
+    return metrics
+
 @app.get("/api/employees")
-async def get_employees(request: Request, token: str = Depends(check_token)):
+@offload
+@cached("employees")
+def get_employees(request: Request, token: str = Depends(check_token)):
     """获取员工列表（企微通讯录，含统计数据）"""
     # 获取当前用户
     current_user = getattr(request.state, 'user', None)
@@ -865,40 +1254,13 @@ async def get_employees(request: Request, token: str = Depends(check_token)):
         return {"success": True, "data": []}
     
     rows = cursor.fetchall()
-    employees = []
+    owner_ids = [row['id'] for row in rows]
+    metrics = _employee_metrics(cursor, owner_ids if current_user and not current_user.get('is_super_admin') else None)
     
+    employees = []
     for row in rows:
         emp = dict(row)
-        userid = emp['id']
-        
-        # 1. 统计该员工创建的群数量
-        cursor.execute("""
-            SELECT COUNT(*) as group_count
-            FROM customer_groups
-            WHERE owner_userid = ?
-        """, (userid,))
-        group_result = cursor.fetchone()
-        emp['group_count'] = group_result[0] if group_result else 0
-        
-        # 2. 统计该员工的好友（客户）数量
-        cursor.execute("""
-            SELECT COUNT(*) as customer_count
-            FROM customers
-            WHERE owner_userid = ?
-        """, (userid,))
-        customer_result = cursor.fetchone()
-        emp['customer_count'] = customer_result[0] if customer_result else 0
-        
-        # 3. 统计该员工最近添加的客户数量（最近30天）
-        thirty_days_ago = int(time.time()) - (30 * 24 * 3600)
-        cursor.execute("""
-            SELECT COUNT(*) as recent_customer_count
-            FROM customers
-            WHERE owner_userid = ? AND add_time >= ?
-        """, (userid, thirty_days_ago))
-        recent_result = cursor.fetchone()
-        emp['recent_customer_count'] = recent_result[0] if recent_result else 0
-        
+        emp.update(metrics.get(emp['id'], EMPTY_EMPLOYEE_METRICS))
         employees.append(emp)
     
     conn.close()
@@ -906,7 +1268,8 @@ async def get_employees(request: Request, token: str = Depends(check_token)):
     return {"success": True, "data": employees}
 
 @app.post("/api/sync/employees")
-async def sync_employees(request: SyncRequest, token: str = Depends(check_token)):
+@offload
+def sync_employees(request: SyncRequest, token: str = Depends(check_token)):
     """同步员工数据"""
     try:
         # 更新配置
@@ -994,6 +1357,7 @@ async def sync_employees(request: SyncRequest, token: str = Depends(check_token)
             synced_count += 1
         
         conn.commit()
+        bump_generation()
         
         # 验证同步后的数据
         cursor.execute("""
@@ -1017,7 +1381,9 @@ async def sync_employees(request: SyncRequest, token: str = Depends(check_token)
         return {"success": False, "message": str(e)}
 
 @app.get("/api/tags")
-async def get_tags(token: str = Depends(check_token)):
+@offload
+@cached("tags")
+def get_tags(token: str = Depends(check_token)):
     """获取标签列表（按组分组）"""
     conn = get_db()
     cursor = conn.cursor()
@@ -1048,7 +1414,8 @@ async def get_tags(token: str = Depends(check_token)):
     return {"success": True, "data": tag_groups}
 
 @app.post("/api/sync/tags")
-async def sync_tags(request: SyncRequest, token: str = Depends(check_token)):
+@offload
+def sync_tags(request: SyncRequest, token: str = Depends(check_token)):
     """同步标签数据"""
     try:
         # 更新配置
@@ -1096,6 +1463,7 @@ async def sync_tags(request: SyncRequest, token: str = Depends(check_token)):
         
         conn.commit()
         conn.close()
+        bump_generation()
         
         return {"success": True, "message": f"同步成功，共 {tag_count} 个标签"}
         
@@ -1201,7 +1569,8 @@ class FollowRecordCreate(BaseModel):
     follow_type: Optional[str] = "电话"
 
 @app.post("/api/follow-records")
-async def create_follow_record(record: FollowRecordCreate, token: str = Depends(check_token)):
+@offload
+def create_follow_record(record: FollowRecordCreate, token: str = Depends(check_token)):
     """添加跟进记录"""
     try:
         conn = get_db()
@@ -1236,7 +1605,8 @@ class ExportToSpreadsheetRequest(BaseModel):
     admin_users: Optional[List[str]] = None  # 管理员列表
 
 @app.post("/api/export/spreadsheet")
-async def export_to_spreadsheet(
+@offload
+def export_to_spreadsheet(
     request: ExportToSpreadsheetRequest,
     token: str = Depends(check_token),
     config: dict = Depends(get_wecom_config)
@@ -1271,7 +1641,7 @@ async def export_to_spreadsheet(
                 tags_str = customer.get('tags', '[]')
                 if tags_str:
                     try:
-                        customer['tags'] = json.loads(tags_str)
+                        customer['tags'] = fast_json.loads(tags_str)
                     except:
                         customer['tags'] = []
                 
@@ -1322,7 +1692,8 @@ class SyncSpreadsheetRequest(BaseModel):
     config: Optional[dict] = None  # 企业微信配置（可选）
 
 @app.post("/api/spreadsheet/upload")
-async def upload_excel(
+@offload
+def upload_excel(
     file: UploadFile = File(...),
     token: str = Depends(check_token)
 ):
@@ -1340,7 +1711,7 @@ async def upload_excel(
         file_id = str(uuid.uuid4())
         file_path = upload_dir / f"{file_id}_{file.filename}"
         
-        content = await file.read()
+        content = file.file.read()
         with open(file_path, "wb") as f:
             f.write(content)
         
@@ -1420,7 +1791,8 @@ def infer_field_type(field_name: str, sample_values: List[str]) -> str:
             return 'text'
 
 @app.post("/api/spreadsheet/create")
-async def create_spreadsheet(
+@offload
+def create_spreadsheet(
     request: CreateSpreadsheetRequest,
     token: str = Depends(check_token)
 ):
@@ -1560,7 +1932,8 @@ async def create_spreadsheet(
         return {"success": False, "message": str(e)}
 
 @app.get("/api/spreadsheet/list")
-async def list_spreadsheets(token: str = Depends(check_token)):
+@offload
+def list_spreadsheets(token: str = Depends(check_token)):
     """获取智能表格列表"""
     try:
         conn = get_db()
@@ -1601,7 +1974,8 @@ async def list_spreadsheets(token: str = Depends(check_token)):
         return {"success": False, "message": str(e)}
 
 @app.get("/api/spreadsheet/{spreadsheet_id}")
-async def get_spreadsheet(spreadsheet_id: str, token: str = Depends(check_token)):
+@offload
+def get_spreadsheet(spreadsheet_id: str, token: str = Depends(check_token)):
     """获取表格详情"""
     try:
         conn = get_db()
@@ -1665,7 +2039,8 @@ async def get_spreadsheet(spreadsheet_id: str, token: str = Depends(check_token)
         return {"success": False, "message": str(e)}
 
 @app.post("/api/spreadsheet/{spreadsheet_id}/sync")
-async def sync_spreadsheet(
+@offload
+def sync_spreadsheet(
     spreadsheet_id: str,
     request: SyncSpreadsheetRequest,
     token: str = Depends(check_token)
@@ -1787,7 +2162,8 @@ async def sync_spreadsheet(
         return {"success": False, "message": str(e)}
 
 @app.delete("/api/spreadsheet/{spreadsheet_id}")
-async def delete_spreadsheet(spreadsheet_id: str, token: str = Depends(check_token)):
+@offload
+def delete_spreadsheet(spreadsheet_id: str, token: str = Depends(check_token)):
     """删除表格（同时删除企业微信中的文档）"""
     try:
         conn = get_db()
@@ -1842,7 +2218,8 @@ async def delete_spreadsheet(spreadsheet_id: str, token: str = Depends(check_tok
 # ========== 新增 API：字段模板管理 ==========
 
 @app.get("/api/templates/list")
-async def get_template_list(token: str = Depends(check_token)):
+@offload
+def get_template_list(token: str = Depends(check_token)):
     """获取字段模板列表"""
     try:
         conn = get_db()
@@ -1873,7 +2250,8 @@ async def get_template_list(token: str = Depends(check_token)):
         return {"success": False, "message": str(e)}
 
 @app.get("/api/templates/{template_id}")
-async def get_template_detail(template_id: str, token: str = Depends(check_token)):
+@offload
+def get_template_detail(template_id: str, token: str = Depends(check_token)):
     """获取模板详情（包含字段配置）"""
     try:
         conn = get_db()
@@ -1958,11 +2336,16 @@ async def create_spreadsheet_manual(
     token: str = Depends(check_token)
 ):
     """手工创建智能表格（不上传Excel）- 使用原始数据"""
+    body = await raw_request.body()
+    return await run_blocking(_create_spreadsheet_manual, body)
+
+
+def _create_spreadsheet_manual(body: bytes):
+    """手工创建智能表格（在数据访问线程池中执行）"""
     import json
     
     try:
         # 直接解析原始数据
-        body = await raw_request.body()
         request_data = json.loads(body)
         
         name = request_data.get('name')
@@ -2191,7 +2574,8 @@ async def get_supplier_list(token: str = Depends(check_token)):
 # ========== 新增 API：手工同步数据 ==========
 
 @app.post("/api/spreadsheet/{spreadsheet_id}/sync-manual")
-async def sync_spreadsheet_manual(
+@offload
+def sync_spreadsheet_manual(
     spreadsheet_id: str,
     token: str = Depends(check_token)
 ):
@@ -2261,7 +2645,8 @@ class ExportCustomersRequest(BaseModel):
     include_avatar: bool = True  # 是否包含头像
 
 @app.post("/api/customers/export")
-async def export_customers(request: ExportCustomersRequest, token: str = Depends(check_token)):
+@offload
+def export_customers(request: ExportCustomersRequest, token: str = Depends(check_token)):
     """
     导出客户数据为Excel文件
     """
@@ -2387,127 +2772,21 @@ def sync_task_disabled():
             if customers:
                 conn = get_db()
                 cursor = conn.cursor()
-                current_time = int(time.time())
-                
-                saved_count = 0
-                for customer in customers:
-                    external_userid = customer.get('external_userid')
-                    if not external_userid:
-                        continue
-                    
-                    cursor.execute("SELECT id FROM customers WHERE id = ?", (external_userid,))
-                    exists = cursor.fetchone()
-                    
-                    # 准备标签数据
-                    import json
-                    tags_json = json.dumps([tag.get('tag_name', '') for tag in customer.get('tags', [])], ensure_ascii=False)
-                    
-                    # 分类标签
-                    enterprise_tags = []
-                    personal_tags = []
-                    rule_tags = []
-                    
-                    for tag in customer.get('tags', []):
-                        tag_type = tag.get('type', 1)
-                        tag_data = {
-                            'tag_id': tag.get('tag_id', ''),
-                            'tag_name': tag.get('tag_name', ''),
-                            'group_name': tag.get('group_name', '')
-                        }
-                        if tag_type == 1:
-                            enterprise_tags.append(tag_data)
-                        elif tag_type == 2:
-                            personal_tags.append(tag_data)
-                        elif tag_type == 3:
-                            rule_tags.append(tag_data)
-                    
-                    enterprise_tags_json = json.dumps(enterprise_tags, ensure_ascii=False)
-                    personal_tags_json = json.dumps(personal_tags, ensure_ascii=False)
-                    rule_tags_json = json.dumps(rule_tags, ensure_ascii=False)
-                    
-                    if exists:
-                        cursor.execute("""
-                            UPDATE customers SET
-                                name = ?, avatar = ?, gender = ?, type = ?,
-                                corp_name = ?, position = ?,
-                                owner_userid = ?, owner_name = ?,
-                                add_time = ?, tags = ?, remark = ?,
-                                description = ?, add_way = ?, im_status = ?, state = ?,
-                                remark_mobiles = ?, remark_corp_name = ?,
-                                enterprise_tags = ?, personal_tags = ?, rule_tags = ?,
-                                unionid = ?,
-                                updated_at = ?
-                            WHERE id = ?
-                        """, (
-                            customer.get('name', ''),
-                            customer.get('avatar', ''),
-                            customer.get('gender', 0),
-                            customer.get('type', 1),
-                            customer.get('corp_name', ''),
-                            customer.get('position', ''),
-                            customer.get('owner_userid', ''),
-                            customer.get('owner_name', ''),
-                            customer.get('add_time', 0),
-                            tags_json,
-                            customer.get('remark', ''),
-                            customer.get('description', ''),
-                            customer.get('add_way', 0),
-                            customer.get('im_status', 0),
-                            customer.get('state', ''),
-                            json.dumps(customer.get('remark_mobiles', []), ensure_ascii=False),
-                            customer.get('remark_corp_name', ''),
-                            enterprise_tags_json,
-                            personal_tags_json,
-                            rule_tags_json,
-                            customer.get('unionid', ''),
-                            current_time,
-                            external_userid
-                        ))
-                    else:
-                        cursor.execute("""
-                            INSERT INTO customers (
-                                id, name, avatar, gender, type,
-                                corp_name, position,
-                                owner_userid, owner_name,
-                                add_time, tags, remark,
-                                description, add_way, im_status, state,
-                                remark_mobiles, remark_corp_name,
-                                enterprise_tags, personal_tags, rule_tags,
-                                unionid,
-                                created_at, updated_at
-                            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                        """, (
-                            external_userid,
-                            customer.get('name', ''),
-                            customer.get('avatar', ''),
-                            customer.get('gender', 0),
-                            customer.get('type', 1),
-                            customer.get('corp_name', ''),
-                            customer.get('position', ''),
-                            customer.get('owner_userid', ''),
-                            customer.get('owner_name', ''),
-                            customer.get('add_time', 0),
-                            tags_json,
-                            customer.get('remark', ''),
-                            customer.get('description', ''),
-                            customer.get('add_way', 0),
-                            customer.get('im_status', 0),
-                            customer.get('state', ''),
-                            json.dumps(customer.get('remark_mobiles', []), ensure_ascii=False),
-                            customer.get('remark_corp_name', ''),
-                            enterprise_tags_json,
-                            personal_tags_json,
-                            rule_tags_json,
-                            customer.get('unionid', ''),
-                            current_time,
-                            current_time
-                        ))
-                    
-                    saved_count += 1
-                
+                # 客户行 UPSERT 与标签关联表、统计汇总表一起在一个事务内提交
+                valid_customers = [customer for customer in customers if customer.get('external_userid')]
+                results = write_customers(cursor, valid_customers)
                 conn.commit()
                 conn.close()
-                print(f"[定时任务] ✅ 客户同步成功，共 {saved_count} 个客户")
+                changed_count = sum(1 for result_type, _ in results if result_type != 'unchanged')
+                # 内容全部未变化时不失效缓存与索引
+                if changed_count:
+                    bump_generation()
+                    tag_bitmap.tag_index.invalidate()
+                    try:
+                        customer_snapshot.snapshot.refresh()
+                    except Exception as e:
+                        print(f"[警告] 客户列式快照刷新失败: {e}")
+                print(f"[定时任务] ✅ 客户同步成功，共 {len(results)} 个客户，其中 {len(results) - changed_count} 个无变化")
             else:
                 print("[定时任务] ⚠️ 未获取到客户数据")
         except Exception as e:
@@ -2562,7 +2841,9 @@ def start_scheduled_sync():
 # ========== 客户群管理 API ==========
 
 @app.get("/api/customer-groups")
-async def get_customer_groups(
+@offload
+@cached("customer_groups")
+def get_customer_groups(
     request: Request,
     token: str = Depends(check_token),
     page: int = Query(1, gt=0),
@@ -2572,17 +2853,20 @@ async def get_customer_groups(
     group_type: Optional[str] = None,
     date_start: Optional[str] = None,
     date_end: Optional[str] = None,
-    tag_id: Optional[str] = None
+    tag_id: Optional[str] = None,
+    cursor: Optional[str] = Query(None, description="游标分页：上一页返回的 next_cursor"),
+    with_total: bool = Query(True, description="是否统计总数（无限滚动可传 false 跳过 COUNT）")
 ):
     """
     获取客户群列表
     支持数据隔离：超级管理员看全部，普通员工只看自己的
+    支持 cursor 游标分页（按 create_time, chat_id 定位）
     """
     # 获取当前用户
     current_user = getattr(request.state, 'user', None)
     
     conn = get_db()
-    cursor = conn.cursor()
+    db_cursor = conn.cursor()
     
     # 构建查询条件
     where_clauses = []
@@ -2603,7 +2887,8 @@ async def get_customer_groups(
                 "data": [],
                 "total": 0,
                 "page": page,
-                "limit": limit
+                "limit": limit,
+                "next_cursor": None
             }
     
     if search:
@@ -2637,31 +2922,43 @@ async def get_customer_groups(
     
     where_sql = " AND ".join(where_clauses) if where_clauses else "1=1"
     
-    # 查询总数
-    count_sql = f"SELECT COUNT(*) FROM customer_groups WHERE {where_sql}"
-    total = cursor.execute(count_sql, params).fetchone()[0]
+    # 查询总数（with_total=false 时跳过）
+    total = None
+    if with_total:
+        count_sql = f"SELECT COUNT(*) FROM customer_groups WHERE {where_sql}"
+        total = db_cursor.execute(count_sql, params).fetchone()[0]
     
-    # 查询数据 - 显式指定字段名，避免字段顺序问题
-    offset = (page - 1) * limit
-    query_sql = f"""
+    # 查询数据 - 显式指定字段名，避免字段顺序问题；多取一条用于判断是否还有下一页
+    select_sql = """
         SELECT 
             chat_id, name, owner_userid, owner_name, notice, member_count,
             external_member_count, internal_member_count, admin_list, group_type,
             status, version, create_time, last_sync_time
         FROM customer_groups
+    """
+    if cursor:
+        last_create_time, last_chat_id = decode_cursor(cursor)
+        rows = keyset_rows(db_cursor, select_sql, where_sql, params,
+                           'create_time', 'chat_id', last_create_time, last_chat_id, limit + 1)
+    else:
+        offset = (page - 1) * limit
+        query_sql = select_sql + f"""
         WHERE {where_sql}
-        ORDER BY create_time DESC
+        ORDER BY create_time DESC, chat_id DESC
         LIMIT ? OFFSET ?
     """
-    
-    rows = cursor.execute(query_sql, params + [limit, offset]).fetchall()
+        query_params = params + [limit + 1, offset]
+        rows = db_cursor.execute(query_sql, query_params).fetchall()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    next_cursor = encode_cursor(rows[-1][12], rows[-1][0]) if has_more else None
     
     groups = []
     for row in rows:
         chat_id = row[0]
         
         # 查询该群的标签（直接从关联表读取 tag_name）
-        cursor.execute('''
+        db_cursor.execute('''
             SELECT r.tag_id, r.tag_name
             FROM group_chat_tag_relations r
             WHERE r.chat_id = ?
@@ -2669,7 +2966,7 @@ async def get_customer_groups(
         ''', (chat_id,))
         
         tags = []
-        for tag_row in cursor.fetchall():
+        for tag_row in db_cursor.fetchall():
             tags.append({
                 'tag_id': tag_row[0],
                 'tag_name': tag_row[1]
@@ -2700,11 +2997,13 @@ async def get_customer_groups(
         "data": groups,
         "total": total,
         "page": page,
-        "limit": limit
+        "limit": limit,
+        "next_cursor": next_cursor
     }
 
 @app.post("/api/sync/customer-groups")
-async def sync_customer_groups(request: SyncRequest, token: str = Depends(check_token)):
+@offload
+def sync_customer_groups(request: SyncRequest, token: str = Depends(check_token)):
     """同步客户群数据（异步任务）"""
     print("[开始同步客户群]")
     
@@ -2728,7 +3027,8 @@ async def sync_customer_groups(request: SyncRequest, token: str = Depends(check_
     }
 
 @app.get("/api/sync/customer-groups/status/{task_id}")
-async def get_group_sync_status(task_id: str, token: str = Depends(check_token)):
+@offload
+def get_group_sync_status(task_id: str, token: str = Depends(check_token)):
     """获取客户群同步任务状态"""
     status = sync_service.get_task_status(task_id)
     if status:
@@ -2737,7 +3037,8 @@ async def get_group_sync_status(task_id: str, token: str = Depends(check_token))
         return {"success": False, "message": "任务不存在"}
 
 @app.post("/api/sync/customer-groups/cancel/{task_id}")
-async def cancel_group_sync(task_id: str, token: str = Depends(check_token)):
+@offload
+def cancel_group_sync(task_id: str, token: str = Depends(check_token)):
     """取消客户群同步任务"""
     success = sync_service.cancel_task(task_id)
     if success:
@@ -2747,131 +3048,200 @@ async def cancel_group_sync(task_id: str, token: str = Depends(check_token)):
 
 # ========== 客户画像 API ==========
 
+# 企业微信添加方式映射
+ADD_WAY_NAMES = {
+    0: "未知来源",
+    1: "扫描二维码",
+    2: "搜索手机号",
+    3: "名片分享",
+    4: "群聊",
+    5: "手机通讯录",
+    6: "微信联系人",
+    7: "添加好友申请",
+    8: "第三方应用",
+    9: "搜索邮箱",
+    16: "其他",
+    22: "其他",
+    24: "其他",
+    201: "内部成员共享",
+    202: "管理员分配"
+}
+
+GENDER_NAMES = {0: "未知", 1: "男", 2: "女"}
+
+def _portrait_scope(current_user) -> Optional[str]:
+    """
+    画像统计的数据范围（tag_stats.scope_owner）
+    超级管理员或旧API Token 看全部，普通员工只看自己的客户，未绑定企微返回 None
+    """
+    if current_user and not current_user.get('is_super_admin'):
+        return current_user.get('wecom_user_id') or None
+    return customer_index.SCOPE_ALL
+
+
+def _key_tag_counts(cursor, scope_owner: Optional[str]) -> Dict[str, int]:
+    """
+    按重点标签（固定的6个卡片）汇总标签客户数
+    分类在标签保存时已写入 tag_classes，这里只做分组求和
+    """
+    key_tags = {name: 0 for name in tag_classifier.classifier.key_categories}
+    if scope_owner is None:
+        return key_tags
+    cursor.execute("""
+        SELECT tc.key_category, SUM(ts.customer_count)
+        FROM tag_stats ts
+        JOIN tag_classes tc ON tc.tag_name = ts.tag_name
+        WHERE ts.scope_owner = ? AND tc.key_category != ''
+        GROUP BY tc.key_category
+    """, (scope_owner,))
+    for category, count in cursor.fetchall():
+        if category in key_tags:
+            key_tags[category] = count
+    return key_tags
+
+
+def _province_counts(cursor, scope_owner: Optional[str]) -> Dict[str, int]:
+    """省份标签的客户数，按人数排序，最多前30个"""
+    if scope_owner is None:
+        return {}
+    cursor.execute("""
+        SELECT ts.tag_name, ts.customer_count
+        FROM tag_stats ts
+        JOIN tag_classes tc ON tc.tag_name = ts.tag_name
+        WHERE ts.scope_owner = ? AND tc.province != '' AND ts.customer_count > 0
+        ORDER BY ts.customer_count DESC
+        LIMIT 30
+    """, (scope_owner,))
+    return {tag_name: count for tag_name, count in cursor.fetchall()}
+
+
+def _share_items(counts: Dict[str, int], key: str) -> Dict:
+    """{名称: 数量} -> 带百分比的饼图数据"""
+    total = sum(counts.values())
+    items = [
+        {key: name, "count": count, "percentage": round(count / total * 100, 1) if total > 0 else 0}
+        for name, count in counts.items()
+    ]
+    return {"items": items, "total": total}
+
+
+def _add_way_gender_stats() -> tuple:
+    """添加方式与性别分布（列式快照上向量化计数）"""
+    add_way_counts = customer_snapshot.snapshot.add_way_counts()
+    gender_counts = customer_snapshot.snapshot.gender_counts()
+    
+    ways = {}
+    for add_way, count in add_way_counts.items():
+        name = ADD_WAY_NAMES.get(add_way, f"未知({add_way})")
+        ways[name] = ways.get(name, 0) + count
+    ways = dict(sorted(ways.items(), key=lambda x: x[1], reverse=True))
+    genders = {}
+    for gender, count in sorted(gender_counts.items()):
+        name = GENDER_NAMES.get(gender, "未知")
+        genders[name] = genders.get(name, 0) + count
+    return _share_items(ways, "way"), _share_items(genders, "gender")
+
+
+def _time_stats(cursor) -> Dict[str, int]:
+    """今天/昨天/本周/上周/本月/上月的新增客户数"""
+    from datetime import timedelta
+    
+    now = datetime.now()
+    
+    # 今天的时间范围（0点到当前时间）
+    today_start = datetime(now.year, now.month, now.day)
+    
+    # 昨天的时间范围（昨天0点到23:59:59）
+    yesterday_start = today_start - timedelta(days=1)
+    
+    # 本周的时间范围（本周一0点到当前时间）
+    weekday = now.weekday()  # 0=周一, 6=周日
+    week_start = today_start - timedelta(days=weekday)
+    
+    # 上周的时间范围（上周一0点到上周日23:59:59）
+    last_week_start = week_start - timedelta(days=7)
+    last_week_end = week_start
+    
+    # 本月的时间范围（本月1号0点到当前时间）
+    month_start = datetime(now.year, now.month, 1)
+    
+    # 上月的时间范围（上月1号到上月最后一天）
+    if now.month == 1:
+        last_month_start = datetime(now.year - 1, 12, 1)
+        last_month_end = datetime(now.year, 1, 1)
+    else:
+        last_month_start = datetime(now.year, now.month - 1, 1)
+        last_month_end = month_start
+    
+    # 各时间段边界都是整天，一次范围聚合 customer_daily_adds 得到全部统计
+    def day(dt):
+        return dt.strftime('%Y-%m-%d')
+    
+    cursor.execute("""
+        SELECT
+            COALESCE(SUM(CASE WHEN day >= ? THEN count END), 0),
+            COALESCE(SUM(CASE WHEN day >= ? AND day < ? THEN count END), 0),
+            COALESCE(SUM(CASE WHEN day >= ? THEN count END), 0),
+            COALESCE(SUM(CASE WHEN day >= ? AND day < ? THEN count END), 0),
+            COALESCE(SUM(CASE WHEN day >= ? THEN count END), 0),
+            COALESCE(SUM(CASE WHEN day >= ? AND day < ? THEN count END), 0)
+        FROM customer_daily_adds
+        WHERE tag_category = ? AND day >= ?
+    """, (
+        day(today_start),
+        day(yesterday_start), day(today_start),
+        day(week_start),
+        day(last_week_start), day(last_week_end),
+        day(month_start),
+        day(last_month_start), day(last_month_end),
+        customer_index.TAG_CATEGORY_ALL, day(min(last_week_start, last_month_start))
+    ))
+    row = cursor.fetchone()
+    
+    return {
+        "today": row[0],
+        "yesterday": row[1],
+        "this_week": row[2],
+        "last_week": row[3],
+        "this_month": row[4],
+        "last_month": row[5]
+    }
+
+
 @app.get("/api/customer-portrait/tag-stats")
-async def get_tag_stats(request: Request, token: str = Depends(check_token)):
+@offload
+@cached("tag_stats", stale_while_revalidate=True)
+def get_tag_stats(request: Request, token: str = Depends(check_token)):
     """
-    获取标签统计数据 - 修复版
+    获取标签统计数据
+    读取 tag_stats 汇总表（同步时按差量维护），耗时只与标签数量有关
+    标签下的客户列表按需通过 /api/customer-portrait/tag-customers 分页获取
     支持数据隔离：超级管理员看全部，普通员工只看自己的客户
     """
-    # 获取当前用户
-    current_user = getattr(request.state, 'user', None)
+    scope_owner = _portrait_scope(getattr(request.state, 'user', None))
+    if scope_owner is None:
+        # 没有绑定企微，返回空统计
+        return {
+            "success": True,
+            "data": {
+                "key_tags": _key_tag_counts(None, None),
+                "all_tag_stats": {}
+            }
+        }
     
-    import json
-    from collections import defaultdict
     try:
-        conn = sqlite3.connect(DB_PATH)
+        conn = get_connection()
         cursor = conn.cursor()
-        
-        # 构建查询SQL（根据权限过滤）
-        # 如果 current_user 为 None（使用旧API Token），跳过数据隔离（向后兼容）
-        if current_user and not current_user.get('is_super_admin'):
-            if current_user.get('wecom_user_id'):
-                # 普通员工只查询自己的客户
-                cursor.execute("""
-                    SELECT id, name, enterprise_tags 
-                    FROM customers 
-                    WHERE owner_userid = ?
-                    AND enterprise_tags IS NOT NULL AND enterprise_tags != '' AND enterprise_tags != '[]'
-                """, (current_user['wecom_user_id'],))
-            else:
-                # 没有绑定企微，返回空统计
-                conn.close()
-                return {
-                    "success": True,
-                    "data": {
-                        "key_tags": {
-                            "用户标签": 0,
-                            "代理商": 0,
-                            "合伙人": 0,
-                            "供应商": 0,
-                            "同行": 0,
-                            "原有老代理": 0
-                        },
-                        "all_tag_stats": {},
-                        "tag_customers": {}
-                    }
-                }
-        else:
-            # 超级管理员或旧API Token，查询所有客户
-            cursor.execute("""
-                SELECT id, name, enterprise_tags 
-                FROM customers 
-                WHERE enterprise_tags IS NOT NULL AND enterprise_tags != '' AND enterprise_tags != '[]'
-            """)
-        
-        # 标签名称 -> 客户列表
-        tag_customers = defaultdict(list)
-        
-        # 统计每个标签的客户数（一个客户有多个相同标签名，只算一次）
-        for customer_id, customer_name, tags_str in cursor.fetchall():
-            try:
-                tags = json.loads(tags_str)
-                if not isinstance(tags, list):
-                    continue
-                
-                # 当前客户的所有标签名（去重）
-                customer_tag_names = set()
-                for tag in tags:
-                    if isinstance(tag, dict):
-                        tag_name = tag.get('tag_name', '').strip()
-                        if tag_name:
-                            customer_tag_names.add(tag_name)
-                
-                # 将客户添加到每个标签的列表中
-                for tag_name in customer_tag_names:
-                    tag_customers[tag_name].append({
-                        'id': customer_id,
-                        'name': customer_name or customer_id
-                    })
-                    
-            except Exception as e:
-                print(f"解析客户 {customer_id} 标签失败: {e}")
-                continue
-        
-        # 计算每个标签的客户数量
-        tag_stats = {}
-        for tag_name, customers in tag_customers.items():
-            tag_stats[tag_name] = len(customers)
-        
-        # 构建重点标签数据（固定的6个卡片）
-        key_tags = {
-            "用户标签": 0,
-            "代理商": 0,
-            "合伙人": 0,
-            "供应商": 0,
-            "同行": 0,
-            "原有老代理": 0
-        }
-        
-        # 匹配规则（严格匹配，优先匹配更具体的标签）
-        for tag_name, count in tag_stats.items():
-            # 用户标签
-            if tag_name in ['用户', '客户', '用户标签']:
-                key_tags["用户标签"] += count
-            # 原有老代理商（优先匹配，避免和"代理商"冲突）
-            elif '原有老代理商' in tag_name or '原有老代理' in tag_name or '老代理商' in tag_name:
-                key_tags["原有老代理"] += count
-            # 代理商（排除原有老代理商）
-            elif tag_name in ['代理商', '代理'] and '原有' not in tag_name and '老' not in tag_name:
-                key_tags["代理商"] += count
-            # 合伙人
-            elif '合伙人' in tag_name:
-                key_tags["合伙人"] += count
-            # 供应商
-            elif '供应商' in tag_name:
-                key_tags["供应商"] += count
-            # 同行
-            elif '同行' in tag_name or tag_name == '同行':
-                key_tags["同行"] += count
-        
+        # 每个标签的客户数（一个客户有多个相同标签名，只算一次）
+        tag_stats = customer_index.tag_stats(cursor, scope_owner)
+        key_tags = _key_tag_counts(cursor, scope_owner)
         conn.close()
         
         return {
             "success": True,
             "data": {
                 "key_tags": key_tags,
-                "all_tag_stats": tag_stats,
-                "tag_customers": {k: v for k, v in tag_customers.items()}
+                "all_tag_stats": tag_stats
             }
         }
         
@@ -2879,351 +3249,314 @@ async def get_tag_stats(request: Request, token: str = Depends(check_token)):
         print(f"获取标签统计失败: {e}")
         return {"success": False, "message": str(e)}
 
-@app.get("/api/customer-portrait/province-stats")
-async def get_province_stats(request: Request, token: str = Depends(check_token)):
+@app.get("/api/customer-portrait/tag-customers")
+@offload
+@cached("tag_customers", stale_while_revalidate=True)
+def get_tag_customers(
+    request: Request,
+    tag_name: str,
+    page: int = 1,
+    limit: int = 50,
+    token: str = Depends(check_token)
+):
     """
-    获取省份统计数据（只显示有人的省份）
+    分页获取某个企业标签下的客户（走 idx_tag_links_tag_name）
     支持数据隔离：超级管理员看全部，普通员工只看自己的客户
     """
-    # 获取当前用户
     current_user = getattr(request.state, 'user', None)
+    page = max(page, 1)
+    limit = min(max(limit, 1), 200)
+    
+    where = ["l.tag_type = ?", "l.tag_name = ?"]
+    params = [customer_index.TAG_TYPE_ENTERPRISE, tag_name.strip()]
+    if current_user and not current_user.get('is_super_admin'):
+        if not current_user.get('wecom_user_id'):
+            return {"success": True, "data": [], "total": 0, "page": page, "limit": limit}
+        where.append("c.owner_userid = ?")
+        params.append(current_user['wecom_user_id'])
+    where_sql = " AND ".join(where)
     
-    import json
     try:
-        conn = sqlite3.connect(DB_PATH)
+        conn = get_connection()
         cursor = conn.cursor()
+        cursor.execute(f"""
+            SELECT COUNT(DISTINCT l.customer_id)
+            FROM customer_tag_links l
+            JOIN customers c ON c.id = l.customer_id
+            WHERE {where_sql}
+        """, params)
+        total = cursor.fetchone()[0]
+        cursor.execute(f"""
+            SELECT DISTINCT l.customer_id, c.name
+            FROM customer_tag_links l
+            JOIN customers c ON c.id = l.customer_id
+            WHERE {where_sql}
+            ORDER BY l.customer_id
+            LIMIT ? OFFSET ?
+        """, params + [limit, (page - 1) * limit])
+        customers = [
+            {'id': customer_id, 'name': name or customer_id}
+            for customer_id, name in cursor.fetchall()
+        ]
+        conn.close()
         
-        # 构建查询SQL（根据权限过滤）
-        # 如果 current_user 为 None（使用旧API Token），跳过数据隔离（向后兼容）
-        if current_user and not current_user.get('is_super_admin'):
-            if current_user.get('wecom_user_id'):
-                # 普通员工只查询自己的客户
-                cursor.execute("""
-                    SELECT enterprise_tags 
-                    FROM customers 
-                    WHERE owner_userid = ?
-                    AND enterprise_tags IS NOT NULL AND enterprise_tags != '' AND enterprise_tags != '[]'
-                """, (current_user['wecom_user_id'],))
-            else:
-                # 没有绑定企微，返回空统计
-                conn.close()
-                return {
-                    "success": True,
-                    "data": {
-                        "province_counts": {},
-                        "province_list": []
-                    }
-                }
-        else:
-            # 超级管理员或旧API Token，查询所有客户
-            cursor.execute("""
-                SELECT enterprise_tags 
-                FROM customers 
-                WHERE enterprise_tags IS NOT NULL AND enterprise_tags != '' AND enterprise_tags != '[]'
-            """)
-        
-        province_counts = {}
-        
-        for row in cursor.fetchall():
-            try:
-                tags = json.loads(row[0])
-                if isinstance(tags, list):
-                    for tag in tags:
-                        if isinstance(tag, dict):
-                            group_name = tag.get('group_name', '')
-                            tag_name = tag.get('tag_name', '')
-                            
-                            # 识别省份标签（假设省份在 group_name 或 tag_name 中）
-                            # 可以根据实际情况调整匹配逻辑
-                            if '省' in tag_name or '市' in tag_name or any(p in tag_name for p in [
-                                '北京', '上海', '天津', '重庆', '河北', '山西', '辽宁', '吉林', '黑龙江',
-                                '江苏', '浙江', '安徽', '福建', '江西', '山东', '河南', '湖北', '湖南',
-                                '广东', '海南', '四川', '贵州', '云南', '陕西', '甘肃', '青海', '台湾',
-                                '内蒙古', '广西', '西藏', '宁夏', '新疆', '香港', '澳门'
-                            ]):
-                                province_counts[tag_name] = province_counts.get(tag_name, 0) + 1
-            except:
-                continue
-        
-        # 只返回有人的省份，按人数排序
-        sorted_provinces = sorted(province_counts.items(), key=lambda x: x[1], reverse=True)
-        
+        return {"success": True, "data": customers, "total": total, "page": page, "limit": limit}
+    except Exception as e:
+        print(f"获取标签客户失败: {e}")
+        return {"success": False, "message": str(e)}
+
+@app.get("/api/customer-portrait/province-stats")
+@offload
+@cached("province_stats", stale_while_revalidate=True)
+def get_province_stats(request: Request, token: str = Depends(check_token)):
+    """
+    获取省份统计数据（只显示有人的省份，取自 tag_stats 汇总表）
+    支持数据隔离：超级管理员看全部，普通员工只看自己的客户
+    """
+    scope_owner = _portrait_scope(getattr(request.state, 'user', None))
+    if scope_owner is None:
+        # 没有绑定企微，返回空统计
+        return {
+            "success": True,
+            "data": {
+                "province_counts": {},
+                "province_list": []
+            }
+        }
+    
+    try:
+        conn = get_connection()
+        cursor = conn.cursor()
+        province_counts = _province_counts(cursor, scope_owner)
         conn.close()
         
         return {
             "success": True,
-            "data": dict(sorted_provinces[:30])  # 最多显示前30个省份
+            "data": province_counts
         }
         
     except Exception as e:
         return {"success": False, "message": str(e)}
 
 @app.get("/api/customer-portrait/add-way-stats")
-async def get_add_way_stats(token: str = Depends(check_token)):
+@offload
+@cached("add_way_stats", stale_while_revalidate=True)
+def get_add_way_stats(token: str = Depends(check_token)):
     """获取添加方式统计数据"""
     try:
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        
-        cursor.execute("""
-            SELECT add_way, COUNT(*) as count
-            FROM customers
-            WHERE add_way IS NOT NULL
-            GROUP BY add_way
-            ORDER BY count DESC
-        """)
-        
-        # 企业微信添加方式映射
-        add_way_map = {
-            0: "未知来源",
-            1: "扫描二维码",
-            2: "搜索手机号",
-            3: "名片分享",
-            4: "群聊",
-            5: "手机通讯录",
-            6: "微信联系人",
-            7: "添加好友申请",
-            8: "第三方应用",
-            9: "搜索邮箱",
-            16: "其他",
-            22: "其他",
-            24: "其他",
-            201: "内部成员共享",
-            202: "管理员分配"
-        }
-        
-        results = []
-        total = 0
-        
-        for row in cursor.fetchall():
-            add_way = row[0]
-            count = row[1]
-            total += count
-            
-            results.append({
-                "way": add_way_map.get(add_way, f"未知({add_way})"),
-                "count": count
-            })
-        
-        # 计算百分比
-        for item in results:
-            item["percentage"] = round(item["count"] / total * 100, 1) if total > 0 else 0
-        
-        conn.close()
+        add_way_stats, _ = _add_way_gender_stats()
         
         return {
             "success": True,
-            "data": {
-                "items": results,
-                "total": total
-            }
+            "data": add_way_stats
         }
         
     except Exception as e:
         return {"success": False, "message": str(e)}
 
 @app.get("/api/customer-portrait/gender-stats")
-async def get_gender_stats(token: str = Depends(check_token)):
+@offload
+@cached("gender_stats", stale_while_revalidate=True)
+def get_gender_stats(token: str = Depends(check_token)):
     """获取性别统计数据"""
     try:
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        
-        cursor.execute("""
-            SELECT gender, COUNT(*) as count
-            FROM customers
-            WHERE gender IS NOT NULL
-            GROUP BY gender
-            ORDER BY gender
-        """)
-        
-        gender_map = {0: "未知", 1: "男", 2: "女"}
-        
-        results = []
-        total = 0
-        
-        for row in cursor.fetchall():
-            gender = row[0]
-            count = row[1]
-            total += count
-            
-            results.append({
-                "gender": gender_map.get(gender, "未知"),
-                "count": count
-            })
-        
-        # 计算百分比
-        for item in results:
-            item["percentage"] = round(item["count"] / total * 100, 1) if total > 0 else 0
-        
-        conn.close()
+        _, gender_stats = _add_way_gender_stats()
         
         return {
             "success": True,
-            "data": {
-                "items": results,
-                "total": total
-            }
+            "data": gender_stats
         }
         
     except Exception as e:
         return {"success": False, "message": str(e)}
 
 @app.get("/api/customer-portrait/time-stats")
-async def get_time_stats(token: str = Depends(check_token)):
+@offload
+@cached("time_stats", stale_while_revalidate=True)
+def get_time_stats(token: str = Depends(check_token)):
     """获取时间维度的客户新增统计"""
-    from datetime import datetime, timedelta
-    
     try:
-        conn = sqlite3.connect(DB_PATH)
+        conn = get_connection()
         cursor = conn.cursor()
+        stats = _time_stats(cursor)
+        conn.close()
         
-        now = datetime.now()
-        
-        # 今天的时间范围（0点到当前时间）
-        today_start = datetime(now.year, now.month, now.day)
-        
-        # 昨天的时间范围（昨天0点到23:59:59）
-        yesterday_start = today_start - timedelta(days=1)
-        
-        # 本周的时间范围（本周一0点到当前时间）
-        weekday = now.weekday()  # 0=周一, 6=周日
-        week_start = today_start - timedelta(days=weekday)
-        
-        # 上周的时间范围（上周一0点到上周日23:59:59）
-        last_week_start = week_start - timedelta(days=7)
-        last_week_end = week_start
-        
-        # 本月的时间范围（本月1号0点到当前时间）
-        month_start = datetime(now.year, now.month, 1)
-        
-        # 上月的时间范围（上月1号到上月最后一天）
-        if now.month == 1:
-            last_month_start = datetime(now.year - 1, 12, 1)
-            last_month_end = datetime(now.year, 1, 1)
-        else:
-            last_month_start = datetime(now.year, now.month - 1, 1)
-            last_month_end = month_start
-        
-        # 查询各时间段的数据
-        def count_customers(start_time, end_time=None):
-            start_ts = int(start_time.timestamp())
-            if end_time:
-                end_ts = int(end_time.timestamp())
-                cursor.execute("""
-                    SELECT COUNT(*) FROM customers
-                    WHERE add_time >= ? AND add_time < ?
-                """, (start_ts, end_ts))
-            else:
-                # 如果没有结束时间，查询从开始时间到现在
-                cursor.execute("""
-                    SELECT COUNT(*) FROM customers
-                    WHERE add_time >= ?
-                """, (start_ts,))
-            return cursor.fetchone()[0]
-        
-        stats = {
-            "today": count_customers(today_start),
-            "yesterday": count_customers(yesterday_start, today_start),
-            "this_week": count_customers(week_start),
-            "last_week": count_customers(last_week_start, last_week_end),
-            "this_month": count_customers(month_start),
-            "last_month": count_customers(last_month_start, last_month_end)
+        return {
+            "success": True,
+            "data": stats
         }
         
+    except Exception as e:
+        return {"success": False, "message": str(e)}
+
+@app.get("/api/customer-portrait/dashboard")
+@offload
+@cached("portrait_dashboard", stale_while_revalidate=True)
+def get_portrait_dashboard(request: Request, token: str = Depends(check_token)):
+    """
+    客户画像首页汇总：标签、省份、添加方式、性别、时间统计一次返回
+    添加方式与性别在列式快照上计数，标签与时间统计读取汇总表；
+    各部分的数据隔离规则与对应的单项接口一致
+    """
+    scope_owner = _portrait_scope(getattr(request.state, 'user', None))
+    
+    try:
+        conn = get_connection()
+        cursor = conn.cursor()
+        tag_stats = customer_index.tag_stats(cursor, scope_owner) if scope_owner is not None else {}
+        key_tags = _key_tag_counts(cursor, scope_owner)
+        province_counts = _province_counts(cursor, scope_owner)
+        add_way_stats, gender_stats = _add_way_gender_stats()
+        time_stats = _time_stats(cursor)
         conn.close()
         
         return {
             "success": True,
-            "data": stats
+            "data": {
+                "tag_stats": {
+                    "key_tags": key_tags,
+                    "all_tag_stats": tag_stats
+                },
+                "province_stats": province_counts,
+                "add_way_stats": add_way_stats,
+                "gender_stats": gender_stats,
+                "time_stats": time_stats
+            }
         }
         
     except Exception as e:
+        print(f"获取画像汇总失败: {e}")
         return {"success": False, "message": str(e)}
 
+def _portrait_customers(cursor, customer_ids: List[str], tag_limit: Optional[int] = None,
+                        owner_name_default: str = "-") -> List[Dict]:
+    """按给定顺序读取画像客户列表的当前页"""
+    if not customer_ids:
+        return []
+    placeholders = ','.join(['?'] * len(customer_ids))
+    cursor.execute(f"""
+        SELECT id, name, enterprise_tags, avatar, gender, add_time, owner_userid, owner_name, remark
+        FROM customers
+        WHERE id IN ({placeholders})
+    """, customer_ids)
+    rows = {row[0]: row for row in cursor.fetchall()}
+    
+    customers = []
+    for customer_id in customer_ids:
+        row = rows.get(customer_id)
+        if not row:
+            continue
+        try:
+            tags = fast_json.loads(row[2]) if row[2] else []
+        except ValueError:
+            tags = []
+        customer_tags = [t.get('tag_name', '') for t in tags if isinstance(t, dict)] if isinstance(tags, list) else []
+        customers.append({
+            "id": row[0],
+            "name": row[1],
+            "avatar": row[3] or "",
+            "gender": row[4] or 0,
+            "add_time": row[5] or 0,
+            "owner_userid": row[6] or "",
+            "owner_name": row[7] or owner_name_default,
+            "remark": row[8] or "",
+            "tags": customer_tags[:tag_limit] if tag_limit else customer_tags
+        })
+    return customers
+
+def _tag_customers_page(cursor, tag_names: List[str], offset: int, limit: int,
+                        group_names: List[str] = ()) -> Tuple[int, List[str]]:
+    """
+    拥有任一标签（或任一标签组下标签）的客户：(总数, 第 offset 个起的 limit 个客户ID)，按 rowid 顺序
+    位图索引可用时走位运算；尚未构建（启动中、批量同步后失效）时条件下推到 SQL，同时后台构建索引
+    """
+    index = tag_bitmap.tag_index
+    if index.built:
+        matched = index.customers_with_any(tag_names, group_names)
+        return matched.count(), index.customer_ids(matched, offset, limit)
+    
+    index.build_in_background()
+    if not tag_names and not group_names:
+        return 0, []
+    conditions = []
+    params = [customer_index.TAG_TYPE_ENTERPRISE]
+    if tag_names:
+        conditions.append(f"tag_name IN ({','.join(['?'] * len(tag_names))})")
+        params += list(tag_names)
+    if group_names:
+        conditions.append(f"(tag_name != '' AND group_name IN ({','.join(['?'] * len(group_names))}))")
+        params += list(group_names)
+    links_sql = f"""
+        SELECT customer_id FROM customer_tag_links
+        WHERE tag_type = ? AND ({' OR '.join(conditions)})
+    """
+    cursor.execute(f"SELECT COUNT(DISTINCT customer_id) FROM ({links_sql})", params)
+    total = cursor.fetchone()[0]
+    cursor.execute(f"""
+        SELECT id FROM customers
+        WHERE id IN ({links_sql})
+        ORDER BY rowid
+        LIMIT ? OFFSET ?
+    """, params + [limit, offset])
+    return total, [row[0] for row in cursor.fetchall()]
+
+
+def _province_tag_names(cursor, keyword: str) -> List[str]:
+    """名称包含关键词的企业标签"""
+    if tag_bitmap.tag_index.built:
+        return tag_bitmap.tag_index.matching_tags([keyword])
+    cursor.execute("""
+        SELECT tag_name FROM tag_stats
+        WHERE scope_owner = ? AND instr(tag_name, ?) > 0
+    """, (customer_index.SCOPE_ALL, keyword))
+    return [row[0] for row in cursor.fetchall()]
+
+
+def _column_customers_page(cursor, column: str, values: List[int], offset: int,
+                           limit: int) -> Tuple[int, List[str]]:
+    """
+    add_way/gender 取值属于 values 的客户：(总数, 当前页客户ID)，按 rowid 顺序
+    列式快照未构建时走 idx_customers_add_way / idx_customers_gender，同时后台构建快照
+    """
+    snapshot = customer_snapshot.snapshot
+    if snapshot.built:
+        return snapshot.filter_page(column, values, offset, limit)
+    
+    snapshot.build_in_background()
+    if not values:
+        return 0, []
+    placeholders = ','.join(['?'] * len(values))
+    cursor.execute(f"SELECT COUNT(*) FROM customers WHERE {column} IN ({placeholders})", values)
+    total = cursor.fetchone()[0]
+    cursor.execute(f"""
+        SELECT id FROM customers
+        WHERE {column} IN ({placeholders})
+        ORDER BY rowid
+        LIMIT ? OFFSET ?
+    """, values + [limit, offset])
+    return total, [row[0] for row in cursor.fetchall()]
+
 @app.get("/api/customer-portrait/customers-by-tag")
-async def get_customers_by_tag(
+@offload
+@cached("customers_by_tag", stale_while_revalidate=True)
+def get_customers_by_tag(
     tag_type: str = Query(..., description="标签类型：user/agent/partner/supplier/peer/old-agent"),
     page: int = Query(1, ge=1),
     limit: int = Query(20, ge=1, le=100),
     token: str = Depends(check_token)
 ):
-    """根据标签类型获取客户列表"""
-    import json
+    """根据标签类型获取客户列表（命中标签的客户并集，只读取当前页）"""
     try:
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        
-        # 标签关键词映射
-        tag_keywords = {
-            "user": ["用户", "客户"],
-            "agent": ["代理商", "代理"],
-            "partner": ["合伙人"],
-            "supplier": ["供应商"],
-            "peer": ["同行", "上游同行"],
-            "old-agent": ["原有老代理", "历史-代理"]
-        }
-        
-        keywords = tag_keywords.get(tag_type, [])
-        if not keywords:
+        if tag_type not in tag_classifier.classifier.growth_categories:
             return {"success": False, "message": "无效的标签类型"}
         
-        # 查询符合条件的客户
-        cursor.execute("""
-            SELECT id, name, enterprise_tags, avatar, gender, add_time, owner_userid, owner_name, remark
-            FROM customers
-            WHERE enterprise_tags IS NOT NULL AND enterprise_tags != '' AND enterprise_tags != '[]'
-        """)
-        
-        matched_customers = []
-        
-        for row in cursor.fetchall():
-            try:
-                tags = json.loads(row[2]) if row[2] else []
-                if isinstance(tags, list):
-                    # 检查是否有匹配的标签
-                    has_match = False
-                    customer_tags = []
-                    
-                    for tag in tags:
-                        if isinstance(tag, dict):
-                            tag_name = tag.get('tag_name', '')
-                            group_name = tag.get('group_name', '')
-                            
-                            # 收集所有标签
-                            if tag_name:
-                                customer_tags.append(tag_name)
-                            
-                            # 检查是否匹配
-                            for keyword in keywords:
-                                if keyword in tag_name or keyword in group_name:
-                                    has_match = True
-                                    break
-                            
-                            if has_match:
-                                break
-                    
-                    if has_match:
-                        matched_customers.append({
-                            "id": row[0],
-                            "name": row[1],
-                            "tags": customer_tags,
-                            "avatar": row[3] or "",
-                            "gender": row[4] or 0,
-                            "add_time": row[5] or 0,
-                            "owner_userid": row[6] or "",
-                            "owner_name": row[7] or "",
-                            "remark": row[8] or ""
-                        })
-            except:
-                continue
-        
-        # 分页
-        total = len(matched_customers)
-        start = (page - 1) * limit
-        end = start + limit
-        page_data = matched_customers[start:end]
-        
+        conn = get_connection()
+        cursor = conn.cursor()
+        # 名称或所属标签组名属于该分类的标签（分类在标签保存时已写入 tag_classes / tag_group_classes）
+        tag_names = customer_index.tag_names_in_category(cursor, tag_type)
+        group_names = customer_index.tag_groups_in_category(cursor, tag_type)
+        total, customer_ids = _tag_customers_page(cursor, tag_names, (page - 1) * limit, limit, group_names)
+        page_data = _portrait_customers(cursor, customer_ids, owner_name_default="")
         conn.close()
         
         return {
@@ -3241,7 +3574,9 @@ async def get_customers_by_tag(
         return {"success": False, "message": str(e)}
 
 @app.get("/api/customer-portrait/customers-by-filter")
-async def get_customers_by_filter(
+@offload
+@cached("customers_by_filter", stale_while_revalidate=True)
+def get_customers_by_filter(
     filter_type: str = Query(..., description="筛选类型：province/add_way/gender"),
     filter_value: str = Query(..., description="筛选值"),
     page: int = Query(1, ge=1),
@@ -3249,141 +3584,57 @@ async def get_customers_by_filter(
     token: str = Depends(check_token)
 ):
     """根据省份/添加方式/性别筛选客户列表"""
-    import json
     try:
-        conn = sqlite3.connect(DB_PATH)
+        conn = get_connection()
         cursor = conn.cursor()
         
-        matched_customers = []
-        
         if filter_type == "province":
-            # 按省份筛选
-            cursor.execute("""
-                SELECT id, name, enterprise_tags, avatar, gender, add_time, owner_userid, owner_name, remark
-                FROM customers
-                WHERE enterprise_tags IS NOT NULL AND enterprise_tags != '' AND enterprise_tags != '[]'
-            """)
-            
-            for row in cursor.fetchall():
-                try:
-                    tags = json.loads(row[2]) if row[2] else []
-                    if isinstance(tags, list):
-                        # 检查是否有匹配的省份标签
-                        for tag in tags:
-                            if isinstance(tag, dict):
-                                tag_name = tag.get('tag_name', '')
-                                if filter_value in tag_name or tag_name == filter_value:
-                                    customer_tags = [t.get('tag_name', '') for t in tags if isinstance(t, dict)][:5]
-                                    matched_customers.append({
-                                        "id": row[0],
-                                        "name": row[1],
-                                        "avatar": row[3] or "",
-                                        "gender": row[4] or 0,
-                                        "add_time": row[5] or 0,
-                                        "owner_userid": row[6] or "",
-                                        "owner_name": row[7] or "-",
-                                        "remark": row[8] or "",
-                                        "tags": customer_tags
-                                    })
-                                    break
-                except:
-                    continue
+            # 按省份筛选：名称包含省份的标签取客户并集，只读取当前页
+            tag_names = _province_tag_names(cursor, filter_value)
+            total, customer_ids = _tag_customers_page(cursor, tag_names, (page - 1) * limit, limit)
+            page_data = _portrait_customers(cursor, customer_ids, tag_limit=5)
+            conn.close()
+            return {
+                "success": True,
+                "data": {
+                    "customers": page_data,
+                    "total": total,
+                    "page": page,
+                    "limit": limit,
+                    "total_pages": (total + limit - 1) // limit
+                }
+            }
         
         elif filter_type == "add_way":
             # 按添加方式筛选
             add_way_map = {
-                "未知来源": 0,
-                "扫描二维码": 1,
-                "搜索手机号": 2,
-                "名片分享": 3,
-                "群聊": 4,
-                "手机通讯录": 5,
-                "微信联系人": 6,
-                "添加好友申请": 7,
-                "第三方应用": 8,
-                "搜索邮箱": 9,
-                "内部成员共享": 201,
-                "管理员分配": 202,
+                "未知来源": [0],
+                "扫描二维码": [1],
+                "搜索手机号": [2],
+                "名片分享": [3],
+                "群聊": [4],
+                "手机通讯录": [5],
+                "微信联系人": [6],
+                "添加好友申请": [7],
+                "第三方应用": [8],
+                "搜索邮箱": [9],
+                "内部成员共享": [201],
+                "管理员分配": [202],
                 "其他": [16, 22, 24]
             }
-            
-            # 找到对应的add_way值
-            add_way_value = None
-            for key, value in add_way_map.items():
-                if filter_value == key:
-                    add_way_value = value
-                    break
-            
-            if add_way_value is not None:
-                if isinstance(add_way_value, list):
-                    # 处理"其他"情况
-                    placeholders = ','.join(['?'] * len(add_way_value))
-                    cursor.execute(f"""
-                        SELECT id, name, enterprise_tags, avatar, gender, add_time, owner_userid, owner_name, remark
-                        FROM customers
-                        WHERE add_way IN ({placeholders})
-                    """, add_way_value)
-                else:
-                    cursor.execute("""
-                        SELECT id, name, enterprise_tags, avatar, gender, add_time, owner_userid, owner_name, remark
-                        FROM customers
-                        WHERE add_way = ?
-                    """, (add_way_value,))
-                
-                for row in cursor.fetchall():
-                    try:
-                        tags = json.loads(row[2]) if row[2] else []
-                        customer_tags = [t.get('tag_name', '') for t in tags if isinstance(t, dict)][:5] if isinstance(tags, list) else []
-                        matched_customers.append({
-                            "id": row[0],
-                            "name": row[1],
-                            "avatar": row[3] or "",
-                            "gender": row[4] or 0,
-                            "add_time": row[5] or 0,
-                            "owner_userid": row[6] or "",
-                            "owner_name": row[7] or "-",
-                            "remark": row[8] or "",
-                            "tags": customer_tags
-                        })
-                    except:
-                        continue
+            column, values = "add_way", add_way_map.get(filter_value, [])
         
         elif filter_type == "gender":
             # 按性别筛选
-            gender_map = {"未知": 0, "男": 1, "女": 2}
-            gender_value = gender_map.get(filter_value)
-            
-            if gender_value is not None:
-                cursor.execute("""
-                    SELECT id, name, enterprise_tags, avatar, gender, add_time, owner_userid, owner_name, remark
-                    FROM customers
-                    WHERE gender = ?
-                """, (gender_value,))
-                
-                for row in cursor.fetchall():
-                    try:
-                        tags = json.loads(row[2]) if row[2] else []
-                        customer_tags = [t.get('tag_name', '') for t in tags if isinstance(t, dict)][:5] if isinstance(tags, list) else []
-                        matched_customers.append({
-                            "id": row[0],
-                            "name": row[1],
-                            "avatar": row[3] or "",
-                            "gender": row[4] or 0,
-                            "add_time": row[5] or 0,
-                            "owner_userid": row[6] or "",
-                            "owner_name": row[7] or "-",
-                            "remark": row[8] or "",
-                            "tags": customer_tags
-                        })
-                    except:
-                        continue
+            gender_map = {"未知": [0], "男": [1], "女": [2]}
+            column, values = "gender", gender_map.get(filter_value, [])
         
-        # 分页
-        total = len(matched_customers)
-        start = (page - 1) * limit
-        end = start + limit
-        page_data = matched_customers[start:end]
+        else:
+            column, values = "gender", []
         
+        # 只取当前页的客户ID与总数
+        total, customer_ids = _column_customers_page(cursor, column, values, (page - 1) * limit, limit)
+        page_data = _portrait_customers(cursor, customer_ids, tag_limit=5)
         conn.close()
         
         return {
@@ -3401,76 +3652,27 @@ async def get_customers_by_filter(
         return {"success": False, "message": str(e)}
 
 @app.get("/api/customer-portrait/monthly-growth")
-async def get_monthly_growth(
+@offload
+@cached("monthly_growth", stale_while_revalidate=True)
+def get_monthly_growth(
     tag_type: str = Query("all", description="标签类型：all/user/agent/partner/supplier/peer/old-agent"),
     months: int = Query(12, ge=1, le=24, description="统计月份数（默认12个月）"),
     token: str = Depends(check_token)
 ):
     """获取月度客户增长趋势"""
-    import json
     from datetime import datetime, timedelta
-    from collections import defaultdict
     
     try:
-        conn = sqlite3.connect(DB_PATH)
+        conn = get_connection()
         cursor = conn.cursor()
         
         # 获取当前时间和起始时间
         now = datetime.now()
         start_date = now - timedelta(days=months * 30)
-        start_timestamp = int(start_date.timestamp())
         
-        # 查询时间范围内的客户
-        cursor.execute("""
-            SELECT add_time, enterprise_tags
-            FROM customers
-            WHERE add_time >= ?
-            ORDER BY add_time
-        """, (start_timestamp,))
-        
-        # 按月统计
-        monthly_data = defaultdict(int)
-        
-        # 标签关键词映射
-        tag_keywords = {
-            "user": ["用户", "客户"],
-            "agent": ["代理商", "代理"],
-            "partner": ["合伙人"],
-            "supplier": ["供应商"],
-            "peer": ["同行", "上游同行"],
-            "old-agent": ["原有老代理", "历史-代理"]
-        }
-        
-        for row in cursor.fetchall():
-            add_time = row[0]
-            enterprise_tags = row[1]
-            
-            if not add_time:
-                continue
-            
-            # 判断是否符合标签筛选
-            if tag_type != "all":
-                keywords = tag_keywords.get(tag_type, [])
-                if keywords:
-                    try:
-                        tags = json.loads(enterprise_tags) if enterprise_tags else []
-                        if isinstance(tags, list):
-                            has_match = False
-                            for tag in tags:
-                                if isinstance(tag, dict):
-                                    tag_name = tag.get('tag_name', '')
-                                    if any(keyword in tag_name for keyword in keywords):
-                                        has_match = True
-                                        break
-                            if not has_match:
-                                continue
-                    except:
-                        continue
-            
-            # 统计到对应月份
-            dt = datetime.fromtimestamp(add_time)
-            month_key = dt.strftime('%Y-%m')
-            monthly_data[month_key] += 1
+        # 按月汇总每日新增（未知标签类型按全部客户统计）
+        category = tag_type if tag_type in tag_classifier.classifier.growth_categories else customer_index.TAG_CATEGORY_ALL
+        monthly_data = customer_index.daily_adds_by_month(cursor, category, start_date.strftime('%Y-%m-%d'))
         
         conn.close()
         
@@ -3507,77 +3709,21 @@ async def get_monthly_growth(
         return {"success": False, "message": str(e)}
 
 @app.get("/api/customer-portrait/monthly-growth-by-year")
-async def get_monthly_growth_by_year(
+@offload
+@cached("monthly_growth_by_year", stale_while_revalidate=True)
+def get_monthly_growth_by_year(
     tag_type: str = Query("all", description="标签类型：all/user/agent/partner/supplier/peer/old-agent"),
     year: int = Query(..., description="年份，如2024"),
     token: str = Depends(check_token)
 ):
     """获取指定年份的月度客户增长趋势（1-12月）"""
-    import json
-    from datetime import datetime
-    from collections import defaultdict
-    
     try:
-        conn = sqlite3.connect(DB_PATH)
+        conn = get_connection()
         cursor = conn.cursor()
         
-        # 获取该年份的起止时间戳
-        start_date = datetime(year, 1, 1)
-        end_date = datetime(year, 12, 31, 23, 59, 59)
-        start_timestamp = int(start_date.timestamp())
-        end_timestamp = int(end_date.timestamp())
-        
-        # 查询时间范围内的客户
-        cursor.execute("""
-            SELECT add_time, enterprise_tags
-            FROM customers
-            WHERE add_time >= ? AND add_time <= ?
-            ORDER BY add_time
-        """, (start_timestamp, end_timestamp))
-        
-        # 按月统计
-        monthly_data = defaultdict(int)
-        
-        # 标签关键词映射
-        tag_keywords = {
-            "user": ["用户", "客户"],
-            "agent": ["代理商", "代理"],
-            "partner": ["合伙人"],
-            "supplier": ["供应商"],
-            "peer": ["同行", "上游同行"],
-            "old-agent": ["原有老代理", "历史-代理"]
-        }
-        
-        for row in cursor.fetchall():
-            add_time = row[0]
-            enterprise_tags = row[1]
-            
-            if not add_time:
-                continue
-            
-            # 判断是否符合标签筛选
-            if tag_type != "all":
-                keywords = tag_keywords.get(tag_type, [])
-                if keywords:
-                    try:
-                        tags = json.loads(enterprise_tags) if enterprise_tags else []
-                        if isinstance(tags, list):
-                            has_match = False
-                            for tag in tags:
-                                if isinstance(tag, dict):
-                                    tag_name = tag.get('tag_name', '')
-                                    if any(keyword in tag_name for keyword in keywords):
-                                        has_match = True
-                                        break
-                            if not has_match:
-                                continue
-                    except:
-                        continue
-            
-            # 统计到对应月份
-            dt = datetime.fromtimestamp(add_time)
-            month_key = f"{year}-{dt.month:02d}"
-            monthly_data[month_key] += 1
+        # 按月汇总该年份的每日新增（未知标签类型按全部客户统计）
+        category = tag_type if tag_type in tag_classifier.classifier.growth_categories else customer_index.TAG_CATEGORY_ALL
+        monthly_data = customer_index.daily_adds_by_month(cursor, category, f"{year}-01-01", f"{year}-12-31")
         
         conn.close()
         
@@ -3613,72 +3759,22 @@ async def get_monthly_growth_by_year(
         return {"success": False, "message": str(e)}
 
 @app.get("/api/customer-portrait/employee-ranking")
-async def get_employee_ranking(
+@offload
+@cached("employee_ranking", stale_while_revalidate=True)
+def get_employee_ranking(
     tag_type: str = Query("all", description="标签类型：all/user/agent/partner/supplier/peer/old-agent"),
     limit: int = Query(20, ge=1, le=100, description="返回前N名员工"),
     token: str = Depends(check_token)
 ):
-    """获取员工客户数量排行榜"""
-    import json
-    from collections import defaultdict
-    
+    """获取员工客户数量排行榜（列式快照上按负责员工向量化计数）"""
     try:
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        
-        # 标签关键词映射
-        tag_keywords = {
-            "user": ["用户", "客户"],
-            "agent": ["代理商", "代理"],
-            "partner": ["合伙人"],
-            "supplier": ["供应商"],
-            "peer": ["同行", "上游同行"],
-            "old-agent": ["原有老代理", "历史-代理"]
-        }
-        
-        # 查询所有客户
-        cursor.execute("""
-            SELECT owner_userid, owner_name, enterprise_tags
-            FROM customers
-            WHERE owner_userid IS NOT NULL AND owner_userid != ''
-        """)
-        
-        # 按员工统计
-        employee_stats = defaultdict(lambda: {"userid": "", "name": "", "count": 0})
-        
-        for row in cursor.fetchall():
-            owner_userid = row[0]
-            owner_name = row[1] or owner_userid
-            enterprise_tags = row[2]
-            
-            # 判断是否符合标签筛选
-            if tag_type != "all":
-                keywords = tag_keywords.get(tag_type, [])
-                if keywords:
-                    try:
-                        tags = json.loads(enterprise_tags) if enterprise_tags else []
-                        if isinstance(tags, list):
-                            has_match = False
-                            for tag in tags:
-                                if isinstance(tag, dict):
-                                    tag_name = tag.get('tag_name', '')
-                                    if any(keyword in tag_name for keyword in keywords):
-                                        has_match = True
-                                        break
-                            if not has_match:
-                                continue
-                    except:
-                        continue
-            
-            # 统计
-            employee_stats[owner_userid]["userid"] = owner_userid
-            employee_stats[owner_userid]["name"] = owner_name
-            employee_stats[owner_userid]["count"] += 1
-        
-        conn.close()
-        
-        # 转换为列表并排序
-        ranking = sorted(employee_stats.values(), key=lambda x: x['count'], reverse=True)[:limit]
+        # 未知的标签类型按全部客户统计（category_bit 为 0）
+        category_bit = tag_classifier.classifier.category_bit(tag_type)
+        ranking = [
+            {"userid": owner_userid, "name": owner_name or owner_userid, "count": count}
+            for owner_userid, owner_name, count
+            in customer_snapshot.snapshot.owner_ranking(category_bit, limit)
+        ]
         
         # 计算总数和占比
         total = sum(item['count'] for item in ranking)
@@ -3698,58 +3794,33 @@ async def get_employee_ranking(
         return {"success": False, "message": str(e)}
 
 @app.get("/api/customer-portrait/tag-combinations")
-async def get_tag_combinations(
+@offload
+@cached("tag_combinations", stale_while_revalidate=True)
+def get_tag_combinations(
     tags: str = Query("", description="标签名称，逗号分隔，例如：四川,代理商"),
     limit: int = Query(10, ge=1, le=50, description="返回热门组合数量"),
+    size: int = Query(2, ge=2, le=3, description="热门组合的标签个数（2 或 3）"),
+    page: int = Query(1, ge=1),
+    page_size: int = Query(0, ge=0, le=1000, description="指定标签时每页客户数，0 表示返回全部"),
     token: str = Depends(check_token)
 ):
     """获取标签组合分析数据"""
-    import json
-    from collections import Counter
-    from itertools import combinations
     
     try:
-        conn = sqlite3.connect(DB_PATH)
+        conn = get_connection()
         cursor = conn.cursor()
         
-        # 如果指定了标签，查询同时拥有这些标签的客户
+        # 如果指定了标签，查询同时拥有这些标签的客户（位图求交集）
         if tags:
             tag_list = [t.strip() for t in tags.split(',') if t.strip()]
             
-            cursor.execute("""
-                SELECT id, name, enterprise_tags, avatar, gender, add_time, owner_userid, owner_name, remark
-                FROM customers
-                WHERE enterprise_tags IS NOT NULL AND enterprise_tags != '' AND enterprise_tags != '[]'
-            """)
-            
-            matched_customers = []
-            
-            for row in cursor.fetchall():
-                try:
-                    tags_data = json.loads(row[2]) if row[2] else []
-                    if isinstance(tags_data, list):
-                        # 获取客户的所有标签名
-                        customer_tag_names = set()
-                        for tag in tags_data:
-                            if isinstance(tag, dict):
-                                customer_tag_names.add(tag.get('tag_name', ''))
-                        
-                        # 检查是否包含所有指定标签
-                        if all(tag in customer_tag_names for tag in tag_list):
-                            customer_tags = [t.get('tag_name', '') for t in tags_data if isinstance(t, dict)][:5]
-                            matched_customers.append({
-                                "id": row[0],
-                                "name": row[1],
-                                "avatar": row[3] or "",
-                                "gender": row[4] or 0,
-                                "add_time": row[5] or 0,
-                                "owner_userid": row[6] or "",
-                                "owner_name": row[7] or "-",
-                                "remark": row[8] or "",
-                                "tags": customer_tags
-                            })
-                except:
-                    continue
+            matched = tag_bitmap.tag_index.customers_with_all(tag_list)
+            total = matched.count()
+            if page_size:
+                customer_ids = tag_bitmap.tag_index.customer_ids(matched, (page - 1) * page_size, page_size)
+            else:
+                customer_ids = tag_bitmap.tag_index.customer_ids(matched)
+            matched_customers = _portrait_customers(cursor, customer_ids, tag_limit=5)
             
             conn.close()
             
@@ -3758,43 +3829,22 @@ async def get_tag_combinations(
                 "data": {
                     "combination_tags": tag_list,
                     "customers": matched_customers,
-                    "total": len(matched_customers)
+                    "total": total
                 }
             }
         
-        # 如果没有指定标签，返回热门标签组合
+        # 如果没有指定标签，返回热门标签组合（读取同步时维护的组合统计表）
         else:
-            cursor.execute("""
-                SELECT enterprise_tags
-                FROM customers
-                WHERE enterprise_tags IS NOT NULL AND enterprise_tags != '' AND enterprise_tags != '[]'
-            """)
-            
-            # 统计所有标签组合（2个标签的组合）
-            combo_counter = Counter()
-            
-            for row in cursor.fetchall():
-                try:
-                    tags_data = json.loads(row[0]) if row[0] else []
-                    if isinstance(tags_data, list) and len(tags_data) >= 2:
-                        tag_names = [tag.get('tag_name', '') for tag in tags_data if isinstance(tag, dict)]
-                        # 生成所有2个标签的组合
-                        for combo in combinations(sorted(tag_names), 2):
-                            combo_counter[combo] += 1
-                except:
-                    continue
-            
-            conn.close()
-            
-            # 获取最热门的组合
             hot_combinations = []
-            for combo, count in combo_counter.most_common(limit):
+            for combo, count in customer_index.top_tag_combos(cursor, size, limit):
                 hot_combinations.append({
-                    "tags": list(combo),
+                    "tags": combo,
                     "count": count,
                     "display": " + ".join(combo)
                 })
             
+            conn.close()
+            
             return {
                 "success": True,
                 "data": {
@@ -12,9 +12,9 @@ from datetime import datetime, timedelta
 from fastapi import APIRouter, HTTPException, Header, Depends
 from pydantic import BaseModel
 
-router = APIRouter(tags=["认证"])
+from database import get_connection, run_blocking
 
-DB_PATH = 'data/crm.db'
+router = APIRouter(tags=["认证"])
 
 # ========== 数据模型 ==========
 
@@ -57,7 +57,7 @@ class DepartmentUpdate(BaseModel):
 
 def get_db():
     """获取数据库连接"""
-    conn = sqlite3.connect(DB_PATH)
+    conn = get_connection()
     conn.row_factory = sqlite3.Row
     return conn
 
@@ -126,7 +126,7 @@ async def get_current_user(authorization: str = Header(None)):
         raise HTTPException(status_code=401, detail="未登录")
     
     token = authorization.replace('Bearer ', '')
-    user = verify_token(token)
+    user = await run_blocking(verify_token, token)
     
     if not user:
         raise HTTPException(status_code=401, detail="登录已过期")
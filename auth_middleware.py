@@ -9,7 +9,7 @@ from typing import Optional
 from fastapi import Request, HTTPException, status
 from fastapi.responses import RedirectResponse, JSONResponse
 
-from config import DB_PATH
+from database import get_connection, run_blocking
 
 # JWT 密钥（生产环境应该从环境变量读取）
 JWT_SECRET = "thc_crm_secret_key_2025"
@@ -41,7 +41,7 @@ def get_current_user(token: str) -> Optional[dict]:
     import time
     
     # 从数据库查询 token
-    conn = sqlite3.connect(DB_PATH)
+    conn = get_connection()
     conn.row_factory = sqlite3.Row
     cursor = conn.cursor()
     
@@ -138,6 +138,7 @@ async def auth_middleware(request: Request, call_next):
         '/api/auth/login',
         '/api/auth/logout',
         '/api/auth/current',  # 验证 token 的接口也要放行
+        '/api/wecom/callback',  # 企业微信回调，由消息签名校验
         '/static/',
         '/login.html',
         '/favicon.ico'
@@ -167,7 +168,7 @@ async def auth_middleware(request: Request, call_next):
             )
         
         token = auth_header[7:]  # 去掉 "Bearer "
-        user = get_current_user(token)
+        user = await run_blocking(get_current_user, token)
         
         if not user:
             return JSONResponse(
@@ -6,13 +6,12 @@
 from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
 from typing import List, Optional
-import sqlite3
 import json
 import requests
 import hashlib
 import base64
 from datetime import datetime
-from config import DB_PATH
+from database import get_connection
 
 router = APIRouter()
 
@@ -44,7 +43,7 @@ class NotificationCreate(BaseModel):
 def get_webhooks(group_type: Optional[str] = None, api_token: str = None):
     """获取webhook列表"""
     try:
-        conn = sqlite3.connect(DB_PATH)
+        conn = get_connection()
         cursor = conn.cursor()
         
         if group_type:
@@ -92,7 +91,7 @@ def get_webhooks(group_type: Optional[str] = None, api_token: str = None):
 def create_webhook(webhook: WebhookCreate, api_token: str = None):
     """创建webhook配置"""
     try:
-        conn = sqlite3.connect(DB_PATH)
+        conn = get_connection()
         cursor = conn.cursor()
         
         # 检查webhook_url是否已存在
@@ -124,7 +123,7 @@ def create_webhook(webhook: WebhookCreate, api_token: str = None):
 def delete_webhook(webhook_id: int, api_token: str = None):
     """删除webhook配置"""
     try:
-        conn = sqlite3.connect(DB_PATH)
+        conn = get_connection()
         cursor = conn.cursor()
         
         cursor.execute("DELETE FROM bot_webhooks WHERE id = ?", (webhook_id,))
@@ -140,7 +139,7 @@ def delete_webhook(webhook_id: int, api_token: str = None):
 def test_webhook(webhook_id: int, api_token: str = None):
     """测试webhook"""
     try:
-        conn = sqlite3.connect(DB_PATH)
+        conn = get_connection()
         cursor = conn.cursor()
         
         # 获取webhook信息
@@ -196,7 +195,7 @@ def test_webhook(webhook_id: int, api_token: str = None):
 def update_webhook(webhook_id: int, webhook: WebhookCreate, api_token: str = None):
     """更新webhook配置"""
     try:
-        conn = sqlite3.connect(DB_PATH)
+        conn = get_connection()
         cursor = conn.cursor()
         
         # 检查webhook是否存在
@@ -234,7 +233,7 @@ def update_webhook(webhook_id: int, webhook: WebhookCreate, api_token: str = Non
 def toggle_webhook_status(webhook_id: int, api_token: str = None):
     """切换webhook状态（启用/停用）"""
     try:
-        conn = sqlite3.connect(DB_PATH)
+        conn = get_connection()
         cursor = conn.cursor()
         
         # 获取当前状态
@@ -270,7 +269,7 @@ def toggle_webhook_status(webhook_id: int, api_token: str = None):
 def get_notifications(group_type: Optional[str] = None, status: Optional[str] = None, api_token: str = None):
     """获取通知列表"""
     try:
-        conn = sqlite3.connect(DB_PATH)
+        conn = get_connection()
         cursor = conn.cursor()
         
         sql = """
@@ -329,7 +328,7 @@ def get_notifications(group_type: Optional[str] = None, status: Optional[str] =
 def create_notification(notification: NotificationCreate, api_token: str = None):
     """创建通知消息并发送"""
     try:
-        conn = sqlite3.connect(DB_PATH)
+        conn = get_connection()
         cursor = conn.cursor()
         
         # 插入通知记录
@@ -444,7 +443,7 @@ def create_notification(notification: NotificationCreate, api_token: str = None)
 def send_notification(notification_id: int, api_token: str = None):
     """发送通知消息"""
     try:
-        conn = sqlite3.connect(DB_PATH)
+        conn = get_connection()
         cursor = conn.cursor()
         
         # 获取通知详情
@@ -580,7 +579,7 @@ def send_notification(notification_id: int, api_token: str = None):
 def get_notification_detail(notification_id: int, api_token: str = None):
     """获取通知详情"""
     try:
-        conn = sqlite3.connect(DB_PATH)
+        conn = get_connection()
         cursor = conn.cursor()
         
         # 获取通知基本信息
@@ -668,7 +667,7 @@ def get_notification_detail(notification_id: int, api_token: str = None):
 def get_send_logs(notification_id: int, api_token: str = None):
     """获取发送记录"""
     try:
-        conn = sqlite3.connect(DB_PATH)
+        conn = get_connection()
         cursor = conn.cursor()
         
         cursor.execute("""
@@ -15,6 +15,12 @@ AGENT_ID = os.getenv("WECOM_AGENT_ID", "1000013")  # 应用 AgentId
 
 # ==================== 数据库配置 ====================
 DB_PATH = os.getenv("DB_PATH", "data/crm.db")
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "64"))  # 连接池最大同时借出的连接数
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))  # 等待空闲连接的超时时间（秒）
+DB_BUSY_TIMEOUT = int(os.getenv("DB_BUSY_TIMEOUT", "5000"))  # 写锁等待时间（毫秒）
+DB_CACHE_SIZE = int(os.getenv("DB_CACHE_SIZE", "-65536"))  # 页缓存大小，负数表示 KiB（默认 64MB）
+DB_MMAP_SIZE = int(os.getenv("DB_MMAP_SIZE", str(256 * 1024 * 1024)))  # 内存映射读取大小（字节）
+DB_EXECUTOR_WORKERS = int(os.getenv("DB_EXECUTOR_WORKERS", "16"))  # async 路由执行数据访问的线程数
 
 # ==================== 服务配置 ====================
 PORT = int(os.getenv("PORT", "9999"))  # 服务端口（默认9999）
@@ -47,6 +53,21 @@ REDIS_PORT = int(os.getenv("REDIS_PORT", "6379"))
 REDIS_PASSWORD = os.getenv("REDIS_PASSWORD", "")
 REDIS_DB = int(os.getenv("REDIS_DB", "0"))
 
+# ==================== 查询缓存配置 ====================
+QUERY_CACHE_SIZE = int(os.getenv("QUERY_CACHE_SIZE", "512"))  # 最多缓存的查询结果数，0 表示关闭
+QUERY_CACHE_TTL = int(os.getenv("QUERY_CACHE_TTL", "300"))  # 缓存有效期（秒），数据写入时会立即失效
+QUERY_CACHE_MAX_STALE = int(os.getenv("QUERY_CACHE_MAX_STALE", "3600"))  # 画像接口旧结果最多保留（秒），超过后同步重新计算
+QUERY_CACHE_REFRESH_WORKERS = int(os.getenv("QUERY_CACHE_REFRESH_WORKERS", "2"))  # 后台刷新过期结果的线程数
+
+# ==================== 同步写入配置 ====================
+SYNC_WRITE_BATCH_SIZE = int(os.getenv("SYNC_WRITE_BATCH_SIZE", "200"))  # 客户同步每个写事务的最大客户数
+SYNC_WRITE_FLUSH_MS = int(os.getenv("SYNC_WRITE_FLUSH_MS", "500"))  # 不足一批时最多等待多久提交（毫秒）
+SYNC_WRITE_QUEUE_SIZE = int(os.getenv("SYNC_WRITE_QUEUE_SIZE", "1000"))  # 待写入队列上限，写入跟不上时抓取线程等待
+SYNC_TAG_REFRESH_LIMIT = int(os.getenv("SYNC_TAG_REFRESH_LIMIT", "2000"))  # 使用批量接口时每次同步逐个拉取以补齐个人/规则标签的客户数
+
+# ==================== 标签分类配置 ====================
+TAG_RULES_FILE = os.getenv("TAG_RULES_FILE", "data/tag_rules.json")  # 标签分类规则覆盖文件（JSON，不存在时使用默认规则）
+
 # ==================== 日志配置 ====================
 LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
 LOG_DIR = "logs"
@@ -63,6 +84,22 @@ SYNC_MAX_WORKERS = int(os.getenv("SYNC_MAX_WORKERS", "10"))  # 同步并发线
 # 如果为空，则同步所有员工的客户
 SYNC_OWNER_USERID = os.getenv("SYNC_OWNER_USERID", "msYang")  # 默认同步 msYang 的客户
 
+# ==================== 企业微信接口限流配置 ====================
+# 每个接口族（externalcontact / groupchat / user / wedoc）独立限流，并发上限按限流错误自适应
+WECOM_API_RATE = float(os.getenv("WECOM_API_RATE", "20"))  # 每个接口族每秒请求数上限
+WECOM_API_BURST = int(os.getenv("WECOM_API_BURST", "40"))  # 令牌桶容量（允许的突发请求数）
+WECOM_API_MAX_CONCURRENCY = int(os.getenv("WECOM_API_MAX_CONCURRENCY", "32"))  # 每个接口族的并发上限（同步线程池大小）
+WECOM_API_RETRY_TIMES = int(os.getenv("WECOM_API_RETRY_TIMES", "3"))  # 遇到限流时的重试次数
+WECOM_API_RETRY_BASE = float(os.getenv("WECOM_API_RETRY_BASE", "1"))  # 重试退避基数（秒），每次翻倍并加随机抖动
+WECOM_API_RETRY_MAX = float(os.getenv("WECOM_API_RETRY_MAX", "30"))  # 单次重试最长等待（秒）
+
+# ==================== 企业微信回调配置 ====================
+# 配置 Token 与 EncodingAESKey 后，客户/客户群变更由回调事件驱动，定时增量同步降为低频对账
+WECOM_CALLBACK_TOKEN = os.getenv("WECOM_CALLBACK_TOKEN", "")  # 回调 Token
+WECOM_CALLBACK_AES_KEY = os.getenv("WECOM_CALLBACK_AES_KEY", "")  # 回调 EncodingAESKey（43位）
+CALLBACK_DEBOUNCE_SECONDS = float(os.getenv("CALLBACK_DEBOUNCE_SECONDS", "5"))  # 回调事件合并窗口（秒），窗口内同一客户/群只同步一次
+SYNC_RECONCILE_HOURS = int(os.getenv("SYNC_RECONCILE_HOURS", "24"))  # 启用回调后对账增量同步的间隔（小时）
+
 # ==================== 环境标识 ====================
 ENV = os.getenv("ENV", "development")  # development / production
 DEBUG = ENV == "development"
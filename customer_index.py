@@ -0,0 +1,754 @@
+"""
+客户派生索引维护
+customers 表里的标签是 JSON 文本，无法走索引；这里维护规范化的关联表，
+由 sync_service.write_customers 与客户行在同一事务内更新，查询接口直接走索引。
+"""
+import json
+import sqlite3
+from datetime import datetime
+from itertools import combinations
+from typing import Dict, List, Optional, Tuple
+
+import fast_json
+from tag_classifier import classifier
+
+# 标签类型（与企业微信 follow_user.tags[].type 一致）
+TAG_TYPE_ENTERPRISE = 1
+TAG_TYPE_PERSONAL = 2
+TAG_TYPE_RULE = 3
+
+
+def init_tag_link_table(cursor):
+    """创建客户-标签关联表及索引"""
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS customer_tag_links (
+            customer_id TEXT NOT NULL,
+            tag_id TEXT NOT NULL DEFAULT '',
+            tag_name TEXT NOT NULL DEFAULT '',
+            group_name TEXT DEFAULT '',
+            tag_type INTEGER NOT NULL DEFAULT 1
+        )
+    """)
+    # 按标签ID筛选客户
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_tag_links_tag_id
+        ON customer_tag_links(tag_id, tag_type, customer_id)
+    """)
+    # 按标签名（省份、用户属性）筛选客户
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_tag_links_tag_name
+        ON customer_tag_links(tag_type, tag_name, customer_id)
+    """)
+    # 按客户整体替换标签
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_tag_links_customer
+        ON customer_tag_links(customer_id)
+    """)
+
+
+def build_tag_links(tags: List[Dict]) -> List[Tuple]:
+    """
+    将企业微信原始标签列表转换为关联表行（去重）
+    :param tags: [{'tag_id', 'tag_name', 'group_name', 'type'}, ...]
+    :return: [(tag_id, tag_name, group_name, tag_type), ...]
+    """
+    rows = []
+    seen = set()
+    for tag in tags or []:
+        if not isinstance(tag, dict):
+            continue
+        tag_type = tag.get('type', TAG_TYPE_ENTERPRISE)
+        tag_id = tag.get('tag_id', '') or ''
+        tag_name = (tag.get('tag_name', '') or '').strip()
+        if not tag_id and not tag_name:
+            continue
+        key = (tag_type, tag_id, tag_name)
+        if key in seen:
+            continue
+        seen.add(key)
+        rows.append((tag_id, tag_name, tag.get('group_name', '') or '', tag_type))
+    return rows
+
+
+def save_customer_tag_links(cursor, customer_id: str, tags: List[Dict]):
+    """
+    替换某个客户的标签关联（调用方负责提交事务，保证与客户行原子更新）
+    """
+    cursor.execute("DELETE FROM customer_tag_links WHERE customer_id = ?", (customer_id,))
+    rows = build_tag_links(tags)
+    if rows:
+        cursor.executemany("""
+            INSERT INTO customer_tag_links (customer_id, tag_id, tag_name, group_name, tag_type)
+            VALUES (?, ?, ?, ?, ?)
+        """, [(customer_id,) + row for row in rows])
+
+
+def _tags_from_columns(enterprise_tags: str, personal_tags: str, rule_tags: str) -> List[Dict]:
+    """从 customers 表的三个 JSON 列还原标签列表"""
+    tags = []
+    for tag_type, tags_str in (
+        (TAG_TYPE_ENTERPRISE, enterprise_tags),
+        (TAG_TYPE_PERSONAL, personal_tags),
+        (TAG_TYPE_RULE, rule_tags),
+    ):
+        try:
+            items = fast_json.loads(tags_str) if tags_str else []
+        except (TypeError, ValueError):
+            continue
+        if not isinstance(items, list):
+            continue
+        for item in items:
+            if isinstance(item, dict):
+                tags.append(dict(item, type=tag_type))
+    return tags
+
+
+def rebuild_tag_links(conn: sqlite3.Connection) -> int:
+    """
+    根据 customers 表全量重建关联表（用于首次上线或数据修复）
+    :return: 写入的关联行数
+    """
+    cursor = conn.cursor()
+    cursor.execute("DELETE FROM customer_tag_links")
+    cursor.execute("SELECT id, enterprise_tags, personal_tags, rule_tags FROM customers")
+
+    total = 0
+    batch = []
+    for customer_id, enterprise_tags, personal_tags, rule_tags in cursor.fetchall():
+        tags = _tags_from_columns(enterprise_tags, personal_tags, rule_tags)
+        batch.extend((customer_id,) + row for row in build_tag_links(tags))
+        if len(batch) >= 5000:
+            conn.executemany("""
+                INSERT INTO customer_tag_links (customer_id, tag_id, tag_name, group_name, tag_type)
+                VALUES (?, ?, ?, ?, ?)
+            """, batch)
+            total += len(batch)
+            batch = []
+
+    if batch:
+        conn.executemany("""
+            INSERT INTO customer_tag_links (customer_id, tag_id, tag_name, group_name, tag_type)
+            VALUES (?, ?, ?, ?, ?)
+        """, batch)
+        total += len(batch)
+
+    conn.commit()
+    return total
+
+
+def ensure_tag_links(conn: sqlite3.Connection):
+    """关联表为空而客户表有标签数据时，自动回填一次"""
+    cursor = conn.cursor()
+    cursor.execute("SELECT 1 FROM customer_tag_links LIMIT 1")
+    if cursor.fetchone():
+        return
+    try:
+        cursor.execute("""
+            SELECT 1 FROM customers
+            WHERE enterprise_tags IS NOT NULL AND enterprise_tags != '' AND enterprise_tags != '[]'
+            LIMIT 1
+        """)
+    except sqlite3.OperationalError:
+        # 旧库没有标签列，等首次同步时再写入
+        return
+    if not cursor.fetchone():
+        return
+    print("[数据库] 回填客户标签关联表...")
+    total = rebuild_tag_links(conn)
+    print(f"[数据库] 客户标签关联表回填完成，共 {total} 条")
+
+
+# ========== 标签统计汇总 ==========
+
+# tag_stats（表结构见 migrations v11）.scope_owner 取值：全部客户用空字符串，其余为负责员工 userid
+SCOPE_ALL = ''
+
+
+def enterprise_tag_names(cursor, customer_id: str) -> set:
+    """客户当前的企业标签名（去重，取自关联表）"""
+    cursor.execute("""
+        SELECT DISTINCT tag_name FROM customer_tag_links
+        WHERE customer_id = ? AND tag_type = ? AND tag_name != ''
+    """, (customer_id, TAG_TYPE_ENTERPRISE))
+    return {row[0] for row in cursor.fetchall()}
+
+
+def _tag_stats_delta(cursor, owner: str, tag_names, delta: int):
+    if not tag_names:
+        return
+    scopes = [SCOPE_ALL] + ([owner] if owner else [])
+    cursor.executemany("""
+        INSERT INTO tag_stats (scope_owner, tag_name, customer_count) VALUES (?, ?, ?)
+        ON CONFLICT(scope_owner, tag_name) DO UPDATE SET customer_count = customer_count + excluded.customer_count
+    """, [(scope, name, delta) for scope in scopes for name in tag_names])
+    if delta < 0:
+        cursor.executemany(
+            "DELETE FROM tag_stats WHERE scope_owner = ? AND tag_name = ? AND customer_count <= 0",
+            [(scope, name) for scope in scopes for name in tag_names]
+        )
+
+
+def save_customer_tags(cursor, customer_id: str, tags: List[Dict], owner_userid: str,
+                       add_time: int, previous: Optional[Tuple[str, int]] = None):
+    """
+    替换客户的标签关联，并按差量更新 tag_stats、customer_daily_adds、tag_combo_stats（调用方负责提交事务）
+    :param previous: 更新前的 (owner_userid, add_time)，新客户传 None
+    """
+    old_names = enterprise_tag_names(cursor, customer_id) if previous is not None else set()
+    save_customer_tag_links(cursor, customer_id, tags)
+    enterprise_links = [
+        (tag_name, group_name) for tag_id, tag_name, group_name, tag_type in build_tag_links(tags)
+        if tag_type == TAG_TYPE_ENTERPRISE and tag_name
+    ]
+    new_names = {tag_name for tag_name, group_name in enterprise_links}
+    save_tag_classes(cursor, new_names, {group_name for tag_name, group_name in enterprise_links if group_name})
+
+    old_owner_userid = (previous[0] if previous else '') or ''
+    owner_userid = owner_userid or ''
+    if old_owner_userid == owner_userid:
+        _tag_stats_delta(cursor, owner_userid, old_names - new_names, -1)
+        _tag_stats_delta(cursor, owner_userid, new_names - old_names, 1)
+    else:
+        # 负责人变更：旧范围整体减去，新范围整体加上（全部范围的差量相互抵消）
+        _tag_stats_delta(cursor, old_owner_userid, old_names, -1)
+        _tag_stats_delta(cursor, owner_userid, new_names, 1)
+
+    old_keys = _daily_add_keys(previous[1], old_owner_userid, old_names) if previous else set()
+    new_keys = _daily_add_keys(add_time, owner_userid, new_names)
+    _daily_adds_delta(cursor, old_keys - new_keys, -1)
+    _daily_adds_delta(cursor, new_keys - old_keys, 1)
+
+    old_combos = _tag_combos(old_names)
+    new_combos = _tag_combos(new_names)
+    _tag_combo_delta(cursor, old_combos - new_combos, -1)
+    _tag_combo_delta(cursor, new_combos - old_combos, 1)
+
+
+def rebuild_tag_stats(conn: sqlite3.Connection) -> int:
+    """
+    根据关联表全量重建 tag_stats（用于首次上线或数据修复）
+    :return: 写入的统计行数
+    """
+    cursor = conn.cursor()
+    cursor.execute("DELETE FROM tag_stats")
+    cursor.execute("""
+        INSERT INTO tag_stats (scope_owner, tag_name, customer_count)
+        SELECT ?, tag_name, COUNT(DISTINCT customer_id)
+        FROM customer_tag_links
+        WHERE tag_type = ? AND tag_name != ''
+        GROUP BY tag_name
+    """, (SCOPE_ALL, TAG_TYPE_ENTERPRISE))
+    cursor.execute("""
+        INSERT INTO tag_stats (scope_owner, tag_name, customer_count)
+        SELECT c.owner_userid, l.tag_name, COUNT(DISTINCT l.customer_id)
+        FROM customer_tag_links l
+        JOIN customers c ON c.id = l.customer_id
+        WHERE l.tag_type = ? AND l.tag_name != ''
+          AND c.owner_userid IS NOT NULL AND c.owner_userid != ''
+        GROUP BY c.owner_userid, l.tag_name
+    """, (TAG_TYPE_ENTERPRISE,))
+    cursor.execute("SELECT COUNT(*) FROM tag_stats")
+    total = cursor.fetchone()[0]
+    conn.commit()
+    return total
+
+
+def ensure_tag_stats(conn: sqlite3.Connection):
+    """汇总表为空而关联表有数据时，自动回填一次"""
+    cursor = conn.cursor()
+    cursor.execute("SELECT 1 FROM tag_stats LIMIT 1")
+    if cursor.fetchone():
+        return
+    cursor.execute("SELECT 1 FROM customer_tag_links WHERE tag_type = ? LIMIT 1", (TAG_TYPE_ENTERPRISE,))
+    if not cursor.fetchone():
+        return
+    print("[数据库] 回填标签统计汇总表...")
+    total = rebuild_tag_stats(conn)
+    print(f"[数据库] 标签统计汇总表回填完成，共 {total} 条")
+
+
+def tag_stats(cursor, scope_owner: str) -> Dict[str, int]:
+    """读取某范围的标签客户数 {tag_name: count}"""
+    cursor.execute("""
+        SELECT tag_name, customer_count FROM tag_stats
+        WHERE scope_owner = ? AND customer_count > 0
+    """, (scope_owner,))
+    return {row[0]: row[1] for row in cursor.fetchall()}
+
+
+# ========== 标签分类 ==========
+# tag_classes、tag_group_classes、index_meta 表结构见 migrations v14
+
+def save_tag_classes(cursor, tag_names, group_names=()):
+    """为新出现的标签名、标签组名写入分类（已有的不重复计算）"""
+    if tag_names:
+        cursor.executemany("""
+            INSERT OR IGNORE INTO tag_classes (tag_name, key_category, province, category_mask)
+            VALUES (?, ?, ?, ?)
+        """, [(name,) + tuple(classifier.classify(name)) for name in tag_names])
+    if group_names:
+        cursor.executemany("""
+            INSERT OR IGNORE INTO tag_group_classes (group_name, category_mask) VALUES (?, ?)
+        """, [(name, classifier.classify(name).category_mask) for name in group_names])
+
+
+def rebuild_tag_classes(conn: sqlite3.Connection) -> int:
+    """
+    按当前规则重新分类所有标签名与标签组名（数量很少，启动时执行，规则修改后立即生效）
+    规则指纹与生成 customer_daily_adds 时不同则一并重建该表（其主键含分类，差量维护无法修正旧分类）
+    :return: 标签名数量
+    """
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT DISTINCT tag_name FROM customer_tag_links
+        WHERE tag_type = ? AND tag_name != ''
+    """, (TAG_TYPE_ENTERPRISE,))
+    names = [row[0] for row in cursor.fetchall()]
+    cursor.execute("""
+        SELECT DISTINCT group_name FROM customer_tag_links
+        WHERE tag_type = ? AND tag_name != '' AND group_name != ''
+    """, (TAG_TYPE_ENTERPRISE,))
+    group_names = [row[0] for row in cursor.fetchall()]
+    cursor.execute("DELETE FROM tag_classes")
+    cursor.execute("DELETE FROM tag_group_classes")
+    save_tag_classes(cursor, names, group_names)
+    conn.commit()
+
+    cursor.execute("SELECT value FROM index_meta WHERE key = 'tag_rules_fingerprint'")
+    row = cursor.fetchone()
+    if not row or row[0] != classifier.fingerprint:
+        cursor.execute("SELECT 1 FROM customer_daily_adds LIMIT 1")
+        if cursor.fetchone():
+            print("[数据库] 标签分类规则已变化，重建每日新增客户汇总表...")
+            total = rebuild_daily_adds(conn)
+            print(f"[数据库] 每日新增客户汇总表重建完成，共 {total} 条")
+        cursor.execute("""
+            INSERT INTO index_meta (key, value) VALUES ('tag_rules_fingerprint', ?)
+            ON CONFLICT(key) DO UPDATE SET value = excluded.value
+        """, (classifier.fingerprint,))
+        conn.commit()
+    return len(names)
+
+
+def tag_names_in_category(cursor, category: str) -> List[str]:
+    """属于某个增长分类的标签名"""
+    cursor.execute(
+        "SELECT tag_name FROM tag_classes WHERE category_mask & ? != 0",
+        (classifier.category_bit(category),)
+    )
+    return [row[0] for row in cursor.fetchall()]
+
+
+def tag_groups_in_category(cursor, category: str) -> List[str]:
+    """名称属于某个增长分类的标签组"""
+    cursor.execute(
+        "SELECT group_name FROM tag_group_classes WHERE category_mask & ? != 0",
+        (classifier.category_bit(category),)
+    )
+    return [row[0] for row in cursor.fetchall()]
+
+
+def category_customers_sql() -> str:
+    """拥有某增长分类标签的客户ID子查询，参数：[分类位]"""
+    return f"""
+        SELECT l.customer_id FROM customer_tag_links l
+        JOIN tag_classes tc ON tc.tag_name = l.tag_name
+        WHERE l.tag_type = {TAG_TYPE_ENTERPRISE} AND tc.category_mask & ? != 0
+    """
+
+
+# ========== 每日新增客户汇总 ==========
+# customer_daily_adds 表结构见 migrations v12
+
+# 不区分标签的全部客户
+TAG_CATEGORY_ALL = 'all'
+
+
+def add_day(add_time: int) -> str:
+    """添加时间戳对应的本地日期（与 SQLite date(..., 'localtime') 一致）"""
+    return datetime.fromtimestamp(add_time).strftime('%Y-%m-%d')
+
+
+def _daily_add_keys(add_time, owner_userid: str, tag_names) -> set:
+    if not add_time:
+        # 没有添加时间的客户不参与时间统计
+        return set()
+    day = add_day(add_time)
+    return {(TAG_CATEGORY_ALL, day, owner_userid)} | {
+        (category, day, owner_userid) for category in classifier.categories(tag_names)
+    }
+
+
+def _daily_adds_delta(cursor, keys, delta: int):
+    if not keys:
+        return
+    cursor.executemany("""
+        INSERT INTO customer_daily_adds (tag_category, day, owner_userid, count) VALUES (?, ?, ?, ?)
+        ON CONFLICT(tag_category, day, owner_userid) DO UPDATE SET count = count + excluded.count
+    """, [key + (delta,) for key in keys])
+    if delta < 0:
+        cursor.executemany("""
+            DELETE FROM customer_daily_adds
+            WHERE tag_category = ? AND day = ? AND owner_userid = ? AND count <= 0
+        """, list(keys))
+
+
+def rebuild_daily_adds(conn: sqlite3.Connection) -> int:
+    """
+    根据 customers 与关联表全量重建 customer_daily_adds（用于首次上线或数据修复）
+    :return: 写入的统计行数
+    """
+    cursor = conn.cursor()
+    cursor.execute("DELETE FROM customer_daily_adds")
+    day_sql = "date(c.add_time, 'unixepoch', 'localtime')"
+    cursor.execute(f"""
+        INSERT INTO customer_daily_adds (tag_category, day, owner_userid, count)
+        SELECT ?, {day_sql}, COALESCE(c.owner_userid, ''), COUNT(*)
+        FROM customers c
+        WHERE c.add_time > 0
+        GROUP BY 2, 3
+    """, (TAG_CATEGORY_ALL,))
+    # 分类取自 tag_classes（需先执行 rebuild_tag_classes）
+    for category in classifier.growth_categories:
+        cursor.execute(f"""
+            INSERT INTO customer_daily_adds (tag_category, day, owner_userid, count)
+            SELECT ?, {day_sql}, COALESCE(c.owner_userid, ''), COUNT(*)
+            FROM customers c
+            WHERE c.add_time > 0 AND c.id IN ({category_customers_sql()})
+            GROUP BY 2, 3
+        """, (category, classifier.category_bit(category)))
+    cursor.execute("SELECT COUNT(*) FROM customer_daily_adds")
+    total = cursor.fetchone()[0]
+    conn.commit()
+    return total
+
+
+def ensure_daily_adds(conn: sqlite3.Connection):
+    """汇总表为空而客户表有数据时，自动回填一次"""
+    cursor = conn.cursor()
+    cursor.execute("SELECT 1 FROM customer_daily_adds LIMIT 1")
+    if cursor.fetchone():
+        return
+    cursor.execute("SELECT 1 FROM customers WHERE add_time > 0 LIMIT 1")
+    if not cursor.fetchone():
+        return
+    print("[数据库] 回填每日新增客户汇总表...")
+    total = rebuild_daily_adds(conn)
+    print(f"[数据库] 每日新增客户汇总表回填完成，共 {total} 条")
+
+
+def daily_adds_by_month(cursor, tag_category: str, start_day: str, end_day: str = None) -> Dict[str, int]:
+    """
+    按月汇总 [start_day, end_day] 内的新增客户数
+    :return: {'YYYY-MM': count}
+    """
+    sql = """
+        SELECT substr(day, 1, 7), SUM(count) FROM customer_daily_adds
+        WHERE tag_category = ? AND day >= ?
+    """
+    params = [tag_category, start_day]
+    if end_day:
+        sql += " AND day <= ?"
+        params.append(end_day)
+    cursor.execute(sql + " GROUP BY 1", params)
+    return {row[0]: row[1] for row in cursor.fetchall()}
+
+
+# ========== 标签组合统计 ==========
+# tag_combo_stats 表结构见 migrations v13
+
+# 统计的组合大小：两两组合、三标签组合
+TAG_COMBO_SIZES = (2, 3)
+
+
+def _tag_combos(tag_names) -> set:
+    combos = set()
+    names = sorted(tag_names)
+    for size in TAG_COMBO_SIZES:
+        for combo in combinations(names, size):
+            combos.add((size,) + combo + ('',) * (3 - size))
+    return combos
+
+
+def _tag_combo_delta(cursor, combos, delta: int):
+    if not combos:
+        return
+    cursor.executemany("""
+        INSERT INTO tag_combo_stats (size, tag_a, tag_b, tag_c, customer_count) VALUES (?, ?, ?, ?, ?)
+        ON CONFLICT(size, tag_a, tag_b, tag_c) DO UPDATE SET customer_count = customer_count + excluded.customer_count
+    """, [combo + (delta,) for combo in combos])
+    if delta < 0:
+        cursor.executemany("""
+            DELETE FROM tag_combo_stats
+            WHERE size = ? AND tag_a = ? AND tag_b = ? AND tag_c = ? AND customer_count <= 0
+        """, list(combos))
+
+
+def rebuild_tag_combo_stats(conn: sqlite3.Connection) -> int:
+    """
+    根据关联表全量重建 tag_combo_stats（用于首次上线或数据修复）
+    :return: 写入的统计行数
+    """
+    cursor = conn.cursor()
+    cursor.execute("DELETE FROM tag_combo_stats")
+    # 同一客户可能有多个同名标签（不同分组），先按 (客户, 标签名) 去重
+    names_sql = f"""
+        SELECT DISTINCT customer_id, tag_name FROM customer_tag_links
+        WHERE tag_type = {TAG_TYPE_ENTERPRISE} AND tag_name != ''
+    """
+    cursor.execute(f"""
+        WITH names AS ({names_sql})
+        INSERT INTO tag_combo_stats (size, tag_a, tag_b, tag_c, customer_count)
+        SELECT 2, a.tag_name, b.tag_name, '', COUNT(*)
+        FROM names a
+        JOIN names b ON b.customer_id = a.customer_id AND b.tag_name > a.tag_name
+        GROUP BY a.tag_name, b.tag_name
+    """)
+    cursor.execute(f"""
+        WITH names AS ({names_sql})
+        INSERT INTO tag_combo_stats (size, tag_a, tag_b, tag_c, customer_count)
+        SELECT 3, a.tag_name, b.tag_name, c.tag_name, COUNT(*)
+        FROM names a
+        JOIN names b ON b.customer_id = a.customer_id AND b.tag_name > a.tag_name
+        JOIN names c ON c.customer_id = a.customer_id AND c.tag_name > b.tag_name
+        GROUP BY a.tag_name, b.tag_name, c.tag_name
+    """)
+    cursor.execute("SELECT COUNT(*) FROM tag_combo_stats")
+    total = cursor.fetchone()[0]
+    conn.commit()
+    return total
+
+
+def ensure_tag_combo_stats(conn: sqlite3.Connection):
+    """组合统计表为空而关联表有数据时，自动回填一次"""
+    cursor = conn.cursor()
+    cursor.execute("SELECT 1 FROM tag_combo_stats LIMIT 1")
+    if cursor.fetchone():
+        return
+    cursor.execute("SELECT 1 FROM customer_tag_links WHERE tag_type = ? LIMIT 1", (TAG_TYPE_ENTERPRISE,))
+    if not cursor.fetchone():
+        return
+    print("[数据库] 回填标签组合统计表...")
+    total = rebuild_tag_combo_stats(conn)
+    print(f"[数据库] 标签组合统计表回填完成，共 {total} 条")
+
+
+def top_tag_combos(cursor, size: int, limit: int) -> List[Tuple[List[str], int]]:
+    """客户数最多的标签组合 [([标签名...], 客户数), ...]"""
+    cursor.execute("""
+        SELECT tag_a, tag_b, tag_c, customer_count FROM tag_combo_stats
+        WHERE size = ? AND customer_count > 0
+        ORDER BY customer_count DESC
+        LIMIT ?
+    """, (size, limit))
+    return [([a, b, c][:size], count) for a, b, c, count in cursor.fetchall()]
+
+
+# ========== 全文搜索索引 ==========
+
+# 参与搜索的客户字段（顺序即 highlight() 的列号）
+SEARCH_COLUMNS = ['name', 'remark', 'corp_name', 'description']
+
+# trigram 分词至少需要 3 个字符，更短的关键词回退到 LIKE
+FTS_MIN_QUERY_LENGTH = 3
+
+
+def _customer_columns(cursor) -> set:
+    cursor.execute("PRAGMA table_info(customers)")
+    return {row[1] for row in cursor.fetchall()}
+
+
+def init_search_index(cursor) -> bool:
+    """
+    创建客户全文搜索索引（FTS5 trigram，中文子串可直接命中）
+    外部内容表指向 customers，由触发器保持同步，不重复存储文本
+    :return: 是否可用
+    """
+    missing = [c for c in SEARCH_COLUMNS if c not in _customer_columns(cursor)]
+    if missing:
+        print(f"[数据库] customers 表缺少字段 {missing}，跳过全文搜索索引")
+        return False
+
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'customers_fts'")
+    exists = cursor.fetchone() is not None
+
+    columns = ', '.join(SEARCH_COLUMNS)
+    new_values = ', '.join(f"new.{c}" for c in SEARCH_COLUMNS)
+    old_values = ', '.join(f"old.{c}" for c in SEARCH_COLUMNS)
+
+    try:
+        cursor.execute(f"""
+            CREATE VIRTUAL TABLE IF NOT EXISTS customers_fts USING fts5(
+                {columns},
+                content='customers', content_rowid='rowid',
+                tokenize='trigram'
+            )
+        """)
+    except sqlite3.OperationalError as e:
+        # SQLite < 3.34 没有 trigram 分词器
+        print(f"[数据库] 全文搜索索引不可用: {e}")
+        return False
+
+    cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS customers_fts_ai AFTER INSERT ON customers BEGIN
+            INSERT INTO customers_fts(rowid, {columns}) VALUES (new.rowid, {new_values});
+        END
+    """)
+    cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS customers_fts_ad AFTER DELETE ON customers BEGIN
+            INSERT INTO customers_fts(customers_fts, rowid, {columns}) VALUES ('delete', old.rowid, {old_values});
+        END
+    """)
+    cursor.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS customers_fts_au AFTER UPDATE OF {columns} ON customers BEGIN
+            INSERT INTO customers_fts(customers_fts, rowid, {columns}) VALUES ('delete', old.rowid, {old_values});
+            INSERT INTO customers_fts(rowid, {columns}) VALUES (new.rowid, {new_values});
+        END
+    """)
+
+    if not exists:
+        print("[数据库] 构建客户全文搜索索引...")
+        rebuild_search_index(cursor)
+    return True
+
+
+def rebuild_search_index(cursor):
+    """从 customers 表重建全文索引（VACUUM 之后 rowid 可能变化，需要重建）"""
+    cursor.execute("INSERT INTO customers_fts(customers_fts) VALUES ('rebuild')")
+
+
+def search_index_available(cursor) -> bool:
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'customers_fts'")
+    return cursor.fetchone() is not None
+
+
+def fts_phrase(search: str) -> str:
+    """把用户输入包装成 FTS 短语，避免引号、AND/OR 等被当作查询语法"""
+    return '"' + search.replace('"', '""') + '"'
+
+
+def use_fts(cursor, search: str) -> bool:
+    return len(search) >= FTS_MIN_QUERY_LENGTH and search_index_available(cursor)
+
+
+def search_filter(cursor, search: str, prefix: str = "") -> Tuple[str, List]:
+    """
+    客户关键词搜索条件（姓名/备注/企业名称/描述）
+    :param prefix: 表别名前缀，如 "c."
+    :return: (where 子句, 参数)
+    """
+    if use_fts(cursor, search):
+        clause = f"{prefix}rowid IN (SELECT rowid FROM customers_fts WHERE customers_fts MATCH ?)"
+        return clause, [fts_phrase(search)]
+
+    # 短关键词：trigram 无法命中，回退到子串匹配
+    columns = [c for c in SEARCH_COLUMNS if c in _customer_columns(cursor)]
+    clause = "(" + " OR ".join(f"{prefix}{c} LIKE ?" for c in columns) + ")"
+    return clause, [f"%{search}%"] * len(columns)
+
+
+def search_ranked_sql(where_sql: str) -> str:
+    """
+    按相关度排序的客户查询（bm25，越相关越靠前，同分按添加时间倒序）
+    参数顺序：[MATCH 短语] + where 参数 + [limit, offset]
+    """
+    return f"""
+        WITH matched AS (
+            SELECT rowid AS rid, rank FROM customers_fts WHERE customers_fts MATCH ?
+        )
+        SELECT customers.* FROM matched
+        JOIN customers ON customers.rowid = matched.rid
+        WHERE {where_sql}
+        ORDER BY matched.rank, customers.add_time DESC, customers.id DESC
+        LIMIT ? OFFSET ?
+    """
+
+
+def search_highlights(cursor, search: str, customer_ids: List[str],
+                      open_tag: str = '<mark>', close_tag: str = '</mark>') -> Dict[str, Dict]:
+    """
+    为当前页客户生成命中高亮
+    :return: {customer_id: {'name': '...<mark>关键词</mark>...', ...}}，只包含命中的字段
+    """
+    if not search or not customer_ids:
+        return {}
+
+    highlights = {}
+    if use_fts(cursor, search):
+        placeholders = ','.join(['?'] * len(customer_ids))
+        columns_sql = ', '.join(
+            f"highlight(customers_fts, {i}, ?, ?)" for i in range(len(SEARCH_COLUMNS))
+        )
+        cursor.execute(f"""
+            SELECT c.id, {columns_sql}
+            FROM customers_fts
+            JOIN customers c ON c.rowid = customers_fts.rowid
+            WHERE customers_fts MATCH ? AND c.id IN ({placeholders})
+        """, [open_tag, close_tag] * len(SEARCH_COLUMNS) + [fts_phrase(search)] + list(customer_ids))
+        for row in cursor.fetchall():
+            highlights[row[0]] = {
+                column: value
+                for column, value in zip(SEARCH_COLUMNS, row[1:])
+                if value and open_tag in value
+            }
+        return highlights
+
+    # 短关键词回退：直接在 Python 里标记
+    placeholders = ','.join(['?'] * len(customer_ids))
+    columns = [c for c in SEARCH_COLUMNS if c in _customer_columns(cursor)]
+    cursor.execute(
+        f"SELECT id, {', '.join(columns)} FROM customers WHERE id IN ({placeholders})",
+        list(customer_ids)
+    )
+    for row in cursor.fetchall():
+        highlights[row[0]] = {
+            column: value.replace(search, f"{open_tag}{search}{close_tag}")
+            for column, value in zip(columns, row[1:])
+            if value and search in value
+        }
+    return highlights
+
+
+# ========== 查询条件构造 ==========
+
+def tag_id_filter(tag_ids: List[str], column: str = "id") -> Tuple[str, List]:
+    """
+    客户拥有任一指定企业标签ID（精确匹配，走 idx_tag_links_tag_id）
+    :return: (where 子句, 参数)
+    """
+    placeholders = ','.join(['?'] * len(tag_ids))
+    clause = f"""{column} IN (
+        SELECT customer_id FROM customer_tag_links
+        WHERE tag_id IN ({placeholders}) AND tag_type = {TAG_TYPE_ENTERPRISE}
+    )"""
+    return clause, list(tag_ids)
+
+
+def tag_name_prefix_filter(prefixes: List[str], column: str = "id") -> Tuple[str, List]:
+    """
+    客户拥有以任一前缀开头的企业标签（如省份"四川" 匹配 "四川"、"四川省"）
+    使用范围条件代替 LIKE，可直接走 idx_tag_links_tag_name
+    """
+    conditions = []
+    params = []
+    for prefix in prefixes:
+        conditions.append("(tag_name >= ? AND tag_name < ?)")
+        params.extend([prefix, prefix + '\U0010ffff'])
+    clause = f"""{column} IN (
+        SELECT customer_id FROM customer_tag_links
+        WHERE tag_type = {TAG_TYPE_ENTERPRISE} AND ({' OR '.join(conditions)})
+    )"""
+    return clause, params
+
+
+def tag_name_keyword_filter(keywords: List[str], column: str = "id") -> Tuple[str, List]:
+    """
+    客户拥有名称包含任一关键词的企业标签（用户属性：用户/客户/代理商...）
+    只扫描关联表的覆盖索引，不再解析 JSON，也不会误命中标签ID
+    """
+    conditions = ' OR '.join(["instr(tag_name, ?) > 0"] * len(keywords))
+    clause = f"""{column} IN (
+        SELECT customer_id FROM customer_tag_links
+        WHERE tag_type = {TAG_TYPE_ENTERPRISE} AND ({conditions})
+    )"""
+    return clause, list(keywords)
@@ -0,0 +1,339 @@
+"""
+客户列式快照
+把画像分析用到的几列（添加时间、负责员工、性别、添加方式、企业标签）按列存成 NumPy 数组，
+企业标签存成 CSR 稀疏矩阵（tag_indptr/tag_indices），分组计数和筛选都是向量化运算。
+
+客户序号与位图索引一致（customers.rowid 顺序，新客户追加在末尾）。
+首次查询时全量构建；之后按 updated_at 增量刷新：同步结束时主动刷新一次，
+查询时发现数据版本号（query_cache.current_generation）变化也会刷新。
+"""
+import threading
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+import customer_index
+from database import get_connection
+from query_cache import current_generation
+from tag_classifier import classifier
+
+# 一次增量刷新超过该比例的客户变化时直接全量重建
+FULL_REBUILD_RATIO = 0.2
+
+# IN (...) 每批的参数个数（低版本 SQLite 上限 999）
+_BATCH_SIZE = 500
+
+# 空值/缺失在整数列中的编码
+NULL_CODE = -1
+
+
+class CustomerSnapshot:
+    """customers 表的内存列式快照"""
+
+    def __init__(self, db_path: Optional[str] = None):
+        self.db_path = db_path
+        self._lock = threading.RLock()
+        self._built = False
+        self._building = False
+        self._building_lock = threading.Lock()
+        self._generation = None
+        self._watermark = 0
+
+        self._ids: List[str] = []
+        self._ordinals: Dict[str, int] = {}
+
+        # 员工与标签的字典编码
+        self._owner_ids: List[str] = []
+        self._owner_names: List[str] = []
+        self._owner_codes: Dict[str, int] = {}
+        self._tag_names: List[str] = []
+        self._tag_codes: Dict[str, int] = {}
+        self._tag_masks = np.zeros(0, dtype=np.int64)
+
+        # 按客户序号排列的列
+        self.add_time = np.zeros(0, dtype=np.int64)
+        self.owner = np.zeros(0, dtype=np.int32)
+        self.gender = np.zeros(0, dtype=np.int32)
+        self.add_way = np.zeros(0, dtype=np.int32)
+        self.category_mask = np.zeros(0, dtype=np.int64)
+        self.tag_indptr = np.zeros(1, dtype=np.int64)
+        self.tag_indices = np.zeros(0, dtype=np.int32)
+
+    # ---------- 编码 ----------
+
+    def _owner_code(self, owner_userid: Optional[str], owner_name: Optional[str]) -> int:
+        if not owner_userid:
+            return NULL_CODE
+        code = self._owner_codes.get(owner_userid)
+        if code is None:
+            code = len(self._owner_ids)
+            self._owner_codes[owner_userid] = code
+            self._owner_ids.append(owner_userid)
+            self._owner_names.append(owner_name or '')
+        elif owner_name and owner_name > self._owner_names[code]:
+            # 与 SQL 的 MAX(owner_name) 保持一致
+            self._owner_names[code] = owner_name
+        return code
+
+    def _tag_code(self, tag_name: str) -> int:
+        code = self._tag_codes.get(tag_name)
+        if code is None:
+            code = len(self._tag_names)
+            self._tag_codes[tag_name] = code
+            self._tag_names.append(tag_name)
+        return code
+
+    def _sync_tag_masks(self):
+        """新出现的标签补上增长分类位掩码"""
+        known = len(self._tag_masks)
+        if known < len(self._tag_names):
+            extra = [classifier.classify(name).category_mask for name in self._tag_names[known:]]
+            self._tag_masks = np.concatenate([self._tag_masks, np.array(extra, dtype=np.int64)])
+
+    @staticmethod
+    def _nullable(value) -> int:
+        return NULL_CODE if value is None else value
+
+    def _fetch_tags(self, cursor, customer_ids: Optional[List[str]] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """读取企业标签关联，返回 (客户序号, 标签编码) 两列；customer_ids 为 None 时读取全部"""
+        sql = """
+            SELECT customer_id, tag_name FROM customer_tag_links
+            WHERE tag_type = ? AND tag_name != ''
+        """
+        if customer_ids is None:
+            cursor.execute(sql, (customer_index.TAG_TYPE_ENTERPRISE,))
+            pairs = cursor.fetchall()
+        else:
+            pairs = []
+            for start in range(0, len(customer_ids), _BATCH_SIZE):
+                batch = customer_ids[start:start + _BATCH_SIZE]
+                placeholders = ','.join(['?'] * len(batch))
+                cursor.execute(
+                    f"{sql} AND customer_id IN ({placeholders})",
+                    [customer_index.TAG_TYPE_ENTERPRISE] + batch
+                )
+                pairs.extend(cursor.fetchall())
+
+        rows, codes = [], []
+        for customer_id, tag_name in pairs:
+            pos = self._ordinals.get(customer_id)
+            if pos is None:
+                continue
+            rows.append(pos)
+            codes.append(self._tag_code(tag_name))
+        return np.array(rows, dtype=np.int64), np.array(codes, dtype=np.int64)
+
+    def _set_tags(self, rows: np.ndarray, codes: np.ndarray):
+        """由 (客户序号, 标签编码) 对生成 CSR 矩阵与每个客户的增长分类位掩码"""
+        n = len(self._ids)
+        width = max(len(self._tag_names), 1)
+        # 同一客户的重复标签只算一次，np.unique 同时按 (序号, 标签) 排好序
+        keys = np.unique(rows * width + codes)
+        rows = keys // width
+        self.tag_indices = (keys % width).astype(np.int32)
+        self.tag_indptr = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(np.bincount(rows, minlength=n), out=self.tag_indptr[1:])
+
+        self._sync_tag_masks()
+        mask = np.zeros(n, dtype=np.int64)
+        starts = self.tag_indptr[:-1]
+        nonempty = self.tag_indptr[1:] > starts
+        if self.tag_indices.size:
+            mask[nonempty] = np.bitwise_or.reduceat(self._tag_masks[self.tag_indices], starts[nonempty])
+        self.category_mask = mask
+
+    # ---------- 构建与刷新 ----------
+
+    def build(self):
+        """从 customers / customer_tag_links 全量构建"""
+        with self._lock:
+            generation = current_generation()
+            conn = get_connection(self.db_path)
+            try:
+                cursor = conn.cursor()
+                self._owner_ids, self._owner_names, self._owner_codes = [], [], {}
+                self._tag_names, self._tag_codes = [], {}
+                self._tag_masks = np.zeros(0, dtype=np.int64)
+
+                cursor.execute("""
+                    SELECT id, add_time, owner_userid, owner_name, gender, add_way, updated_at
+                    FROM customers ORDER BY rowid
+                """)
+                rows = cursor.fetchall()
+                self._ids = [row[0] for row in rows]
+                self._ordinals = {customer_id: i for i, customer_id in enumerate(self._ids)}
+                self.add_time = np.array([row[1] or 0 for row in rows], dtype=np.int64)
+                self.owner = np.array([self._owner_code(row[2], row[3]) for row in rows], dtype=np.int32)
+                self.gender = np.array([self._nullable(row[4]) for row in rows], dtype=np.int32)
+                self.add_way = np.array([self._nullable(row[5]) for row in rows], dtype=np.int32)
+                self._watermark = max((row[6] or 0 for row in rows), default=0)
+
+                self._set_tags(*self._fetch_tags(cursor))
+            finally:
+                conn.close()
+
+            self._generation = generation
+            self._built = True
+        print(f"[列式快照] 构建完成：{len(self._ids)} 个客户，{len(self._tag_names)} 个标签")
+
+    def refresh(self):
+        """增量刷新 updated_at 不早于上次水位的客户；未构建时不做任何事"""
+        with self._lock:
+            if not self._built:
+                return
+            generation = current_generation()
+            conn = get_connection(self.db_path)
+            try:
+                cursor = conn.cursor()
+                # 水位所在的这一秒可能还有后续写入，用 >= 重新读取
+                cursor.execute("""
+                    SELECT id, add_time, owner_userid, owner_name, gender, add_way, updated_at
+                    FROM customers WHERE updated_at >= ? ORDER BY rowid
+                """, (self._watermark,))
+                changed = cursor.fetchall()
+
+                if len(changed) > max(len(self._ids) * FULL_REBUILD_RATIO, _BATCH_SIZE):
+                    conn.close()
+                    conn = None
+                    self.build()
+                    return
+
+                old_count = len(self._ids)
+                patched = []
+                new_rows = []
+                for row in changed:
+                    pos = self._ordinals.get(row[0])
+                    if pos is None:
+                        self._ordinals[row[0]] = len(self._ids)
+                        self._ids.append(row[0])
+                        new_rows.append(row)
+                    else:
+                        patched.append((pos, row))
+                    self._watermark = max(self._watermark, row[6] or 0)
+
+                for pos, row in patched:
+                    self.add_time[pos] = row[1] or 0
+                    self.owner[pos] = self._owner_code(row[2], row[3])
+                    self.gender[pos] = self._nullable(row[4])
+                    self.add_way[pos] = self._nullable(row[5])
+                if new_rows:
+                    self.add_time = np.concatenate([self.add_time, np.array(
+                        [row[1] or 0 for row in new_rows], dtype=np.int64)])
+                    self.owner = np.concatenate([self.owner, np.array(
+                        [self._owner_code(row[2], row[3]) for row in new_rows], dtype=np.int32)])
+                    self.gender = np.concatenate([self.gender, np.array(
+                        [self._nullable(row[4]) for row in new_rows], dtype=np.int32)])
+                    self.add_way = np.concatenate([self.add_way, np.array(
+                        [self._nullable(row[5]) for row in new_rows], dtype=np.int32)])
+
+                if changed:
+                    # 保留未变化客户的标签，变化客户的标签整体替换
+                    dirty = np.zeros(len(self._ids), dtype=bool)
+                    dirty[[self._ordinals[row[0]] for row in changed]] = True
+                    old_rows = np.repeat(np.arange(old_count, dtype=np.int64), np.diff(self.tag_indptr))
+                    keep = ~dirty[old_rows]
+                    new_pos, new_codes = self._fetch_tags(cursor, [row[0] for row in changed])
+                    self._set_tags(
+                        np.concatenate([old_rows[keep], new_pos]),
+                        np.concatenate([self.tag_indices[keep].astype(np.int64), new_codes])
+                    )
+            finally:
+                if conn is not None:
+                    conn.close()
+
+            self._generation = generation
+        if changed:
+            print(f"[列式快照] 增量刷新：{len(patched)} 个客户更新，{len(new_rows)} 个客户新增")
+
+    @property
+    def built(self) -> bool:
+        return self._built
+
+    def build_in_background(self):
+        """未构建时在后台线程构建，调用方不等待（同一时间只有一个构建线程）"""
+        with self._building_lock:
+            if self._built or self._building:
+                return
+            self._building = True
+
+        def run():
+            try:
+                self.ensure_fresh()
+            except Exception as e:
+                print(f"[列式快照] 后台构建失败: {e}")
+            finally:
+                with self._building_lock:
+                    self._building = False
+
+        threading.Thread(target=run, name="customer-snapshot-build", daemon=True).start()
+
+    def ensure_fresh(self):
+        """查询前调用：未构建则全量构建，数据版本号变化则增量刷新"""
+        if self._built and self._generation == current_generation():
+            return
+        with self._lock:
+            if not self._built:
+                self.build()
+            elif self._generation != current_generation():
+                self.refresh()
+
+    # ---------- 查询 ----------
+
+    @staticmethod
+    def _value_counts(column: np.ndarray) -> Dict[int, int]:
+        # 取值都是较小的非负整数，整体 +1 后空值落在 0 号桶，bincount 一遍计数
+        counts = np.bincount(column + 1)
+        return {int(value) - 1: int(counts[value]) for value in np.flatnonzero(counts[1:]) + 1}
+
+    def add_way_counts(self) -> Dict[int, int]:
+        """{添加方式: 客户数}（不含空值）"""
+        self.ensure_fresh()
+        with self._lock:
+            return self._value_counts(self.add_way)
+
+    def gender_counts(self) -> Dict[int, int]:
+        """{性别: 客户数}（不含空值）"""
+        self.ensure_fresh()
+        with self._lock:
+            return self._value_counts(self.gender)
+
+    def _owner_bincount(self, weights: Optional[np.ndarray] = None) -> np.ndarray:
+        """按员工编码计数（weights 为布尔数组时只计 True 的客户）"""
+        # 空员工编码为 -1，+1 后落在 0 号桶并丢弃
+        return np.bincount(self.owner + 1, weights=weights,
+                           minlength=len(self._owner_ids) + 1)[1:].astype(np.int64)
+
+    def owner_ranking(self, category_bit: int = 0, limit: int = 20) -> List[Tuple[str, str, int]]:
+        """按负责员工计数的前 limit 名 [(userid, 姓名, 客户数)]；category_bit 非 0 时只统计该增长分类的客户"""
+        self.ensure_fresh()
+        with self._lock:
+            counts = self._owner_bincount((self.category_mask & category_bit) != 0 if category_bit else None)
+            top = np.argsort(-counts, kind='stable')[:limit]
+            return [
+                (self._owner_ids[code], self._owner_names[code], int(counts[code]))
+                for code in top if counts[code] > 0
+            ]
+
+    def owner_counts(self, since: Optional[int] = None) -> Dict[str, int]:
+        """{负责员工: 客户数}；since 给定时只统计 add_time >= since 的客户"""
+        self.ensure_fresh()
+        with self._lock:
+            counts = self._owner_bincount(self.add_time >= since if since is not None else None)
+            return {self._owner_ids[code]: int(counts[code]) for code in np.flatnonzero(counts)}
+
+    def filter_page(self, column: str, values: List[int], offset: int = 0,
+                    limit: Optional[int] = None) -> Tuple[int, List[str]]:
+        """某列取值属于 values 的客户：返回 (总数, 第 offset 个起的 limit 个客户ID)"""
+        self.ensure_fresh()
+        with self._lock:
+            data = getattr(self, column)
+            selected = np.zeros(len(data), dtype=bool)
+            for value in values:
+                selected |= data == value
+            positions = np.flatnonzero(selected)
+            end = None if limit is None else offset + limit
+            return len(positions), [self._ids[pos] for pos in positions[offset:end]]
+
+
+# 全局实例
+snapshot = CustomerSnapshot()
@@ -13,6 +13,10 @@ from fastapi import APIRouter, HTTPException, Header, File, UploadFile, Depends
 from pydantic import BaseModel
 import sqlite3
 
+from database import get_connection, offload
+import fast_json
+from fast_json import FastJSONResponse
+
 # Excel 处理
 try:
     from openpyxl import load_workbook
@@ -52,8 +56,7 @@ class DataPushRequest(BaseModel):
 
 def get_db():
     """获取数据库连接"""
-    from config import DB_PATH
-    conn = sqlite3.connect(DB_PATH)
+    conn = get_connection()
     conn.row_factory = sqlite3.Row
     return conn
 
@@ -628,18 +631,19 @@ def get_records(
             item = dict(row)
             # 解析 JSON 数据
             if item.get('raw_data'):
-                item['raw_data'] = json.loads(item['raw_data'])
+                item['raw_data'] = fast_json.loads(item['raw_data'])
             records.append(item)
         
         conn.close()
         
-        return {
+        # 原始数据可能很大，直接序列化，跳过 jsonable_encoder 的逐字段遍历
+        return FastJSONResponse({
             "code": 0,
             "data": records,
             "total": total,
             "page": page,
             "limit": limit
-        }
+        })
         
     except Exception as e:
         return {"code": 1, "message": f"查询失败：{str(e)}"}
@@ -715,7 +719,8 @@ def get_stats(source_id: str, days: int = 7):
 
 
 @router.post("/{source_id}/import-excel")
-async def import_excel(
+@offload
+def import_excel(
     source_id: str,
     file: UploadFile = File(...),
     incremental: bool = False
@@ -743,7 +748,7 @@ async def import_excel(
         source_dict = dict(source)
         
         # 读取 Excel 文件
-        content = await file.read()
+        content = file.file.read()
         
         # 使用 openpyxl 读取（不使用只读模式以支持更多属性）
         try:
@@ -1049,7 +1054,7 @@ def query_records(
             
             # 解析 raw_data
             try:
-                raw_data = json.loads(record_dict['raw_data'])
+                raw_data = fast_json.loads(record_dict['raw_data'])
             except:
                 raw_data = {}
             
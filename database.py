@@ -0,0 +1,188 @@
+"""
+数据库连接层
+所有路由和同步服务共用的 SQLite 连接池：
+- 启用 WAL，读请求不再被同步写入阻塞
+- 每个线程缓存一个空闲连接，避免每次请求都重新打开数据库
+- 同时借出的连接数有上限，超出时等待，超时抛出 sqlite3.OperationalError
+- async 路由通过 run_blocking / offload 把同步的数据库和企业微信调用放到专用线程池，不阻塞事件循环
+"""
+import os
+import asyncio
+import functools
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Optional
+
+from config import (
+    DB_PATH, DB_POOL_SIZE, DB_POOL_TIMEOUT,
+    DB_BUSY_TIMEOUT, DB_CACHE_SIZE, DB_MMAP_SIZE, DB_EXECUTOR_WORKERS
+)
+from fast_json import FastJSONResponse
+
+
+def configure_connection(conn: sqlite3.Connection):
+    """为新连接设置 PRAGMA"""
+    cursor = conn.cursor()
+    # journal_mode 是持久化的，内存库会返回 memory，忽略即可
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute(f"PRAGMA busy_timeout={int(DB_BUSY_TIMEOUT)}")
+    cursor.execute(f"PRAGMA cache_size={int(DB_CACHE_SIZE)}")
+    cursor.execute(f"PRAGMA mmap_size={int(DB_MMAP_SIZE)}")
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.close()
+
+
+class PooledConnection:
+    """
+    连接池借出的连接
+    用法与 sqlite3.Connection 相同，close() 时归还连接池而不是真正关闭
+    """
+
+    __slots__ = ("_pool", "_conn", "_owner")
+
+    def __init__(self, pool: "ConnectionPool", conn: sqlite3.Connection):
+        object.__setattr__(self, "_pool", pool)
+        object.__setattr__(self, "_conn", conn)
+        object.__setattr__(self, "_owner", threading.get_ident())
+
+    def __getattr__(self, name):
+        conn = object.__getattribute__(self, "_conn")
+        if conn is None:
+            raise sqlite3.ProgrammingError("Cannot operate on a closed database.")
+        return getattr(conn, name)
+
+    def __setattr__(self, name, value):
+        # row_factory / text_factory / isolation_level 直接设置到底层连接
+        setattr(self._conn, name, value)
+
+    def __enter__(self):
+        # 与 sqlite3.Connection 一致：with 块只管理事务，不关闭连接
+        self._conn.__enter__()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return self._conn.__exit__(exc_type, exc, tb)
+
+    def close(self):
+        """归还连接（未提交的事务会被回滚，与关闭连接的语义一致）"""
+        conn = object.__getattribute__(self, "_conn")
+        if conn is None:
+            return
+        object.__setattr__(self, "_conn", None)
+        self._pool._release(conn, self._owner)
+
+    def __del__(self):
+        # 异常路径上忘记 close() 的连接，在被回收时归还，避免占满连接池
+        try:
+            self.close()
+        except Exception:
+            pass
+
+
+class ConnectionPool:
+    """有界的按线程连接池"""
+
+    def __init__(self, db_path: str, max_connections: int = DB_POOL_SIZE,
+                 timeout: float = DB_POOL_TIMEOUT):
+        self.db_path = db_path
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(max(1, max_connections))
+        self._local = threading.local()
+
+    def _connect(self) -> sqlite3.Connection:
+        db_dir = os.path.dirname(self.db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+        # 连接只在借出它的线程内使用；关闭允许跨线程（连接对象可能在其他线程被回收）
+        conn = sqlite3.connect(
+            self.db_path,
+            timeout=DB_BUSY_TIMEOUT / 1000,
+            check_same_thread=False
+        )
+        configure_connection(conn)
+        return conn
+
+    def acquire(self, row_factory=None) -> PooledConnection:
+        """借出一个连接"""
+        if not self._slots.acquire(timeout=self.timeout):
+            raise sqlite3.OperationalError("数据库连接池已满，请稍后重试")
+        try:
+            conn = getattr(self._local, "conn", None)
+            self._local.conn = None
+            if conn is None:
+                conn = self._connect()
+            conn.row_factory = row_factory
+        except Exception:
+            self._slots.release()
+            raise
+        return PooledConnection(self, conn)
+
+    def _release(self, conn: sqlite3.Connection, owner: int):
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+            conn.row_factory = None
+            # 只有在借出线程内归还、且该线程没有缓存连接时才保留，其余直接关闭
+            if owner == threading.get_ident() and getattr(self._local, "conn", None) is None:
+                self._local.conn = conn
+            else:
+                conn.close()
+        except sqlite3.Error:
+            conn.close()
+        finally:
+            self._slots.release()
+
+
+_pools: Dict[str, ConnectionPool] = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(db_path: Optional[str] = None) -> ConnectionPool:
+    """获取（或创建）指定数据库文件的连接池"""
+    path = db_path or DB_PATH
+    pool = _pools.get(path)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.get(path)
+            if pool is None:
+                pool = ConnectionPool(path)
+                _pools[path] = pool
+    return pool
+
+
+def get_connection(db_path: Optional[str] = None, row_factory=None) -> PooledConnection:
+    """从连接池借出连接，用完调用 close() 归还"""
+    return get_pool(db_path).acquire(row_factory=row_factory)
+
+
+# ========== 异步访问 ==========
+
+_executor = ThreadPoolExecutor(max_workers=max(1, DB_EXECUTOR_WORKERS), thread_name_prefix="db")
+
+
+async def run_blocking(func: Callable, *args, **kwargs):
+    """在专用线程池中执行同步的数据访问函数并等待结果"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, functools.partial(func, *args, **kwargs))
+
+
+def _call_and_render(func: Callable, args: tuple, kwargs: dict):
+    result = func(*args, **kwargs)
+    if isinstance(result, (dict, list)):
+        # 在线程池中直接序列化，跳过 jsonable_encoder 逐字段转换
+        return FastJSONResponse(result)
+    return result
+
+
+def offload(func: Callable) -> Callable:
+    """
+    把同步的路由函数包装成 async 路由，函数体在专用线程池中执行
+    用法：放在 @app.get(...) 之下，FastAPI 通过 __wrapped__ 读取原函数的参数签名
+    返回 dict/list 时在线程池中用 FastJSONResponse 序列化
+    """
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        return await run_blocking(_call_and_render, func, args, kwargs)
+    return wrapper
@@ -14,6 +14,10 @@ from openpyxl.drawing.image import Image as XLImage
 from PIL import Image
 import sqlite3
 
+import customer_index
+import fast_json
+from database import get_connection
+
 # 添加方式映射
 ADD_WAY_MAP = {
     0: '未知',
@@ -143,7 +147,7 @@ class CustomerExporter:
         filters: Optional[Dict]
     ) -> List[Dict]:
         """查询客户数据"""
-        conn = sqlite3.connect(self.db_path)
+        conn = get_connection(self.db_path)
         conn.row_factory = sqlite3.Row
         cursor = conn.cursor()
         
@@ -173,9 +177,10 @@ class CustomerExporter:
                 params.append(filters['owner_userid'])
             
             if filters.get('search'):
-                where_clauses.append("(c.name LIKE ? OR c.remark LIKE ?)")
-                search_term = f"%{filters['search']}%"
-                params.extend([search_term, search_term])
+                # 走客户全文索引（关键词过短时自动回退到 LIKE）
+                clause, clause_params = customer_index.search_filter(cursor, filters['search'], prefix="c.")
+                where_clauses.append(clause)
+                params.extend(clause_params)
         
         if where_clauses:
             sql += " WHERE " + " AND ".join(where_clauses)
@@ -311,7 +316,7 @@ class CustomerExporter:
         if not tags_json:
             return ''
         try:
-            tags = json.loads(tags_json)
+            tags = fast_json.loads(tags_json)
             return ', '.join([tag.get('tag_name', '') for tag in tags if tag.get('tag_name')])
         except:
             return ''
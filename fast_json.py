@@ -0,0 +1,51 @@
+"""
+高性能 JSON 序列化
+优先使用 orjson（比标准库快数倍），未安装时回退到标准库 json，接口保持一致：
+- loads(): 解析 JSON 文本（标签、原始数据等 JSON 列）
+- dumps(): 序列化为 UTF-8 字节
+- FastJSONResponse: 全局默认响应类
+"""
+import json
+from typing import Any
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    orjson = None
+    ORJSON_AVAILABLE = False
+
+
+def loads(data) -> Any:
+    """解析 JSON（str 或 bytes）；格式错误时抛出 ValueError 子类，与标准库一致"""
+    if ORJSON_AVAILABLE:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def _default(obj):
+    # orjson 不认识的类型（Pydantic 模型、Decimal 等）交给 FastAPI 的编码器
+    return jsonable_encoder(obj)
+
+
+def dumps(obj: Any) -> bytes:
+    """序列化为 UTF-8 JSON 字节（中文不转义）"""
+    if ORJSON_AVAILABLE:
+        try:
+            return orjson.dumps(obj, default=_default, option=orjson.OPT_NON_STR_KEYS)
+        except orjson.JSONEncodeError:
+            # 超出 64 位的整数等 orjson 不支持的值，回退到标准库
+            pass
+    return json.dumps(
+        obj, default=_default, ensure_ascii=False, separators=(",", ":")
+    ).encode("utf-8")
+
+
+class FastJSONResponse(JSONResponse):
+    """使用 orjson 渲染的 JSON 响应"""
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
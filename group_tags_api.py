@@ -13,7 +13,9 @@ import json
 import uuid
 import threading
 
-from config import DB_PATH, API_TOKEN
+from config import API_TOKEN
+from database import get_connection, offload
+from query_cache import bump_generation
 
 # 创建路由器
 router = APIRouter()
@@ -47,7 +49,7 @@ class GroupTagModel(BaseModel):
 
 def get_all_group_tags():
     """获取所有标签组及其标签"""
-    conn = sqlite3.connect(DB_PATH)
+    conn = get_connection()
     conn.row_factory = sqlite3.Row
     cursor = conn.cursor()
     
@@ -96,7 +98,7 @@ def get_all_group_tags():
 
 def create_group_tag(group_data: GroupTagModel):
     """创建标签组"""
-    conn = sqlite3.connect(DB_PATH)
+    conn = get_connection()
     cursor = conn.cursor()
     
     # 生成 group_id
@@ -121,6 +123,7 @@ def create_group_tag(group_data: GroupTagModel):
             ''', (tag_id, group_id, tag.name, now, tag.order, now, now))
         
         conn.commit()
+        bump_generation()
         return {"success": True, "group_id": group_id}
     except Exception as e:
         conn.rollback()
@@ -130,7 +133,7 @@ def create_group_tag(group_data: GroupTagModel):
 
 def update_group_tag(group_id: str, group_data: GroupTagModel):
     """更新标签组"""
-    conn = sqlite3.connect(DB_PATH)
+    conn = get_connection()
     cursor = conn.cursor()
     now = int(time.time())
     
@@ -174,6 +177,7 @@ def update_group_tag(group_id: str, group_data: GroupTagModel):
             cursor.execute(f'DELETE FROM group_chat_tags WHERE id IN ({placeholders})', tuple(tags_to_delete))
         
         conn.commit()
+        bump_generation()
         return {"success": True}
     except Exception as e:
         conn.rollback()
@@ -183,7 +187,7 @@ def update_group_tag(group_id: str, group_data: GroupTagModel):
 
 def delete_group_tag(group_id: str):
     """删除标签组"""
-    conn = sqlite3.connect(DB_PATH)
+    conn = get_connection()
     cursor = conn.cursor()
     
     try:
@@ -193,6 +197,7 @@ def delete_group_tag(group_id: str):
         cursor.execute('DELETE FROM group_chat_tag_groups WHERE group_id = ?', (group_id,))
         
         conn.commit()
+        bump_generation()
         return {"success": True}
     except Exception as e:
         conn.rollback()
@@ -202,7 +207,7 @@ def delete_group_tag(group_id: str):
 
 def update_single_tag(group_id: str, tag_id: str, name: str, order: int):
     """更新单个标签"""
-    conn = sqlite3.connect(DB_PATH)
+    conn = get_connection()
     cursor = conn.cursor()
     now = int(time.time())
     
@@ -214,6 +219,7 @@ def update_single_tag(group_id: str, tag_id: str, name: str, order: int):
         ''', (name, order, now, tag_id, group_id))
         
         conn.commit()
+        bump_generation()
         return {"success": True}
     except Exception as e:
         conn.rollback()
@@ -223,12 +229,13 @@ def update_single_tag(group_id: str, tag_id: str, name: str, order: int):
 
 def delete_single_tag(group_id: str, tag_id: str):
     """删除单个标签"""
-    conn = sqlite3.connect(DB_PATH)
+    conn = get_connection()
     cursor = conn.cursor()
     
     try:
         cursor.execute('DELETE FROM group_chat_tags WHERE id = ? AND group_id = ?', (tag_id, group_id))
         conn.commit()
+        bump_generation()
         return {"success": True}
     except Exception as e:
         conn.rollback()
@@ -239,7 +246,8 @@ def delete_single_tag(group_id: str, tag_id: str):
 # ========== API 路由 ==========
 
 @router.get("/api/group-tags")
-async def get_group_tags(token: str = Depends(check_token)):
+@offload
+def get_group_tags(token: str = Depends(check_token)):
     """获取客户群标签列表"""
     try:
         tags = get_all_group_tags()
@@ -248,22 +256,26 @@ async def get_group_tags(token: str = Depends(check_token)):
         return {"success": False, "message": str(e)}
 
 @router.post("/api/group-tags")
-async def create_group_tag_api(group_data: GroupTagModel, token: str = Depends(check_token)):
+@offload
+def create_group_tag_api(group_data: GroupTagModel, token: str = Depends(check_token)):
     """创建标签组"""
     return create_group_tag(group_data)
 
 @router.put("/api/group-tags/{group_id}")
-async def update_group_tag_api(group_id: str, group_data: GroupTagModel, token: str = Depends(check_token)):
+@offload
+def update_group_tag_api(group_id: str, group_data: GroupTagModel, token: str = Depends(check_token)):
     """更新标签组"""
     return update_group_tag(group_id, group_data)
 
 @router.delete("/api/group-tags/{group_id}")
-async def delete_group_tag_api(group_id: str, token: str = Depends(check_token)):
+@offload
+def delete_group_tag_api(group_id: str, token: str = Depends(check_token)):
     """删除标签组"""
     return delete_group_tag(group_id)
 
 @router.put("/api/group-tags/{group_id}/tags/{tag_id}")
-async def update_tag_api(
+@offload
+def update_tag_api(
     group_id: str, 
     tag_id: str,
     data: dict,
@@ -275,7 +287,8 @@ async def update_tag_api(
     return update_single_tag(group_id, tag_id, name, order)
 
 @router.delete("/api/group-tags/{group_id}/tags/{tag_id}")
-async def delete_tag_api(group_id: str, tag_id: str, token: str = Depends(check_token)):
+@offload
+def delete_tag_api(group_id: str, tag_id: str, token: str = Depends(check_token)):
     """删除单个标签"""
     return delete_single_tag(group_id, tag_id)
 
@@ -303,7 +316,7 @@ def sync_group_tags_task(task_id: str):
         print(f"[客户群标签] 提示：本系统使用自建标签，标签由用户手动创建管理")
         
         # 检查数据库中是否有标签
-        conn = sqlite3.connect(DB_PATH)
+        conn = get_connection()
         cursor = conn.cursor()
         
         with sync_tasks_lock:
@@ -381,10 +394,11 @@ async def stop_sync_task(task_id: str, token: str = Depends(check_token)):
 # ========== 客户群标签关联管理 ==========
 
 @router.post("/api/group-chats/{chat_id}/tags")
-async def add_tags_to_group(chat_id: str, tag_ids: List[str], token: str = Depends(check_token)):
+@offload
+def add_tags_to_group(chat_id: str, tag_ids: List[str], token: str = Depends(check_token)):
     """给客户群添加标签"""
     try:
-        conn = sqlite3.connect(DB_PATH)
+        conn = get_connection()
         cursor = conn.cursor()
         
         added = 0
@@ -400,6 +414,7 @@ async def add_tags_to_group(chat_id: str, tag_ids: List[str], token: str = Depen
                 print(f"[群标签] 添加标签失败: {e}")
         
         conn.commit()
+        bump_generation()
         conn.close()
         
         return {
@@ -410,10 +425,11 @@ async def add_tags_to_group(chat_id: str, tag_ids: List[str], token: str = Depen
         return {"success": False, "message": str(e)}
 
 @router.delete("/api/group-chats/{chat_id}/tags/{tag_id}")
-async def remove_tag_from_group(chat_id: str, tag_id: str, token: str = Depends(check_token)):
+@offload
+def remove_tag_from_group(chat_id: str, tag_id: str, token: str = Depends(check_token)):
     """从客户群移除标签"""
     try:
-        conn = sqlite3.connect(DB_PATH)
+        conn = get_connection()
         cursor = conn.cursor()
         
         cursor.execute('''
@@ -422,6 +438,7 @@ async def remove_tag_from_group(chat_id: str, tag_id: str, token: str = Depends(
         ''', (chat_id, tag_id))
         
         conn.commit()
+        bump_generation()
         conn.close()
         
         return {
@@ -432,10 +449,11 @@ async def remove_tag_from_group(chat_id: str, tag_id: str, token: str = Depends(
         return {"success": False, "message": str(e)}
 
 @router.get("/api/group-chats/{chat_id}/tags")
-async def get_group_tags(chat_id: str, token: str = Depends(check_token)):
+@offload
+def get_group_tags(chat_id: str, token: str = Depends(check_token)):
     """获取客户群的标签"""
     try:
-        conn = sqlite3.connect(DB_PATH)
+        conn = get_connection()
         conn.row_factory = sqlite3.Row
         cursor = conn.cursor()
         
@@ -458,7 +476,8 @@ async def get_group_tags(chat_id: str, token: str = Depends(check_token)):
         return {"success": False, "message": str(e)}
 
 @router.post("/api/group-chats/batch-tags")
-async def batch_add_tags(data: dict, token: str = Depends(check_token)):
+@offload
+def batch_add_tags(data: dict, token: str = Depends(check_token)):
     """批量给客户群添加标签"""
     try:
         chat_ids = data.get('chat_ids', [])
@@ -467,7 +486,7 @@ async def batch_add_tags(data: dict, token: str = Depends(check_token)):
         if not chat_ids or not tag_ids:
             return {"success": False, "message": "参数不完整"}
         
-        conn = sqlite3.connect(DB_PATH)
+        conn = get_connection()
         cursor = conn.cursor()
         
         added = 0
@@ -484,6 +503,7 @@ async def batch_add_tags(data: dict, token: str = Depends(check_token)):
                     print(f"[群标签] 批量添加失败: {e}")
         
         conn.commit()
+        bump_generation()
         conn.close()
         
         return {
@@ -506,10 +526,11 @@ class BatchAssignTagRequest(BaseModel):
     tags: List[dict]  # [{"tag_id": "xxx", "tag_name": "xxx"}]
 
 @router.post("/api/group-tags/assign")
-async def assign_tags_to_group(request: AssignTagRequest, api_token: str = Depends(check_token)):
+@offload
+def assign_tags_to_group(request: AssignTagRequest, api_token: str = Depends(check_token)):
     """给单个客户群打标签"""
     try:
-        conn = sqlite3.connect(DB_PATH)
+        conn = get_connection()
         cursor = conn.cursor()
         
         # 先删除该群的所有标签
@@ -528,6 +549,7 @@ async def assign_tags_to_group(request: AssignTagRequest, api_token: str = Depen
                 print(f"[群标签] 添加标签失败: {e}")
         
         conn.commit()
+        bump_generation()
         conn.close()
         
         return {
@@ -539,10 +561,11 @@ async def assign_tags_to_group(request: AssignTagRequest, api_token: str = Depen
         return {"success": False, "message": str(e)}
 
 @router.post("/api/group-tags/batch-assign")
-async def batch_assign_tags_to_groups(request: BatchAssignTagRequest, api_token: str = Depends(check_token)):
+@offload
+def batch_assign_tags_to_groups(request: BatchAssignTagRequest, api_token: str = Depends(check_token)):
     """批量给客户群打标签"""
     try:
-        conn = sqlite3.connect(DB_PATH)
+        conn = get_connection()
         cursor = conn.cursor()
         
         # 先删除这些群的所有标签
@@ -563,6 +586,7 @@ async def batch_assign_tags_to_groups(request: BatchAssignTagRequest, api_token:
                     print(f"[群标签] 批量添加失败: {e}")
         
         conn.commit()
+        bump_generation()
         conn.close()
         
         return {
@@ -0,0 +1,277 @@
+"""
+数据库迁移
+按版本号顺序执行，已执行的版本记录在 schema_migrations 表中，重复运行不会重复执行。
+新的表结构或索引变更请追加到 MIGRATIONS 末尾，不要修改已发布的版本。
+各版本互不依赖：某个版本失败（如旧库缺少索引引用的列）不影响后续版本，
+失败的版本在其余版本执行完后重试一次（后续版本可能补齐了它依赖的列），仍失败的在下次启动时重试。
+新增列的 ALTER TABLE ... ADD COLUMN 在列已存在时跳过，可用于补齐不同建表脚本创建的旧库。
+"""
+import re
+import sqlite3
+import time
+from typing import List, Tuple
+
+# (版本号, 说明, SQL 语句列表)
+MIGRATIONS: List[Tuple[int, str, List[str]]] = [
+    (1, "客户群标签表及关联表", [
+        """
+        CREATE TABLE IF NOT EXISTS group_chat_tag_groups (
+            group_id TEXT PRIMARY KEY,
+            group_name TEXT NOT NULL,
+            create_time INTEGER,
+            order_index INTEGER DEFAULT 0,
+            created_at INTEGER NOT NULL,
+            updated_at INTEGER NOT NULL
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS group_chat_tags (
+            id TEXT PRIMARY KEY,
+            group_id TEXT NOT NULL,
+            name TEXT NOT NULL,
+            create_time INTEGER,
+            order_index INTEGER DEFAULT 0,
+            created_at INTEGER NOT NULL,
+            updated_at INTEGER NOT NULL,
+            FOREIGN KEY (group_id) REFERENCES group_chat_tag_groups(group_id) ON DELETE CASCADE
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_group_chat_tags_group_id ON group_chat_tags(group_id)",
+        """
+        CREATE TABLE IF NOT EXISTS group_chat_tag_relations (
+            chat_id TEXT NOT NULL,
+            tag_id TEXT NOT NULL,
+            tag_name TEXT,
+            created_at INTEGER,
+            UNIQUE(chat_id, tag_id)
+        )
+        """,
+        # 按群查标签（ORDER BY created_at DESC）、按标签查群/统计群数量
+        "CREATE INDEX IF NOT EXISTS idx_group_tag_relations_chat ON group_chat_tag_relations(chat_id, created_at)",
+        "CREATE INDEX IF NOT EXISTS idx_group_tag_relations_tag ON group_chat_tag_relations(tag_id, chat_id)",
+    ]),
+    (2, "客户与客户群列表索引", [
+        # 按添加时间排序/筛选，(add_time, id) 同时服务游标分页
+        "CREATE INDEX IF NOT EXISTS idx_customers_add_time_id ON customers(add_time, id)",
+        # 普通员工的数据隔离查询：owner_userid = ? ORDER BY add_time DESC
+        "CREATE INDEX IF NOT EXISTS idx_customers_owner_add_time ON customers(owner_userid, add_time, id)",
+        "CREATE INDEX IF NOT EXISTS idx_customer_groups_create_time_id ON customer_groups(create_time, chat_id)",
+    ]),
+    (3, "源数据最新版本索引", [
+        # 列表/计数：source_id = ? AND is_latest = 1 AND deleted = 0 ORDER BY updated_at
+        """
+        CREATE INDEX IF NOT EXISTS idx_raw_data_source_latest
+        ON raw_data_records(source_id, is_latest, deleted, updated_at)
+        """,
+        # 推送去重：source_id = ? AND data_key = ? AND deleted = 0
+        """
+        CREATE INDEX IF NOT EXISTS idx_raw_data_source_key
+        ON raw_data_records(source_id, data_key, deleted)
+        """,
+    ]),
+    (4, "企微通讯录成员表", [
+        # /api/employees 与成员同步读写此表，此前没有任何建表脚本
+        """
+        CREATE TABLE IF NOT EXISTS employees_contacts (
+            id TEXT PRIMARY KEY,
+            name TEXT,
+            avatar TEXT,
+            mobile TEXT,
+            email TEXT,
+            department TEXT,
+            position TEXT,
+            status INTEGER DEFAULT 1,
+            created_at INTEGER DEFAULT 0,
+            updated_at INTEGER DEFAULT 0
+        )
+        """,
+    ]),
+    (5, "客户添加方式与性别索引", [
+        # 画像按添加方式/性别筛选在列式快照构建完成前走 SQL：COUNT 只扫索引，分页按 rowid 顺序读取
+        "CREATE INDEX IF NOT EXISTS idx_customers_add_way ON customers(add_way)",
+        "CREATE INDEX IF NOT EXISTS idx_customers_gender ON customers(gender)",
+    ]),
+    (6, "客户群负责人索引", [
+        # 员工列表的群数量：GROUP BY owner_userid / owner_userid = ?
+        "CREATE INDEX IF NOT EXISTS idx_customer_groups_owner ON customer_groups(owner_userid)",
+    ]),
+    (7, "客户同步内容哈希", [
+        # 企业微信客户详情（规范化后）的哈希，内容未变化的客户同步时跳过写入
+        "ALTER TABLE customers ADD COLUMN content_hash TEXT",
+        # 最近一次同步确认的时间；未变化的客户只更新这一列，不改 updated_at
+        "ALTER TABLE customers ADD COLUMN synced_at INTEGER DEFAULT 0",
+    ]),
+    (8, "客户标签关联表标签组索引", [
+        # 按类型查客户：标签组名命中分类的标签（索引构建完成前走 SQL）
+        """
+        CREATE INDEX IF NOT EXISTS idx_tag_links_group_name
+        ON customer_tag_links(tag_type, group_name, customer_id)
+        """,
+    ]),
+    (9, "客户表补齐同步字段", [
+        # app.init_database 创建的 customers 表缺少同步写入的跟进字段（init_complete_database 的表已有，跳过）
+        "ALTER TABLE customers ADD COLUMN description TEXT",
+        "ALTER TABLE customers ADD COLUMN add_way INTEGER DEFAULT 0",
+        "ALTER TABLE customers ADD COLUMN im_status TEXT",
+        "ALTER TABLE customers ADD COLUMN state TEXT",
+        "ALTER TABLE customers ADD COLUMN remark_mobiles TEXT",
+        "ALTER TABLE customers ADD COLUMN remark_corp_name TEXT",
+        "ALTER TABLE customers ADD COLUMN enterprise_tags TEXT",
+        "ALTER TABLE customers ADD COLUMN personal_tags TEXT",
+        "ALTER TABLE customers ADD COLUMN rule_tags TEXT",
+    ]),
+    (10, "客户个人/规则标签确认时间", [
+        # 批量接口不返回个人/规则标签；记录最近一次逐个拉取确认这两类标签的时间，同步时优先补齐最久未确认的客户
+        "ALTER TABLE customers ADD COLUMN tags_synced_at INTEGER DEFAULT 0",
+    ]),
+    (11, "标签统计汇总表", [
+        # 每个范围（全部客户为空字符串/某员工 userid）下每个企业标签的客户数，由 customer_index 差量维护
+        """
+        CREATE TABLE IF NOT EXISTS tag_stats (
+            scope_owner TEXT NOT NULL,
+            tag_name TEXT NOT NULL,
+            customer_count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (scope_owner, tag_name)
+        ) WITHOUT ROWID
+        """,
+    ]),
+    (12, "每日新增客户汇总表", [
+        # 按本地时间的添加日期、负责员工、标签分类计数，由 customer_index 差量维护
+        """
+        CREATE TABLE IF NOT EXISTS customer_daily_adds (
+            day TEXT NOT NULL,
+            owner_userid TEXT NOT NULL DEFAULT '',
+            tag_category TEXT NOT NULL,
+            count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (tag_category, day, owner_userid)
+        ) WITHOUT ROWID
+        """,
+    ]),
+    (13, "标签组合共现统计表", [
+        # 同时拥有组合内全部企业标签的客户数；标签名按字典序存放（tag_a < tag_b < tag_c），两两组合的 tag_c 为空字符串
+        """
+        CREATE TABLE IF NOT EXISTS tag_combo_stats (
+            size INTEGER NOT NULL,
+            tag_a TEXT NOT NULL,
+            tag_b TEXT NOT NULL,
+            tag_c TEXT NOT NULL DEFAULT '',
+            customer_count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (size, tag_a, tag_b, tag_c)
+        ) WITHOUT ROWID
+        """,
+        # 热门组合：WHERE size = ? ORDER BY customer_count DESC LIMIT ?
+        "CREATE INDEX IF NOT EXISTS idx_tag_combo_stats_count ON tag_combo_stats(size, customer_count)",
+    ]),
+    (14, "标签分类表", [
+        # 每个企业标签名的重点卡片、省份与增长分类位掩码（见 tag_classifier），保存标签时写入、启动时按规则重算
+        """
+        CREATE TABLE IF NOT EXISTS tag_classes (
+            tag_name TEXT PRIMARY KEY,
+            key_category TEXT NOT NULL DEFAULT '',
+            province TEXT NOT NULL DEFAULT '',
+            category_mask INTEGER NOT NULL DEFAULT 0
+        ) WITHOUT ROWID
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_tag_classes_key_category ON tag_classes(key_category, tag_name)",
+        "CREATE INDEX IF NOT EXISTS idx_tag_classes_province ON tag_classes(province, tag_name)",
+        # 标签组名的增长分类：按类型查客户时标签名或所属标签组名命中都算
+        """
+        CREATE TABLE IF NOT EXISTS tag_group_classes (
+            group_name TEXT PRIMARY KEY,
+            category_mask INTEGER NOT NULL DEFAULT 0
+        ) WITHOUT ROWID
+        """,
+        # 派生数据的元信息（如生成汇总表时使用的分类规则指纹）
+        """
+        CREATE TABLE IF NOT EXISTS index_meta (
+            key TEXT PRIMARY KEY,
+            value TEXT NOT NULL
+        ) WITHOUT ROWID
+        """,
+    ]),
+]
+
+_ADD_COLUMN = re.compile(r"\s*ALTER\s+TABLE\s+(\w+)\s+ADD\s+COLUMN\s+(\w+)", re.IGNORECASE)
+
+
+def init_migration_table(cursor):
+    """创建迁移版本表"""
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            applied_at INTEGER NOT NULL
+        )
+    """)
+
+
+def applied_versions(cursor) -> set:
+    cursor.execute("SELECT version FROM schema_migrations")
+    return {row[0] for row in cursor.fetchall()}
+
+
+def _column_exists(cursor, table: str, column: str) -> bool:
+    cursor.execute(f"PRAGMA table_info({table})")
+    return any(row[1] == column for row in cursor.fetchall())
+
+
+def _apply(conn, version: int, name: str, statements: List[str]):
+    """在单独的事务中执行一个版本并记录；失败时回滚并抛出 sqlite3.Error"""
+    cursor = conn.cursor()
+    try:
+        # DDL 默认不开启隐式事务，显式 BEGIN 保证同一版本要么全部生效要么全部回滚
+        cursor.execute("BEGIN")
+        for statement in statements:
+            match = _ADD_COLUMN.match(statement)
+            if match and _column_exists(cursor, *match.groups()):
+                continue
+            cursor.execute(statement)
+        cursor.execute(
+            "INSERT INTO schema_migrations (version, name, applied_at) VALUES (?, ?, ?)",
+            (version, name, int(time.time()))
+        )
+        conn.commit()
+    except sqlite3.Error:
+        conn.rollback()
+        raise
+
+
+def run_migrations(conn) -> List[int]:
+    """
+    执行所有未执行的迁移，返回本次执行的版本号
+    每个版本在单独的事务中执行；某个版本失败时回滚该版本并继续执行后续版本，
+    全部执行完后对失败的版本再重试一次
+    """
+    cursor = conn.cursor()
+    init_migration_table(cursor)
+    conn.commit()
+    done = applied_versions(cursor)
+
+    applied = []
+    pending = [migration for migration in sorted(MIGRATIONS, key=lambda m: m[0]) if migration[0] not in done]
+    for _ in range(2):
+        failed = []
+        errors = {}
+        for version, name, statements in pending:
+            try:
+                _apply(conn, version, name, statements)
+                applied.append(version)
+                print(f"[数据库] 已执行迁移 v{version}: {name}")
+            except sqlite3.Error as e:
+                failed.append((version, name, statements))
+                errors[version] = e
+        # 本轮没有任何版本成功时，重试也不会成功
+        if not failed or len(failed) == len(pending):
+            break
+        pending = failed
+    for version, _, _ in failed:
+        print(f"[警告] 迁移 v{version} 执行失败，下次启动时重试: {errors[version]}")
+
+    if applied:
+        # 新索引需要统计信息，查询规划器才会选用
+        cursor.execute("PRAGMA analysis_limit=1000")
+        cursor.execute("ANALYZE")
+        conn.commit()
+    else:
+        cursor.execute("PRAGMA optimize")
+    return applied
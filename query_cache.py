@@ -0,0 +1,263 @@
+"""
+查询结果缓存
+客户列表、画像统计等接口的结果只在数据写入后才会变化：
+- 缓存键：(用户数据范围, 接口名, 规范化后的筛选参数)
+- 失效：全局数据版本号，同步服务、客户编辑、标签/群写入后调用 bump_generation()
+- 容量按 LRU 淘汰，另有 TTL 兜底
+
+画像等轮询类接口可开启 stale-while-revalidate：
+- 缓存键不含版本号，条目记录计算时的版本号；数据变化或超过 TTL 后先返回旧结果，后台线程重新计算
+- 响应带 ETag（响应体的哈希），客户端带 If-None-Match 且内容未变化时返回 304
+"""
+import time
+import hashlib
+import functools
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, NamedTuple, Optional
+
+from fastapi.responses import Response
+
+from config import QUERY_CACHE_SIZE, QUERY_CACHE_TTL, QUERY_CACHE_MAX_STALE, QUERY_CACHE_REFRESH_WORKERS
+import fast_json
+
+# 不参与缓存键的参数（请求对象、认证 token）
+_IGNORED_PARAMS = {"request", "token", "api_token"}
+
+_generation = 0
+_generation_lock = threading.Lock()
+
+
+def bump_generation():
+    """数据已变化：递增版本号，旧版本的缓存全部失效"""
+    global _generation
+    with _generation_lock:
+        _generation += 1
+
+
+def current_generation() -> int:
+    return _generation
+
+
+def user_scope(user: Optional[Dict]) -> str:
+    """
+    用户的数据范围（与各接口的数据隔离规则一致）
+    旧 API Token（无用户）和超级管理员看全部，普通员工只看自己的客户
+    """
+    if not user or user.get("is_super_admin"):
+        return "all"
+    if user.get("wecom_user_id"):
+        return f"owner:{user['wecom_user_id']}"
+    return "none"
+
+
+class QueryCache:
+    """线程安全的 LRU + TTL 缓存"""
+
+    def __init__(self, max_entries: int = QUERY_CACHE_SIZE, ttl: float = QUERY_CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "OrderedDict[tuple, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.stale_hits = 0
+        self.revalidations = 0
+
+    def get(self, key: tuple) -> Any:
+        """命中返回缓存值，否则返回 None"""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, value = entry
+            if expires_at < now:
+                del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: tuple, value: Any, ttl: Optional[float] = None):
+        with self._lock:
+            self._entries[key] = (time.time() + (self.ttl if ttl is None else ttl), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def count(self, counter: str):
+        """累加 stale_hits / revalidations 等统计"""
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "stale_hits": self.stale_hits,
+                "revalidations": self.revalidations,
+                "hit_rate": round(self.hits / total, 4) if total else 0,
+                "generation": _generation
+            }
+
+
+query_cache = QueryCache()
+
+
+def _normalize(value: Any) -> Any:
+    """把参数值转成可哈希、与顺序无关的形式"""
+    if isinstance(value, dict):
+        return tuple(sorted((k, _normalize(v)) for k, v in value.items()))
+    if isinstance(value, (list, tuple, set)):
+        return tuple(_normalize(v) for v in value)
+    if isinstance(value, str):
+        return value.strip()
+    return value
+
+
+class CachedResult(NamedTuple):
+    """stale-while-revalidate 条目：计算时的版本号与时间、ETag、序列化后的响应体"""
+    generation: int
+    created_at: float
+    etag: str
+    body: bytes
+
+
+# 正在后台重新计算的缓存键（同一个键只提交一次）
+_refreshing = set()
+_refreshing_lock = threading.Lock()
+_refresh_executor = ThreadPoolExecutor(
+    max_workers=max(1, QUERY_CACHE_REFRESH_WORKERS), thread_name_prefix="cache-refresh"
+)
+
+
+def _make_entry(generation: int, value: Any) -> CachedResult:
+    # ETag 只取决于响应内容：TTL 到期重新计算但数据未变时 ETag 不变，客户端仍得到 304
+    body = fast_json.dumps(value)
+    digest = hashlib.sha1(body).hexdigest()[:16]
+    return CachedResult(generation, time.time(), f'W/"{digest}"', body)
+
+
+def _compute(key: tuple, func: Callable, args: tuple, kwargs: dict) -> Any:
+    """执行路由函数；成功的结果写入缓存并返回条目，失败时原样返回结果"""
+    generation = current_generation()
+    result = func(*args, **kwargs)
+    if not (isinstance(result, dict) and result.get("success")):
+        return result
+    entry = _make_entry(generation, result)
+    query_cache.set(key, entry, ttl=QUERY_CACHE_MAX_STALE)
+    return entry
+
+
+def _revalidate(key: tuple, func: Callable, args: tuple, kwargs: dict):
+    """在后台线程重新计算过期条目；失败时保留旧结果"""
+    with _refreshing_lock:
+        if key in _refreshing:
+            return
+        _refreshing.add(key)
+
+    def run():
+        try:
+            _compute(key, func, args, kwargs)
+            query_cache.count("revalidations")
+        except Exception as e:
+            print(f"[查询缓存] 后台刷新失败 {key[1]}: {e}")
+        finally:
+            with _refreshing_lock:
+                _refreshing.discard(key)
+
+    _refresh_executor.submit(run)
+
+
+def _opaque(etag: str) -> str:
+    return etag[2:] if etag.startswith("W/") else etag
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """If-None-Match 是否命中（弱比较，支持逗号分隔的多个值与 *）"""
+    if not if_none_match:
+        return False
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in candidates or _opaque(etag) in (_opaque(tag) for tag in candidates)
+
+
+def _entry_response(entry: CachedResult, request) -> Response:
+    headers = {"ETag": entry.etag, "Cache-Control": "private, no-cache"}
+    if request is not None and etag_matches(request.headers.get("if-none-match"), entry.etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=entry.body, media_type="application/json", headers=headers)
+
+
+def cached(endpoint: str, stale_while_revalidate: bool = False) -> Callable:
+    """
+    缓存同步路由函数的返回值
+    放在 @offload 之下；只缓存 success 为 True 的响应
+    stale_while_revalidate=True 时返回带 ETag 的响应（没有 request 参数的接口由 conditional_get 中间件处理 304）
+    """
+    def decorator(func: Callable) -> Callable:
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if query_cache.max_entries <= 0:
+                return func(*args, **kwargs)
+            request = kwargs.get("request")
+            user = getattr(request.state, "user", None) if request is not None else None
+            filters = tuple(sorted(
+                (k, _normalize(v)) for k, v in kwargs.items() if k not in _IGNORED_PARAMS
+            ))
+
+            if stale_while_revalidate:
+                key = (user_scope(user), endpoint, filters)
+                entry = query_cache.get(key)
+                if entry is None:
+                    entry = _compute(key, func, args, kwargs)
+                    if not isinstance(entry, CachedResult):
+                        return entry
+                elif (entry.generation != current_generation()
+                      or time.time() - entry.created_at > query_cache.ttl):
+                    # 数据已变化：先返回旧结果，后台重新计算
+                    query_cache.count("stale_hits")
+                    _revalidate(key, func, args, kwargs)
+                return _entry_response(entry, request)
+
+            key = (current_generation(), user_scope(user), endpoint, filters)
+
+            result = query_cache.get(key)
+            if result is not None:
+                return result
+            result = func(*args, **kwargs)
+            if isinstance(result, dict) and result.get("success"):
+                query_cache.set(key, result)
+            return result
+        return wrapper
+    return decorator
+
+
+async def conditional_get(request, call_next):
+    """
+    HTTP 中间件：响应带 ETag 且与请求的 If-None-Match 一致时改为 304
+    用于路由函数拿不到 request 的缓存接口
+    """
+    response = await call_next(request)
+    etag = response.headers.get("etag")
+    if (request.method == "GET" and response.status_code == 200 and etag
+            and etag_matches(request.headers.get("if-none-match"), etag)):
+        return Response(status_code=304, headers={
+            "ETag": etag, "Cache-Control": response.headers.get("cache-control", "no-cache")
+        })
+    return response
@@ -0,0 +1,192 @@
+"""
+企业微信接口限流
+按接口族（externalcontact / groupchat / user / wedoc）各一个自适应限流器：
+- 令牌桶限制每秒请求数（WECOM_API_RATE，突发 WECOM_API_BURST）
+- AIMD 并发上限：成功时加性增长（每成功一轮 +1），遇到限流错误码时减半，最小为 1
+
+限流错误默认在当前线程按带抖动的指数退避重试；同步任务的抓取线程使用 deferred_retries()，
+遇到限流直接抛出 WeComRateLimited，由 RetryScheduler 延迟后重新提交，不占用抓取线程等待。
+"""
+import heapq
+import itertools
+import random
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict
+
+from config import (
+    WECOM_API_RATE, WECOM_API_BURST, WECOM_API_MAX_CONCURRENCY,
+    WECOM_API_RETRY_TIMES, WECOM_API_RETRY_BASE, WECOM_API_RETRY_MAX,
+)
+
+# 45009: 接口调用超过限制；45033: 接口并发调用超过限制；84061: 客户群接口限流
+THROTTLE_ERRCODES = {45009, 45033, 84061}
+
+# 路径前缀 -> 接口族（按顺序匹配，groupchat 先于 externalcontact）
+API_FAMILIES = (
+    ('/externalcontact/groupchat', 'groupchat'),
+    ('/externalcontact', 'externalcontact'),
+    ('/user', 'user'),
+    ('/department', 'user'),
+    ('/wedoc', 'wedoc'),
+)
+
+
+class WeComRateLimited(Exception):
+    """企业微信返回限流错误码（仅在 deferred_retries() 中抛出）"""
+
+    def __init__(self, family: str, errcode: int):
+        super().__init__(f"{family} 接口限流: errcode={errcode}")
+        self.family = family
+        self.errcode = errcode
+
+
+def backoff_delay(attempt: int) -> float:
+    """第 attempt 次重试前的等待时间：指数退避 + 全抖动"""
+    return random.uniform(0, min(WECOM_API_RETRY_MAX, WECOM_API_RETRY_BASE * (2 ** attempt)))
+
+
+class AdaptiveLimiter:
+    """令牌桶 + AIMD 并发上限"""
+
+    def __init__(self, family: str, rate: float = WECOM_API_RATE, burst: int = WECOM_API_BURST,
+                 max_concurrency: int = WECOM_API_MAX_CONCURRENCY, min_concurrency: int = 1):
+        self.family = family
+        self.rate = rate
+        self.burst = burst
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min_concurrency
+        self.limit = float(max(min_concurrency, min(max_concurrency, 10)))
+        self.in_flight = 0
+        self.throttled = 0
+        self.requests = 0
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._last_decrease = 0.0
+        self._bucket_lock = threading.Lock()
+        self._cond = threading.Condition()
+
+    def acquire(self):
+        """等待并发名额与令牌"""
+        with self._cond:
+            while self.in_flight >= int(self.limit):
+                self._cond.wait()
+            self.in_flight += 1
+            self.requests += 1
+
+        # 预约令牌：令牌可以透支，调用方在锁外等待透支的时间
+        with self._bucket_lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0
+        if wait:
+            time.sleep(wait)
+
+    def release(self, throttled: bool = False):
+        with self._cond:
+            self.in_flight -= 1
+            now = time.monotonic()
+            if throttled:
+                self.throttled += 1
+                # 同一时刻在途请求会一起被限流，1 秒内只减半一次
+                if now - self._last_decrease >= 1:
+                    self._last_decrease = now
+                    self.limit = max(self.min_concurrency, self.limit / 2)
+                    print(f"[限流] {self.family} 接口被限流，并发上限降至 {int(self.limit)}")
+            else:
+                self.limit = min(self.max_concurrency, self.limit + 1 / self.limit)
+            self._cond.notify_all()
+
+    def stats(self) -> Dict:
+        with self._cond:
+            return {
+                'limit': int(self.limit),
+                'in_flight': self.in_flight,
+                'requests': self.requests,
+                'throttled': self.throttled,
+            }
+
+
+class RetryScheduler:
+    """延迟执行队列：到期后在调度线程上调用回调（回调应只做提交，不做耗时工作）"""
+
+    def __init__(self, name: str = "wecom-retry"):
+        self._heap = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def schedule(self, delay: float, func: Callable, *args):
+        with self._cond:
+            if self._closed:
+                return
+            heapq.heappush(self._heap, (time.monotonic() + delay, next(self._seq), func, args))
+            self._cond.notify()
+
+    def close(self):
+        """丢弃未到期的任务并结束调度线程"""
+        with self._cond:
+            self._closed = True
+            self._heap.clear()
+            self._cond.notify()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._closed and (not self._heap or self._heap[0][0] > time.monotonic()):
+                    timeout = self._heap[0][0] - time.monotonic() if self._heap else None
+                    self._cond.wait(timeout)
+                if self._closed:
+                    return
+                _, _, func, args = heapq.heappop(self._heap)
+            try:
+                func(*args)
+            except Exception as e:
+                print(f"[警告] 延迟重试提交失败: {e}")
+
+
+_limiters: Dict[str, AdaptiveLimiter] = {}
+_limiters_lock = threading.Lock()
+_local = threading.local()
+
+
+def limiter(family: str) -> AdaptiveLimiter:
+    with _limiters_lock:
+        if family not in _limiters:
+            _limiters[family] = AdaptiveLimiter(family)
+        return _limiters[family]
+
+
+def family_for_path(path: str) -> str:
+    """接口路径（/cgi-bin 之后的部分也可）对应的接口族，未知接口归入 default"""
+    for prefix, family in API_FAMILIES:
+        if prefix in path:
+            return family
+    return 'default'
+
+
+def max_retries() -> int:
+    """当前线程遇到限流时原地重试的次数"""
+    return getattr(_local, 'max_retries', WECOM_API_RETRY_TIMES)
+
+
+@contextmanager
+def deferred_retries():
+    """当前线程内遇到限流不原地等待，直接抛出 WeComRateLimited 由调用方排队重试"""
+    previous = max_retries()
+    _local.max_retries = 0
+    try:
+        yield
+    finally:
+        _local.max_retries = previous
+
+
+def stats() -> Dict[str, Dict]:
+    with _limiters_lock:
+        families = list(_limiters.items())
+    return {family: item.stats() for family, item in families}
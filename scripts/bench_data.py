@@ -0,0 +1,335 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+基准测试数据生成脚本
+
+按指定客户数生成一个完整的 crm.db：客户（含企业/个人标签、省份、跟进人）、员工、
+标签定义、客户群及群标签、跟进记录、数据源及原始数据记录。
+表结构来自 init_complete_database.py 与 app.init_database()（含迁移），与线上一致。
+相同的 --customers 与 --seed 生成的数据完全相同，可用于版本间对比。
+
+使用方法：
+python scripts/bench_data.py --customers 100000
+python scripts/bench_data.py --customers 10000 --db data/bench/crm_10000.db --force
+"""
+
+import sys
+import os
+import io
+import json
+import time
+import random
+import argparse
+import contextlib
+from datetime import datetime
+
+# 添加项目根目录到 Python 路径
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+BENCH_DIR = os.path.join(ROOT_DIR, 'data', 'bench')
+BENCH_API_KEY = 'bench-api-key'
+BATCH_SIZE = 5000
+
+PROVINCES = [
+    '北京市', '上海市', '天津市', '重庆市', '河北省', '山西省', '辽宁省', '吉林省', '黑龙江省',
+    '江苏省', '浙江省', '安徽省', '福建省', '江西省', '山东省', '河南省', '湖北省', '湖南省',
+    '广东省', '海南省', '四川省', '贵州省', '云南省', '陕西省', '甘肃省', '青海省',
+    '内蒙古', '广西', '西藏', '宁夏', '新疆'
+]
+USER_TYPES = ['用户', '代理商', '合伙人', '供应商', '同行', '原有老代理商']
+INTEREST_TAGS = [f'意向产品{i}' for i in range(1, 31)]
+PERSONAL_TAGS = ['重点跟进', '已报价', '待回访', '老朋友']
+SURNAMES = '王李张刘陈杨黄赵吴周徐孙马朱胡郭何高林罗'
+GIVEN = '伟芳娜敏静丽强磊军洋勇艳杰娟涛明超秀霞平刚'
+CORPS = ['', '', '星河科技', '蓝海贸易', '天府通信', '云帆网络', '锦城商贸', '远景物流']
+REMARKS = ['', '', '', '老客户推荐', '四川省代理意向强', '需要报价单', '展会认识', '客户备注待补充']
+
+
+def default_db_path(customers: int) -> str:
+    return os.path.join(BENCH_DIR, f'crm_{customers}.db')
+
+
+def prepare_schema(db_path: str):
+    """
+    建表：先执行完整表结构脚本，再导入 app 触发 init_database()（含索引、迁移）
+    必须在导入 config 之前设置 DB_PATH，因此每个进程只能对应一个数据库
+    """
+    os.environ['DB_PATH'] = db_path
+    os.makedirs(os.path.dirname(db_path) or '.', exist_ok=True)
+    os.chdir(ROOT_DIR)
+    with contextlib.redirect_stdout(io.StringIO()):
+        import init_complete_database
+        init_complete_database.DB_PATH = db_path
+        init_complete_database.init_complete_database()
+        import app  # noqa: F401  导入即初始化数据库
+
+
+def _table_columns(cursor, table: str) -> dict:
+    """返回 {列名: 是否 INTEGER PRIMARY KEY}"""
+    cursor.execute(f"PRAGMA table_info({table})")
+    return {row[1]: (row[5] == 1 and (row[2] or '').upper() == 'INTEGER') for row in cursor.fetchall()}
+
+
+def _insert(cursor, table: str, rows: list):
+    """按表的实际列插入（忽略表中不存在的字段，自增主键交给数据库）"""
+    if not rows:
+        return
+    columns = _table_columns(cursor, table)
+    keys = [k for k in rows[0] if k in columns and not columns[k]]
+    placeholders = ', '.join('?' for _ in keys)
+    cursor.executemany(
+        f"INSERT OR REPLACE INTO {table} ({', '.join(keys)}) VALUES ({placeholders})",
+        [tuple(row.get(k) for k in keys) for row in rows]
+    )
+
+
+def _tag_defs():
+    """企业标签定义：[(tag_id, tag_name, group_name)]"""
+    tags = []
+    tags += [(f'et_type_{i}', name, '客户类型') for i, name in enumerate(USER_TYPES)]
+    tags += [(f'et_prov_{i}', name, '省份') for i, name in enumerate(PROVINCES)]
+    tags += [(f'et_int_{i}', name, '意向') for i, name in enumerate(INTEREST_TAGS)]
+    return tags
+
+
+def _customer_tags(rng: random.Random, type_tags, province_tags, interest_tags) -> list:
+    tags = []
+    if rng.random() < 0.9:
+        tag_id, name, group = rng.choice(type_tags)
+        tags.append({'tag_id': tag_id, 'tag_name': name, 'group_name': group, 'type': 1})
+    if rng.random() < 0.7:
+        # 省份分布不均匀，贴近真实数据
+        tag_id, name, group = province_tags[min(int(rng.expovariate(0.15)), len(province_tags) - 1)]
+        tags.append({'tag_id': tag_id, 'tag_name': name, 'group_name': group, 'type': 1})
+    for tag_id, name, group in rng.sample(interest_tags, rng.randint(0, 3)):
+        tags.append({'tag_id': tag_id, 'tag_name': name, 'group_name': group, 'type': 1})
+    if rng.random() < 0.3:
+        tags.append({'tag_id': '', 'tag_name': rng.choice(PERSONAL_TAGS), 'group_name': '', 'type': 2})
+    return tags
+
+
+def generate(db_path: str, customers: int, seed: int = 42) -> dict:
+    """生成基准数据，返回各表行数与耗时"""
+    if os.path.exists(db_path):
+        raise FileExistsError(f"数据库已存在: {db_path}（使用 --force 覆盖）")
+
+    start = time.time()
+    prepare_schema(db_path)
+
+    import customer_index
+    from database import get_connection
+
+    rng = random.Random(seed)
+    now = int(time.time())
+    conn = get_connection()
+    cursor = conn.cursor()
+
+    # 员工
+    owner_count = max(5, customers // 5000)
+    owners = [(f'bench_u{i:03d}', f'员工{i:03d}') for i in range(owner_count)]
+    employees = [
+        {'id': uid, 'name': name, 'mobile': f'138{i:08d}', 'department': '[1]',
+         'position': '销售', 'status': 1, 'created_at': now, 'updated_at': now}
+        for i, (uid, name) in enumerate(owners)
+    ]
+    _insert(cursor, 'employees', employees)
+    _insert(cursor, 'employees_contacts', employees)
+
+    # 企业标签定义
+    tag_defs = _tag_defs()
+    _insert(cursor, 'customer_tags', [
+        {'id': tag_id, 'name': name, 'group_name': group, 'order_num': i, 'created_at': now}
+        for i, (tag_id, name, group) in enumerate(tag_defs)
+    ])
+    type_tags = [t for t in tag_defs if t[2] == '客户类型']
+    province_tags = [t for t in tag_defs if t[2] == '省份']
+    interest_tags = [t for t in tag_defs if t[2] == '意向']
+
+    # 客户（近三年内均匀添加）
+    time_span = 3 * 365 * 86400
+    rows, links = [], []
+    for i in range(customers):
+        customer_id = f'wmbench{i:08d}'
+        owner_userid, owner_name = owners[i % owner_count] if rng.random() < 0.5 else rng.choice(owners)
+        tags = _customer_tags(rng, type_tags, province_tags, interest_tags)
+        enterprise = [{k: t[k] for k in ('tag_id', 'tag_name', 'group_name')} for t in tags if t['type'] == 1]
+        personal = [{k: t[k] for k in ('tag_id', 'tag_name', 'group_name')} for t in tags if t['type'] == 2]
+        rows.append({
+            'id': customer_id,
+            'name': rng.choice(SURNAMES) + rng.choice(GIVEN) + rng.choice(GIVEN),
+            'avatar': '',
+            'gender': rng.choice([0, 1, 1, 2, 2]),
+            'type': rng.choice([1, 1, 1, 2]),
+            'unionid': '',
+            'position': '',
+            'corp_name': rng.choice(CORPS),
+            'owner_userid': owner_userid,
+            'owner_name': owner_name,
+            'add_time': now - rng.randint(0, time_span),
+            'tags': json.dumps([t['tag_name'] for t in tags], ensure_ascii=False),
+            'remark': rng.choice(REMARKS),
+            'description': '',
+            'add_way': rng.choice([0, 1, 1, 2, 3, 3, 3, 201]),
+            'im_status': '',
+            'state': '',
+            'remark_mobiles': '[]',
+            'remark_corp_name': '',
+            'enterprise_tags': json.dumps(enterprise, ensure_ascii=False),
+            'personal_tags': json.dumps(personal, ensure_ascii=False),
+            'rule_tags': '[]',
+            'created_at': now,
+            'updated_at': now
+        })
+        links.extend((customer_id,) + link for link in customer_index.build_tag_links(tags))
+        if len(rows) >= BATCH_SIZE:
+            _insert(cursor, 'customers', rows)
+            cursor.executemany("""
+                INSERT INTO customer_tag_links (customer_id, tag_id, tag_name, group_name, tag_type)
+                VALUES (?, ?, ?, ?, ?)
+            """, links)
+            conn.commit()
+            rows, links = [], []
+    _insert(cursor, 'customers', rows)
+    cursor.executemany("""
+        INSERT INTO customer_tag_links (customer_id, tag_id, tag_name, group_name, tag_type)
+        VALUES (?, ?, ?, ?, ?)
+    """, links)
+    conn.commit()
+    # 汇总表由同步差量维护，这里直接插入的数据需要整体重建
+    customer_index.rebuild_tag_stats(conn)
+    customer_index.rebuild_tag_classes(conn)
+    customer_index.rebuild_daily_adds(conn)
+    customer_index.rebuild_tag_combo_stats(conn)
+
+    # 客户群及群标签
+    group_count = max(10, customers // 20)
+    groups = []
+    for i in range(group_count):
+        owner_userid, owner_name = rng.choice(owners)
+        member_count = rng.randint(3, 500)
+        groups.append({
+            'chat_id': f'wrbench{i:07d}',
+            'name': f'客户群{i}',
+            'owner_userid': owner_userid,
+            'owner_name': owner_name,
+            'notice': '',
+            'member_count': member_count,
+            'external_member_count': member_count // 2,
+            'internal_member_count': member_count - member_count // 2,
+            'admin_list': '[]',
+            'group_type': 'external',
+            'status': 0,
+            'version': 1,
+            'create_time': now - rng.randint(0, time_span),
+            'last_sync_time': now,
+            'created_at': now,
+            'updated_at': now
+        })
+    for start_idx in range(0, len(groups), BATCH_SIZE):
+        _insert(cursor, 'customer_groups', groups[start_idx:start_idx + BATCH_SIZE])
+
+    group_tags = []
+    _insert(cursor, 'group_chat_tag_groups', [
+        {'group_id': f'gtg{g}', 'group_name': f'群分类{g}', 'create_time': now,
+         'order_index': g, 'created_at': now, 'updated_at': now}
+        for g in range(3)
+    ])
+    for g in range(3):
+        for t in range(5):
+            group_tags.append({'id': f'gt{g}_{t}', 'group_id': f'gtg{g}', 'name': f'群标签{g}-{t}',
+                               'create_time': now, 'order_index': t, 'created_at': now, 'updated_at': now})
+    _insert(cursor, 'group_chat_tags', group_tags)
+    relations = []
+    for group in groups:
+        for tag in rng.sample(group_tags, rng.randint(0, 3)):
+            relations.append({'chat_id': group['chat_id'], 'tag_id': tag['id'],
+                              'tag_name': tag['name'], 'created_at': now * 1000})
+    for start_idx in range(0, len(relations), BATCH_SIZE):
+        _insert(cursor, 'group_chat_tag_relations', relations[start_idx:start_idx + BATCH_SIZE])
+    conn.commit()
+
+    # 跟进记录
+    follow_count = customers // 5
+    batch = []
+    for i in range(follow_count):
+        batch.append({
+            'id': f'fr{i:08d}',
+            'customer_id': f'wmbench{rng.randrange(customers):08d}',
+            'employee_id': rng.choice(owners)[0],
+            'follow_time': now - rng.randint(0, time_span),
+            'follow_type': rng.choice(['电话', '微信', '拜访']),
+            'content': '跟进记录',
+            'created_at': now
+        })
+        if len(batch) >= BATCH_SIZE:
+            _insert(cursor, 'follow_records', batch)
+            batch = []
+    _insert(cursor, 'follow_records', batch)
+    conn.commit()
+
+    # 数据源及原始数据
+    now_ms = now * 1000
+    source_id = 'ds_bench'
+    record_count = customers // 2
+    _insert(cursor, 'data_sources', [{
+        'id': source_id, 'name': '基准测试订单', 'source_type': 'order', 'description': '',
+        'api_key': BENCH_API_KEY, 'status': 'active', 'field_schema': None,
+        'total_records': record_count, 'created_at': now_ms, 'updated_at': now_ms, 'deleted': 0
+    }])
+    sync_time = datetime.now().isoformat()
+    batch = []
+    for i in range(record_count):
+        order = {'order_no': f'BENCH{i:08d}', 'amount': rng.randint(10, 5000),
+                 'province': rng.choice(PROVINCES), 'owner': rng.choice(owners)[1]}
+        batch.append({
+            'id': f'rec_bench{i:08d}', 'source_id': source_id,
+            'raw_data': json.dumps(order, ensure_ascii=False),
+            'data_key': order['order_no'], 'data_type': 'order', 'sync_time': sync_time,
+            'is_processed': 0, 'version': 1, 'is_latest': 1,
+            'created_at': now_ms - i, 'updated_at': now_ms - i, 'deleted': 0
+        })
+        if len(batch) >= BATCH_SIZE:
+            _insert(cursor, 'raw_data_records', batch)
+            batch = []
+    _insert(cursor, 'raw_data_records', batch)
+    conn.commit()
+
+    cursor.execute("ANALYZE")
+    conn.commit()
+    conn.close()
+
+    return {
+        'customers': customers,
+        'employees': owner_count,
+        'customer_groups': group_count,
+        'group_tag_relations': len(relations),
+        'follow_records': follow_count,
+        'raw_data_records': record_count,
+        'seed': seed,
+        'seconds': round(time.time() - start, 2)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='生成基准测试数据库')
+    parser.add_argument('--customers', type=int, default=10000, help='客户数量')
+    parser.add_argument('--db', help='数据库路径（默认 data/bench/crm_<客户数>.db）')
+    parser.add_argument('--seed', type=int, default=42, help='随机种子')
+    parser.add_argument('--force', action='store_true', help='覆盖已存在的数据库')
+    args = parser.parse_args()
+
+    db_path = os.path.abspath(args.db or default_db_path(args.customers))
+    if args.force:
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(db_path + suffix):
+                os.remove(db_path + suffix)
+
+    print(f"🚀 生成基准数据: {args.customers} 个客户 → {db_path}")
+    stats = generate(db_path, args.customers, args.seed)
+    print(f"✅ 生成完成，耗时 {stats['seconds']} 秒")
+    print(json.dumps(stats, ensure_ascii=False, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,254 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+接口基准测试
+
+对每个数据规模（默认 1万/10万/100万 客户）：
+1. 用 bench_data.py 生成数据库（已存在则复用）
+2. 在独立子进程中加载 app，用 TestClient 逐个请求热点接口
+3. 汇总为 JSON 报告，便于版本间 diff
+
+覆盖：/api/customers 各筛选组合、全部 /api/customer-portrait/* 接口、
+/api/customer-groups、/api/employees、/api/data-source/push
+
+每个用例先预热一次，再清空查询缓存后重复请求 --repeat 次（冷查询），最后记录一次缓存命中耗时。
+
+使用方法：
+python scripts/benchmark.py
+python scripts/benchmark.py --sizes 10000,100000 --repeat 3 --output bench_report.json
+"""
+
+import sys
+import os
+import io
+import json
+import time
+import argparse
+import platform
+import subprocess
+import contextlib
+import statistics
+from datetime import datetime, timedelta
+
+# 添加项目根目录到 Python 路径
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import bench_data
+
+DEFAULT_SIZES = '10000,100000,1000000'
+
+# 画像接口的必填参数（未列出的接口使用默认参数）
+PORTRAIT_PARAMS = {
+    '/api/customer-portrait/customers-by-tag': {'tag_type': 'agent'},
+    '/api/customer-portrait/tag-customers': {'tag_name': '代理商'},
+    '/api/customer-portrait/customers-by-filter': {'filter_type': 'province', 'filter_value': '四川'},
+    '/api/customer-portrait/monthly-growth-by-year': {'year': str(datetime.now().year)},
+    '/api/customer-portrait/tag-combinations': {'tags': '四川省,代理商'},
+}
+
+
+def _customer_cases(customers: int) -> dict:
+    """/api/customers 筛选组合"""
+    today = datetime.now()
+    date_start = (today - timedelta(days=90)).strftime('%Y-%m-%d')
+    date_end = today.strftime('%Y-%m-%d')
+    deep_page = max(1, min(customers // 20 - 1, 5000))
+    return {
+        'default': {},
+        'owner_userid': {'owner_userid': 'bench_u000'},
+        'user_type': {'user_type': '代理商'},
+        'user_type_multi': {'user_type': '用户|合伙人'},
+        'tags': {'tags': 'et_int_3'},
+        'provinces': {'provinces': '四川'},
+        'date_range': {'date_start': date_start, 'date_end': date_end},
+        'gender': {'gender': '1'},
+        'add_way': {'add_way': '1'},
+        'search': {'search': '四川省代理'},
+        'search_short': {'search': '老客'},
+        'search_relevance': {'search': '客户备注', 'order': 'relevance'},
+        'tags_provinces': {'tags': 'et_int_3', 'provinces': '四川'},
+        'all_filters': {'owner_userid': 'bench_u001', 'user_type': '用户', 'provinces': '广东',
+                        'date_start': date_start, 'date_end': date_end, 'gender': '2'},
+        'deep_page': {'page': deep_page},
+        'without_total': {'with_total': 'false'},
+        'limit_100': {'limit': 100},
+    }
+
+
+def _timed(client, method: str, path: str, **kwargs) -> tuple:
+    start = time.perf_counter()
+    response = client.request(method, path, **kwargs)
+    elapsed = (time.perf_counter() - start) * 1000
+    return elapsed, response
+
+
+def _summary(samples: list) -> dict:
+    samples = sorted(samples)
+    p95_index = max(0, int(round(len(samples) * 0.95)) - 1)
+    return {
+        'min_ms': round(samples[0], 2),
+        'p50_ms': round(statistics.median(samples), 2),
+        'p95_ms': round(samples[p95_index], 2),
+        'max_ms': round(samples[-1], 2),
+    }
+
+
+def run_size(db_path: str, customers: int, repeat: int) -> dict:
+    """在当前进程中对一个数据库执行全部用例（需在导入 app 之前调用 prepare_schema）"""
+    bench_data.prepare_schema(db_path)
+    with contextlib.redirect_stdout(io.StringIO()):
+        import app as app_module
+        from fastapi.testclient import TestClient
+        from query_cache import query_cache
+        client = TestClient(app_module.app)
+    token = {'api_token': app_module.API_TOKEN}
+
+    def measure(method: str, path: str, params: dict = None, json_body=None, headers=None,
+                cacheable: bool = True) -> dict:
+        kwargs = {'params': {**token, **(params or {})}}
+        if json_body is not None:
+            kwargs['json'] = json_body
+        if headers:
+            kwargs['headers'] = headers
+        with contextlib.redirect_stdout(io.StringIO()):
+            _, response = _timed(client, method, path, **kwargs)  # 预热
+            samples = []
+            for _ in range(repeat):
+                query_cache.clear()
+                elapsed, response = _timed(client, method, path, **kwargs)
+                samples.append(elapsed)
+            cached_ms = None
+            if cacheable:
+                cached_ms, _ = _timed(client, method, path, **kwargs)
+        result = {'status': response.status_code, 'bytes': len(response.content), **_summary(samples)}
+        if cached_ms is not None:
+            result['cached_ms'] = round(cached_ms, 2)
+        try:
+            body = response.json()
+            if isinstance(body, dict):
+                result['success'] = body.get('success', body.get('code') == 0)
+                if body.get('total') is not None:
+                    result['total'] = body['total']
+        except ValueError:
+            pass
+        return result
+
+    results = {}
+
+    for name, params in _customer_cases(customers).items():
+        results[f'customers.{name}'] = measure('GET', '/api/customers', params)
+
+    # 游标翻页：从第一页的 next_cursor 取第二页
+    first = client.get('/api/customers', params={**token, 'with_total': 'false'}).json()
+    if first.get('next_cursor'):
+        results['customers.cursor_page'] = measure(
+            'GET', '/api/customers', {'cursor': first['next_cursor'], 'with_total': 'false'})
+
+    portrait_paths = sorted({
+        route.path for route in app_module.app.routes
+        if getattr(route, 'path', '').startswith('/api/customer-portrait/')
+        and '{' not in route.path and 'GET' in getattr(route, 'methods', set())
+    })
+    for path in portrait_paths:
+        name = path.rsplit('/', 1)[-1]
+        results[f'portrait.{name}'] = measure('GET', path, PORTRAIT_PARAMS.get(path))
+
+    results['customer_groups.default'] = measure('GET', '/api/customer-groups')
+    results['customer_groups.search'] = measure('GET', '/api/customer-groups', {'search': '客户群1'})
+    results['employees.default'] = measure('GET', '/api/employees')
+
+    # 数据推送：每次 100 条，一半更新已有记录、一半新增
+    push_body = {
+        'incremental': True,
+        'data_key_field': 'order_no',
+        'data': [{'order_no': f'BENCH{i:08d}', 'amount': i} for i in range(50)] +
+                [{'order_no': f'PUSH{i:08d}', 'amount': i} for i in range(50)]
+    }
+    results['data_source.push_100'] = measure(
+        'POST', '/api/data-source/push', json_body=push_body,
+        headers={'X-API-Key': bench_data.BENCH_API_KEY}, cacheable=False)
+
+    return results
+
+
+def run_child(args):
+    """子进程：对单个规模执行基准测试，结果写入 --child-output"""
+    db_path = os.path.abspath(args.db or bench_data.default_db_path(args.size))
+    generated = None
+    if not os.path.exists(db_path):
+        # 生成与测试在同一进程中，prepare_schema 只执行一次
+        with contextlib.redirect_stdout(io.StringIO()):
+            generated = bench_data.generate(db_path, args.size, args.seed)
+    results = run_size(db_path, args.size, args.repeat)
+    report = {
+        'customers': args.size,
+        'db_path': db_path,
+        'db_size_bytes': os.path.getsize(db_path),
+        'generated': generated,
+        'results': results
+    }
+    with open(args.child_output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False)
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT_DIR, text=True
+        ).strip()
+    except Exception:
+        return ''
+
+
+def main():
+    parser = argparse.ArgumentParser(description='接口基准测试')
+    parser.add_argument('--sizes', default=DEFAULT_SIZES, help='客户数量，逗号分隔')
+    parser.add_argument('--repeat', type=int, default=5, help='每个用例的冷查询次数')
+    parser.add_argument('--seed', type=int, default=42, help='数据生成随机种子')
+    parser.add_argument('--output', default='bench_report.json', help='JSON 报告路径')
+    # 内部参数：单个规模的子进程
+    parser.add_argument('--size', type=int, help=argparse.SUPPRESS)
+    parser.add_argument('--db', help=argparse.SUPPRESS)
+    parser.add_argument('--child-output', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child_output:
+        run_child(args)
+        return
+
+    import sqlite3
+    report = {
+        'generated_at': datetime.now().isoformat(timespec='seconds'),
+        'git_commit': _git_commit(),
+        'python': platform.python_version(),
+        'sqlite': sqlite3.sqlite_version,
+        'platform': platform.platform(),
+        'repeat': args.repeat,
+        'seed': args.seed,
+        'sizes': {}
+    }
+
+    for size in [int(s) for s in args.sizes.split(',') if s.strip()]:
+        print(f"📊 基准测试: {size} 个客户 ...")
+        child_output = os.path.abspath(f'{args.output}.{size}.tmp')
+        start = time.time()
+        # 每个规模单独进程：DB_PATH 在导入 config 时确定
+        subprocess.run([
+            sys.executable, os.path.abspath(__file__),
+            '--size', str(size), '--repeat', str(args.repeat), '--seed', str(args.seed),
+            '--child-output', child_output
+        ], check=True, stdout=subprocess.DEVNULL)
+        with open(child_output, encoding='utf-8') as f:
+            report['sizes'][str(size)] = json.load(f)
+        os.remove(child_output)
+        print(f"   ✅ 完成，耗时 {time.time() - start:.1f} 秒")
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2, sort_keys=True)
+    print(f"📝 报告已写入: {os.path.abspath(args.output)}")
+
+
+if __name__ == '__main__':
+    main()
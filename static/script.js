@@ -1132,7 +1132,7 @@ async function pollSyncProgress(taskId) {
                     // 显示结果
                     if (status.status === 'completed') {
                         const duration = Math.round(status.duration);
-                        showToast(`✅ 同步完成！新增 ${status.added_count} 个，更新 ${status.updated_count} 个，耗时 ${duration} 秒`, 'success');
+                        showToast(`✅ 同步完成！新增 ${status.added_count} 个，更新 ${status.updated_count} 个，无变化 ${status.unchanged_count || 0} 个，耗时 ${duration} 秒`, 'success');
                         loadCustomers(); // 重新加载客户列表
                     } else {
                         // 检查是否是用户手动停止
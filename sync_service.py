@@ -3,11 +3,11 @@
 """
 import time
 import json
-import sqlite3
+import hashlib
 import threading
-from typing import Dict, List, Optional
+from typing import Callable, Dict, List, Optional, Tuple
 from concurrent.futures import ThreadPoolExecutor, as_completed
-from queue import Queue
+from queue import Queue, Empty, Full
 from dataclasses import dataclass
 from datetime import datetime
 
@@ -19,15 +19,370 @@ except ImportError:
     SCHEDULE_AVAILABLE = False
     print("⚠️ schedule 库未安装，定时同步功能已禁用。安装方法: pip install schedule")
 
-from config import DB_PATH
-from wecom_client import WeComClient
+from config import (
+    SYNC_WRITE_BATCH_SIZE, SYNC_WRITE_FLUSH_MS, SYNC_WRITE_QUEUE_SIZE, SYNC_TAG_REFRESH_LIMIT,
+    WECOM_API_MAX_CONCURRENCY, WECOM_API_RETRY_TIMES,
+    WECOM_CALLBACK_TOKEN, WECOM_CALLBACK_AES_KEY, CALLBACK_DEBOUNCE_SECONDS, SYNC_RECONCILE_HOURS,
+)
+from database import get_connection
+from wecom_client import WeComClient, BATCH_DETAIL_LIMIT
+import rate_limiter
+from rate_limiter import RetryScheduler, WeComRateLimited
+import customer_index
+import customer_snapshot
+import tag_bitmap
+from query_cache import bump_generation
+
+
+# 同步写入 customers 的列（created_at 只在新增时写入）
+_CUSTOMER_COLUMNS = (
+    'name', 'avatar', 'gender', 'type', 'unionid', 'position', 'corp_name',
+    'owner_userid', 'owner_name', 'add_time', 'tags', 'remark', 'description', 'add_way',
+    'im_status', 'state', 'remark_mobiles', 'remark_corp_name',
+    'enterprise_tags', 'personal_tags', 'rule_tags', 'content_hash', 'synced_at', 'updated_at'
+)
+
+_UPSERT_CUSTOMER_SQL = f"""
+    INSERT INTO customers (id, {', '.join(_CUSTOMER_COLUMNS)}, created_at)
+    VALUES ({', '.join(['?'] * (len(_CUSTOMER_COLUMNS) + 2))})
+    ON CONFLICT(id) DO UPDATE SET {', '.join(f'{column} = excluded.{column}' for column in _CUSTOMER_COLUMNS)}
+"""
+
+
+# 批量接口取得的客户数据带此标记：只有企业标签，个人/规则标签未知，沿用库中已保存的
+PARTIAL_TAGS_KEY = '_partial_tags'
+
+
+def customer_content_hash(customer: Dict) -> str:
+    """
+    客户内容哈希：企业微信 external_contact 与当前跟进人记录合并后的字段
+    只有企业标签参与计算（按 ID、名称排序，接口返回的标签顺序变化不算内容变化）；
+    批量接口不返回个人/规则标签，这两类标签在 write_customers 中与库中的值单独比较，
+    同一客户经批量接口或逐个拉取得到的哈希一致
+    """
+    normalized = {key: value for key, value in customer.items() if key != PARTIAL_TAGS_KEY}
+    normalized['tags'] = sorted(
+        (tag for tag in customer.get('tags', []) if tag.get('type', 1) == 1),
+        key=lambda tag: (tag.get('tag_id', ''), tag.get('tag_name', ''))
+    )
+    payload = json.dumps(normalized, ensure_ascii=False, sort_keys=True, separators=(',', ':'))
+    return hashlib.md5(payload.encode('utf-8')).hexdigest()
+
+
+def _split_tags(tags: List[Dict]) -> Tuple[List[Dict], List[Dict], List[Dict]]:
+    """标签按类型拆分为 (企业标签, 个人标签, 规则标签)，即 customers 表三个标签列的内容"""
+    enterprise_tags = []
+    personal_tags = []
+    rule_tags = []
+    
+    for tag in tags:
+        tag_type = tag.get('type', 1)
+        tag_data = {
+            'tag_id': tag.get('tag_id', ''),
+            'tag_name': tag.get('tag_name', ''),
+            'group_name': tag.get('group_name', '')
+        }
+        if tag_type == 1:
+            enterprise_tags.append(tag_data)
+        elif tag_type == 2:
+            personal_tags.append(tag_data)
+        elif tag_type == 3:
+            rule_tags.append(tag_data)
+    return enterprise_tags, personal_tags, rule_tags
+
+
+def _tag_key(tags: List[Dict]) -> List[tuple]:
+    """标签列内容的比较键（忽略顺序）"""
+    return sorted((tag.get('tag_id', ''), tag.get('tag_name', ''), tag.get('group_name', '')) for tag in tags)
+
+
+def _stored_tags(column: Optional[str]) -> List[Dict]:
+    """customers 表中个人/规则标签列的 JSON -> 标签列表"""
+    try:
+        return json.loads(column or '[]')
+    except ValueError:
+        return []
+
+
+def _customer_values(customer: Dict, content_hash: str, current_time: int) -> tuple:
+    """企业微信客户详情 -> _UPSERT_CUSTOMER_SQL 的参数"""
+    # 标签分类
+    enterprise_tags, personal_tags, rule_tags = _split_tags(customer.get('tags', []))
+    
+    return (
+        customer.get('external_userid'),
+        customer.get('name', ''),
+        customer.get('avatar', ''),
+        customer.get('gender', 0),
+        customer.get('type', 1),
+        customer.get('unionid', ''),
+        customer.get('position', ''),
+        customer.get('corp_name', ''),
+        customer.get('owner_userid', ''),
+        customer.get('owner_name', ''),
+        customer.get('add_time', 0),
+        json.dumps([tag.get('tag_name', '') for tag in customer.get('tags', [])], ensure_ascii=False),
+        customer.get('remark', ''),
+        customer.get('description', ''),
+        customer.get('add_way', 0),
+        customer.get('im_status', ''),
+        customer.get('state', ''),
+        json.dumps(customer.get('remark_mobiles', []), ensure_ascii=False),
+        customer.get('remark_corp_name', ''),
+        json.dumps(enterprise_tags, ensure_ascii=False),
+        json.dumps(personal_tags, ensure_ascii=False),
+        json.dumps(rule_tags, ensure_ascii=False),
+        content_hash,
+        current_time,  # synced_at
+        current_time,  # updated_at
+        current_time   # created_at（已存在的客户不更新）
+    )
+
+
+def write_customers(cursor, customers: List[Dict]) -> List[Tuple[str, str]]:
+    """
+    在当前事务中写入一批客户（客户行 UPSERT，标签关联表与统计汇总表按差量更新），不提交
+    内容哈希与个人/规则标签都与库中一致的客户不重写，只记录 synced_at；
+    带 PARTIAL_TAGS_KEY 标记的客户（批量接口数据）沿用库中的个人/规则标签；
+    其余客户的个人/规则标签已与企业微信确认，记录 tags_synced_at
+    :return: [('added'/'updated'/'unchanged', customer_id), ...]，与 customers 顺序一致
+    """
+    # 原负责人、添加时间、内容哈希与个人/规则标签，用于判断新增/更新/未变化以及汇总表差量
+    previous: Dict[str, Tuple[str, int, Optional[str]]] = {}
+    stored_tags: Dict[str, Tuple[List[Dict], List[Dict]]] = {}
+    ids = list(dict.fromkeys(customer['external_userid'] for customer in customers))
+    for start in range(0, len(ids), 500):
+        batch = ids[start:start + 500]
+        placeholders = ','.join(['?'] * len(batch))
+        cursor.execute(
+            f"SELECT id, owner_userid, add_time, content_hash, personal_tags, rule_tags FROM customers WHERE id IN ({placeholders})",
+            batch
+        )
+        for row in cursor.fetchall():
+            previous[row[0]] = (row[1], row[2], row[3])
+            stored_tags[row[0]] = (_stored_tags(row[4]), _stored_tags(row[5]))
+    
+    results = []
+    changed = []
+    unchanged_ids = []
+    tags_checked_ids = []
+    for customer in customers:
+        external_userid = customer['external_userid']
+        content_hash = customer_content_hash(customer)
+        before = previous.get(external_userid)
+        personal_tags, rule_tags = stored_tags.get(external_userid, ([], []))
+        if customer.pop(PARTIAL_TAGS_KEY, False):
+            # 批量接口的数据：个人/规则标签未知，沿用已保存的（不用空列表覆盖），也不记为已确认；
+            # 由后续同步的逐个拉取（按 tags_synced_at 轮换）补齐
+            customer['tags'] = [tag for tag in customer.get('tags', []) if tag.get('type', 1) == 1] \
+                + [dict(tag, type=2) for tag in personal_tags] + [dict(tag, type=3) for tag in rule_tags]
+            tags_same = True
+        else:
+            _, new_personal, new_rule = _split_tags(customer.get('tags', []))
+            tags_same = _tag_key(new_personal) == _tag_key(personal_tags) and _tag_key(new_rule) == _tag_key(rule_tags)
+            tags_checked_ids.append(external_userid)
+        if before and before[2] == content_hash and tags_same:
+            results.append(('unchanged', external_userid))
+            unchanged_ids.append(external_userid)
+            continue
+        # 同一批内重复出现的客户，后一次按更新处理，差量基于前一次写入的值
+        previous[external_userid] = (customer.get('owner_userid', ''), customer.get('add_time', 0), content_hash)
+        stored_tags[external_userid] = _split_tags(customer.get('tags', []))[1:]
+        changed.append((customer, content_hash, before))
+        results.append(('updated' if before else 'added', external_userid))
+    
+    current_time = int(time.time())
+    if changed:
+        cursor.executemany(_UPSERT_CUSTOMER_SQL, [
+            _customer_values(customer, content_hash, current_time)
+            for customer, content_hash, _ in changed
+        ])
+        for customer, _, before in changed:
+            customer_index.save_customer_tags(
+                cursor, customer['external_userid'], customer.get('tags', []),
+                customer.get('owner_userid', ''), customer.get('add_time', 0), before[:2] if before else None
+            )
+    for start in range(0, len(unchanged_ids), 500):
+        batch = unchanged_ids[start:start + 500]
+        placeholders = ','.join(['?'] * len(batch))
+        cursor.execute(f"UPDATE customers SET synced_at = ? WHERE id IN ({placeholders})", [current_time] + batch)
+    for start in range(0, len(tags_checked_ids), 500):
+        batch = tags_checked_ids[start:start + 500]
+        placeholders = ','.join(['?'] * len(batch))
+        cursor.execute(f"UPDATE customers SET tags_synced_at = ? WHERE id IN ({placeholders})", [current_time] + batch)
+    return results
+
+
+def _merge_follow_user(detail: Dict, owner_userid: str, owner_name: str) -> Dict:
+    """客户详情 + 指定跟进人的跟进记录 -> 写入用的客户数据（跟进人不在列表中时只保留客户信息）"""
+    customer_data = detail.get('external_contact', {})
+    current_follow = None
+    for follow in detail.get('follow_user', []):
+        if follow.get('userid') == owner_userid:
+            current_follow = follow
+            break
+    
+    if current_follow:
+        customer_data['owner_userid'] = owner_userid
+        customer_data['owner_name'] = owner_name
+        customer_data['add_time'] = current_follow.get('createtime', 0)
+        customer_data['remark'] = current_follow.get('remark', '')
+        customer_data['description'] = current_follow.get('description', '')
+        customer_data['add_way'] = current_follow.get('add_way', 0)
+        customer_data['state'] = current_follow.get('state', '')
+        customer_data['remark_mobiles'] = current_follow.get('remark_mobiles', [])
+        customer_data['remark_corp_name'] = current_follow.get('remark_corp_name', '')
+        customer_data['im_status'] = current_follow.get('oper_userid', '')
+        customer_data['tags'] = current_follow.get('tags', [])
+    return customer_data
+
+
+def _apply_committed(customers: List[Dict], results: List[Tuple[str, str]]):
+    """
+    写事务提交后：有客户内容变化时缓存失效、修补标签位图
+    数据已提交，这里的异常只记录日志（位图作废后按需重建），不影响写入结果
+    """
+    changed = [customer for customer, (result_type, _) in zip(customers, results) if result_type != 'unchanged']
+    if not changed:
+        return
+    try:
+        bump_generation()
+        for customer in changed:
+            tag_bitmap.tag_index.update_customer(customer['external_userid'], customer.get('tags', []))
+    except Exception as e:
+        print(f"[警告] 写入后刷新查询缓存/标签位图失败，位图将重建: {e}")
+        tag_bitmap.tag_index.invalidate()
+
+
+class CustomerBatchWriter:
+    """
+    客户同步的单写线程
+    抓取线程把客户详情放入有界队列；写线程每攒够 batch_size 个、或第一个客户入队 flush_interval 秒后，
+    在一个事务内批量写入。批量写入失败时逐个重试，单个客户的错误只计入失败数。
+    """
+    
+    def __init__(self, save_one: Callable[[Dict], tuple],
+                 batch_size: int = SYNC_WRITE_BATCH_SIZE,
+                 flush_interval: float = SYNC_WRITE_FLUSH_MS / 1000,
+                 queue_size: int = SYNC_WRITE_QUEUE_SIZE):
+        self.save_one = save_one
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_interval
+        self._queue: Queue = Queue(maxsize=max(1, queue_size))
+        self._lock = threading.Lock()
+        self._closed = False
+        self.added_count = 0
+        self.updated_count = 0
+        self.unchanged_count = 0
+        self.failed_count = 0
+        self._thread = threading.Thread(target=self._run, name="customer-writer", daemon=True)
+        self._thread.start()
+    
+    def put(self, customer: Dict):
+        """放入待写队列（队列满时等待）；关闭后放入的客户不再写入，写线程已退出时计为失败"""
+        while not self._closed:
+            if not self._thread.is_alive():
+                self._record('failed')
+                return
+            try:
+                self._queue.put(customer, timeout=1)
+                return
+            except Full:
+                continue
+    
+    def close(self):
+        """写完队列中剩余的客户后结束写线程；写线程已退出时，队列中未写入的客户计为失败"""
+        self._closed = True
+        while self._thread.is_alive():
+            try:
+                self._queue.put(None, timeout=1)
+                break
+            except Full:
+                continue
+        self._thread.join()
+        while True:
+            try:
+                customer = self._queue.get_nowait()
+            except Empty:
+                break
+            if customer is not None:
+                self._record('failed')
+    
+    def counts(self) -> Tuple[int, int, int, int]:
+        """(新增, 更新, 未变化, 失败)"""
+        with self._lock:
+            return self.added_count, self.updated_count, self.unchanged_count, self.failed_count
+    
+    def _record(self, result_type: str):
+        with self._lock:
+            if result_type == 'added':
+                self.added_count += 1
+            elif result_type == 'updated':
+                self.updated_count += 1
+            elif result_type == 'unchanged':
+                self.unchanged_count += 1
+            else:
+                self.failed_count += 1
+    
+    def _run(self):
+        try:
+            self._drain()
+        except Exception as e:
+            print(f"[警告] 客户写入线程异常退出: {e}")
+    
+    def _drain(self):
+        batch: List[Dict] = []
+        deadline = 0.0
+        while True:
+            try:
+                timeout = max(0.0, deadline - time.monotonic()) if batch else None
+                customer = self._queue.get(timeout=timeout)
+            except Empty:
+                self._flush(batch)
+                batch = []
+                continue
+            if customer is None:
+                break
+            if not batch:
+                deadline = time.monotonic() + self.flush_interval
+            batch.append(customer)
+            if len(batch) >= self.batch_size:
+                self._flush(batch)
+                batch = []
+        if batch:
+            self._flush(batch)
+    
+    def _flush(self, batch: List[Dict]):
+        if not batch:
+            return
+        conn = None
+        try:
+            conn = get_connection()
+            results = write_customers(conn.cursor(), batch)
+            conn.commit()
+            conn.close()
+        except Exception as e:
+            if conn is not None:
+                conn.close()
+            print(f"[警告] 批量写入 {len(batch)} 个客户失败，逐个重试: {e}")
+            for customer in batch:
+                try:
+                    result_type = self.save_one(customer)[0]
+                except Exception as e:
+                    print(f"❌ 保存客户失败: {e}")
+                    result_type = 'failed'
+                self._record(result_type)
+            return
+        for result_type, _ in results:
+            self._record(result_type)
+        _apply_committed(batch, results)
 
 
 @dataclass
 class SyncTask:
     """同步任务"""
     task_id: str
-    task_type: str  # 'full' 或 'incremental'
+    task_type: str  # 'full'、'incremental' 或 'changed'（回调事件触发）
     status: str  # 'pending', 'running', 'completed', 'failed'
     progress: int  # 0-100
     total_count: int
@@ -38,19 +393,27 @@ class SyncTask:
     start_time: float
     end_time: Optional[float]
     error_message: Optional[str]
+    unchanged_count: int = 0  # 内容哈希未变化、跳过写入的客户数
 
 
 class SyncService:
     """同步服务"""
     
-    def __init__(self, wecom_client: WeComClient, max_workers: int = 10):
+    def __init__(self, wecom_client: WeComClient, max_workers: Optional[int] = None):
         self.wecom_client = wecom_client
-        self.max_workers = max_workers
+        # 抓取线程池上限，实际并发由接口族限流器按配额自适应
+        self.max_workers = max_workers or WECOM_API_MAX_CONCURRENCY
         self.task_queue = Queue()
         self.active_tasks: Dict[str, SyncTask] = {}
         self.lock = threading.Lock()
         self.stop_flags: Dict[str, bool] = {}  # 停止标志
         
+        # 回调事件合并：窗口内的变更去重后作为一个任务入队
+        self._pending_lock = threading.Lock()
+        self._pending_customers: Dict[str, str] = {}  # external_userid -> 事件中的跟进人 userid
+        self._pending_chats: set = set()
+        self._flush_timer: Optional[threading.Timer] = None
+        
         # 启动后台工作线程
         self.worker_thread = threading.Thread(target=self._worker, daemon=True)
         self.worker_thread.start()
@@ -59,10 +422,13 @@ class SyncService:
         if SCHEDULE_AVAILABLE:
             self.scheduler_thread = threading.Thread(target=self._scheduler, daemon=True)
             self.scheduler_thread.start()
-            print(f"✅ 同步服务已启动 (最大并发: {max_workers} 线程)")
-            print(f"⏰ 定时任务已启动 (每小时自动增量同步)")
+            print(f"✅ 同步服务已启动 (最大并发: {self.max_workers} 线程)")
+            if self.callback_enabled:
+                print(f"⏰ 定时任务已启动 (回调驱动，每 {SYNC_RECONCILE_HOURS} 小时对账增量同步)")
+            else:
+                print(f"⏰ 定时任务已启动 (每小时自动增量同步)")
         else:
-            print(f"✅ 同步服务已启动 (最大并发: {max_workers} 线程)")
+            print(f"✅ 同步服务已启动 (最大并发: {self.max_workers} 线程)")
             print(f"⚠️ 定时任务未启动（需要安装 schedule 库）")
     
     def _worker(self):
@@ -92,6 +458,8 @@ class SyncService:
                     self._sync_all_customers(task_id)
                 elif task_type == 'incremental':
                     self._sync_incremental_customers(task_id)
+                elif task_type == 'changed':
+                    self._sync_changed(task_id, task['changes'])
                 
                 self.task_queue.task_done()
             except Exception as e:
@@ -102,10 +470,14 @@ class SyncService:
         if not SCHEDULE_AVAILABLE:
             return
         
-        # 每小时执行一次增量同步
-        schedule.every().hour.at(":00").do(self._auto_sync)
-        
-        print("⏰ 定时同步已配置: 每小时执行一次增量同步")
+        if self.callback_enabled:
+            # 变更由回调事件实时驱动，定时增量同步只用于对账（补回丢失的事件）
+            schedule.every(SYNC_RECONCILE_HOURS).hours.do(self._auto_sync)
+            print(f"⏰ 定时同步已配置: 每 {SYNC_RECONCILE_HOURS} 小时执行一次对账增量同步")
+        else:
+            # 每小时执行一次增量同步
+            schedule.every().hour.at(":00").do(self._auto_sync)
+            print("⏰ 定时同步已配置: 每小时执行一次增量同步")
         
         while True:
             schedule.run_pending()
@@ -126,11 +498,18 @@ class SyncService:
         except Exception as e:
             print(f"❌ 自动同步失败: {e}")
     
-    def start_sync_task(self, task_type: str = 'incremental', config: Optional[Dict] = None) -> str:
+    @property
+    def callback_enabled(self) -> bool:
+        """是否配置了企业微信回调"""
+        return bool(WECOM_CALLBACK_TOKEN and WECOM_CALLBACK_AES_KEY)
+    
+    def start_sync_task(self, task_type: str = 'incremental', config: Optional[Dict] = None,
+                        changes: Optional[Dict] = None) -> str:
         """
         启动同步任务
-        :param task_type: 'full' 或 'incremental'
+        :param task_type: 'full'、'incremental' 或 'changed'
         :param config: 企业微信配置
+        :param changes: 'changed' 任务的变更集 {'customers': {external_userid: userid}, 'chat_ids': [...]}
         :return: task_id
         """
         task_id = f"sync_{int(time.time() * 1000)}"
@@ -158,7 +537,8 @@ class SyncService:
         self.task_queue.put({
             'task_id': task_id,
             'task_type': task_type,
-            'config': config
+            'config': config,
+            'changes': changes
         })
         
         print(f"📋 同步任务已创建: {task_id} (类型: {task_type})")
@@ -180,6 +560,7 @@ class SyncService:
                 'processed_count': task.processed_count,
                 'added_count': task.added_count,
                 'updated_count': task.updated_count,
+                'unchanged_count': task.unchanged_count,
                 'failed_count': task.failed_count,
                 'start_time': task.start_time,
                 'end_time': task.end_time,
@@ -262,9 +643,11 @@ class SyncService:
             
             # 收集所有客户ID
             all_customer_ids = []
+            user_totals = {}
             for user in users:
                 userid = user.get('userid')
                 external_userids = self.wecom_client.get_external_contact_list(userid)
+                user_totals[userid] = len(external_userids)
                 all_customer_ids.extend([(eid, userid, user.get('name', '')) for eid in external_userids])
             
             self._update_task(task_id, total_count=len(all_customer_ids))
@@ -281,8 +664,8 @@ class SyncService:
                 )
                 return
             
-            # 并发获取客户详情
-            self._sync_customers_concurrent(task_id, all_customer_ids)
+            # 批量/并发获取客户详情
+            self._sync_customers_concurrent(task_id, all_customer_ids, user_totals)
             
         except Exception as e:
             print(f"❌ 全量同步失败: {e}")
@@ -300,7 +683,7 @@ class SyncService:
             print(f"🔄 开始增量同步任务: {task_id}")
             
             # 从 config 表获取上次同步时间
-            conn = sqlite3.connect(DB_PATH)
+            conn = get_connection()
             cursor = conn.cursor()
             cursor.execute("SELECT value FROM config WHERE key = ?", ('last_customer_sync_time',))
             result = cursor.fetchone()
@@ -335,10 +718,11 @@ class SyncService:
             self._update_task(task_id, status='running', total_count=1)
             
             # 快速筛选策略：先查询数据库中需要更新的客户ID
+            # 内容未变化的客户只更新 synced_at，取两者较晚的作为最近同步时间
             cursor.execute("""
                 SELECT id, updated_at 
                 FROM customers 
-                WHERE updated_at IS NULL OR updated_at < ?
+                WHERE MAX(COALESCE(updated_at, 0), COALESCE(synced_at, 0)) < ?
             """, (sync_threshold,))
             
             db_customers_to_update = {row[0]: row[1] for row in cursor.fetchall()}
@@ -347,6 +731,7 @@ class SyncService:
             # 收集需要同步的客户
             customers_to_sync = []
             all_external_count = 0
+            user_totals = {}
             processed_users = 0
             
             for user in users:
@@ -356,6 +741,7 @@ class SyncService:
                 # 获取该员工的客户列表
                 external_userids = self.wecom_client.get_external_contact_list(userid)
                 all_external_count += len(external_userids)
+                user_totals[userid] = len(external_userids)
                 
                 # 更新进度提示
                 processed_users += 1
@@ -417,10 +803,10 @@ class SyncService:
             
             # 并发获取客户详情
             print(f"\n🚀 开始同步 {len(customers_to_sync)} 个客户...")
-            self._sync_customers_concurrent(task_id, customers_to_sync)
+            self._sync_customers_concurrent(task_id, customers_to_sync, user_totals)
             
             # 记录本次同步时间到 config 表
-            conn = sqlite3.connect(DB_PATH)
+            conn = get_connection()
             cursor = conn.cursor()
             cursor.execute(
                 "INSERT OR REPLACE INTO config (key, value, updated_at) VALUES (?, ?, ?)",
@@ -439,72 +825,176 @@ class SyncService:
                 end_time=time.time()
             )
     
-    def _sync_customers_concurrent(self, task_id: str, customer_list: List[tuple]):
+    def _fetch_batched(self, task_id: str, customer_list: List[tuple], user_totals: Dict[str, int],
+                       writer: 'CustomerBatchWriter') -> set:
+        """
+        用批量接口按成员分页拉取客户详情放入写入队列
+        批量接口返回成员的全部客户，只对待同步客户数多于其分页数的成员使用（否则逐个拉取调用更少）；
+        批量接口不返回个人/规则标签，写入时沿用库中已保存的；每次同步另取个人/规则标签最久未确认
+        （tags_synced_at 最小，新客户优先）的 SYNC_TAG_REFRESH_LIMIT 个客户逐个拉取，轮换补齐这两类标签
+        :return: 已取得的 (external_userid, owner_userid)
+        """
+        wanted_by_user: Dict[str, List[tuple]] = {}
+        for item in customer_list:
+            wanted_by_user.setdefault(item[1], []).append(item)
+        candidates = [
+            userid for userid, items in wanted_by_user.items()
+            if len(items) > -(-user_totals.get(userid, 0) // BATCH_DETAIL_LIMIT)
+        ]
+        if not candidates:
+            return set()
+        
+        ids = list({item[0] for userid in candidates for item in wanted_by_user[userid]})
+        # 库中没有的客户记为 -1，排在最前
+        checked_at = dict.fromkeys(ids, -1)
+        conn = get_connection()
+        try:
+            cursor = conn.cursor()
+            for start in range(0, len(ids), 500):
+                chunk = ids[start:start + 500]
+                cursor.execute(
+                    f"SELECT id, COALESCE(tags_synced_at, 0) FROM customers WHERE id IN ({','.join('?' * len(chunk))})",
+                    chunk
+                )
+                checked_at.update(cursor.fetchall())
+        finally:
+            conn.close()
+        refresh = set(sorted(ids, key=lambda external_userid: (checked_at[external_userid], external_userid))
+                      [:SYNC_TAG_REFRESH_LIMIT])
+        
+        # 按可批量拉取的客户数重新判断成员是否值得走批量接口
+        batch_users = []
+        pending = {}
+        for userid in candidates:
+            items = [item for item in wanted_by_user[userid] if item[0] not in refresh]
+            if len(items) > -(-user_totals.get(userid, 0) // BATCH_DETAIL_LIMIT):
+                batch_users.append(userid)
+                pending.update(((item[0], item[1]), item[2]) for item in items)
+        if not batch_users:
+            return set()
+        print(f"📦 批量接口拉取 {len(batch_users)} 个成员的 {len(pending)} 个客户")
+        
+        delivered = set()
+        for detail in self.wecom_client.iter_external_contact_details(batch_users):
+            if self._should_stop(task_id):
+                break
+            follow_users = detail.get('follow_user', [])
+            key = (detail.get('external_contact', {}).get('external_userid'),
+                   follow_users[0].get('userid') if follow_users else None)
+            if key not in pending:
+                continue
+            customer_data = _merge_follow_user(detail, key[1], pending.pop(key))
+            customer_data[PARTIAL_TAGS_KEY] = True
+            writer.put(customer_data)
+            delivered.add(key)
+            
+            if len(delivered) % BATCH_DETAIL_LIMIT == 0:
+                added_count, updated_count, unchanged_count, failed_count = writer.counts()
+                self._update_task(
+                    task_id,
+                    processed_count=added_count + updated_count + unchanged_count + failed_count,
+                    added_count=added_count,
+                    updated_count=updated_count,
+                    unchanged_count=unchanged_count,
+                    failed_count=failed_count
+                )
+                print(f"📦 [{len(delivered):>5}/{len(customer_list)}] 批量接口已取得")
+        
+        print(f"📦 批量接口取得 {len(delivered)} 个客户，{len(customer_list) - len(delivered)} 个逐个拉取")
+        return delivered
+    
+    def _sync_customers_concurrent(self, task_id: str, customer_list: List[tuple],
+                                   user_totals: Optional[Dict[str, int]] = None):
         """
         并发同步客户列表
+        抓取线程并发获取客户详情，放入 CustomerBatchWriter 的队列，由单个写线程批量提交
         :param task_id: 任务ID
         :param customer_list: [(external_userid, owner_userid, owner_name), ...]
+        :param user_totals: 每个成员的客户总数；提供时先用批量接口按成员拉取，其余客户逐个拉取
         """
         added_count = 0
         updated_count = 0
         failed_count = 0
+        fetch_failed_count = 0
         processed_count = 0
+        completed_count = 0
         
         print(f"\n{'='*80}")
-        print(f"🚀 开始10线程并发同步")
+        gate = rate_limiter.limiter('externalcontact')
+        print(f"🚀 开始并发同步")
         print(f"📊 总客户数: {len(customer_list)}")
-        print(f"🔧 线程池大小: {self.max_workers} 线程")
+        print(f"🔧 线程池大小: {self.max_workers} 线程（实际并发按限流自适应，当前上限 {int(gate.limit)}）")
+        print(f"💾 批量写入: 每 {SYNC_WRITE_BATCH_SIZE} 个客户或 {SYNC_WRITE_FLUSH_MS} 毫秒提交一次")
         print(f"{'='*80}\n")
         
-        def fetch_and_save_customer(item):
-            """获取并保存单个客户"""
+        writer = CustomerBatchWriter(self._save_customer)
+        
+        single_list = customer_list
+        if user_totals:
+            delivered = self._fetch_batched(task_id, customer_list, user_totals, writer)
+            single_list = [item for item in customer_list if (item[0], item[1]) not in delivered]
+            if self._should_stop(task_id):
+                print(f"🛑 收到停止信号，正在终止同步任务: {task_id}")
+                writer.close()
+                self._update_task(
+                    task_id,
+                    status='failed',
+                    error_message='用户手动停止',
+                    end_time=time.time()
+                )
+                return
+        
+        def fetch_customer(item, attempt):
+            """获取单个客户详情并放入写入队列；被限流时返回 'retry'，由调度器延迟后重新提交"""
             external_userid, owner_userid, owner_name = item
             try:
-                # 获取客户详情
-                detail = self.wecom_client.get_external_contact_detail(external_userid)
+                # 获取客户详情（限流不在抓取线程内等待）
+                with rate_limiter.deferred_retries():
+                    detail = self.wecom_client.get_external_contact_detail(external_userid)
                 if not detail:
-                    return 'failed', None
-                
-                customer_data = detail.get('external_contact', {})
-                follow_users = detail.get('follow_user', [])
+                    return 'failed', item, attempt
                 
-                # 找到当前跟进人的记录
-                current_follow = None
-                for follow in follow_users:
-                    if follow.get('userid') == owner_userid:
-                        current_follow = follow
-                        break
+                # 合并当前跟进人的记录
+                customer_data = _merge_follow_user(detail, owner_userid, owner_name)
+                if not customer_data.get('external_userid'):
+                    return 'failed', item, attempt
                 
-                # 合并跟进人信息
-                if current_follow:
-                    customer_data['owner_userid'] = owner_userid
-                    customer_data['owner_name'] = owner_name
-                    customer_data['add_time'] = current_follow.get('createtime', 0)
-                    customer_data['remark'] = current_follow.get('remark', '')
-                    customer_data['description'] = current_follow.get('description', '')
-                    customer_data['add_way'] = current_follow.get('add_way', 0)
-                    customer_data['state'] = current_follow.get('state', '')
-                    customer_data['remark_mobiles'] = current_follow.get('remark_mobiles', [])
-                    customer_data['remark_corp_name'] = current_follow.get('remark_corp_name', '')
-                    customer_data['im_status'] = current_follow.get('oper_userid', '')
-                    customer_data['tags'] = current_follow.get('tags', [])
-                
-                # 保存到数据库
-                return self._save_customer(customer_data)
+                # 交给写线程批量保存
+                writer.put(customer_data)
+                return 'queued', item, attempt
                 
+            except WeComRateLimited:
+                return 'retry', item, attempt
             except Exception as e:
                 print(f"❌ 处理客户 {external_userid} 失败: {e}")
-                return 'failed', None
+                return 'failed', item, attempt
+        
+        # 线程池大小只是上限，实际并发由 externalcontact 限流器按配额自适应
+        executor = ThreadPoolExecutor(max_workers=self.max_workers)
+        retries = RetryScheduler()
+        done = Queue()
         
-        # 使用线程池并发处理
-        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
-            futures = {executor.submit(fetch_and_save_customer, item): item for item in customer_list}
+        def submit(item, attempt=0):
+            executor.submit(fetch_customer, item, attempt).add_done_callback(done.put)
+        
+        try:
+            for item in single_list:
+                submit(item)
+            remaining = len(single_list)
             
-            for future in as_completed(futures):
+            while remaining:
+                try:
+                    future = done.get(timeout=1)
+                except Empty:
+                    future = None  # 只有等待重试的客户时也定期检查停止信号
+                
                 # 检查是否需要停止
                 if self._should_stop(task_id):
                     print(f"🛑 收到停止信号，正在终止同步任务: {task_id}")
+                    retries.close()
                     executor.shutdown(wait=False, cancel_futures=True)
+                    # 已获取的客户写完再结束
+                    writer.close()
                     self._update_task(
                         task_id,
                         status='failed',
@@ -513,40 +1003,71 @@ class SyncService:
                     )
                     print(f"⛔ 同步任务已停止: {task_id} (已处理: {processed_count}/{len(customer_list)})")
                     return
+                if future is None:
+                    continue
                 
                 try:
-                    result_type, customer_id = future.result()
-                    
-                    if result_type == 'added':
-                        added_count += 1
-                    elif result_type == 'updated':
-                        updated_count += 1
-                    elif result_type == 'failed':
-                        failed_count += 1
-                    
-                    # 更新任务进度
-                    processed_count = added_count + updated_count + failed_count
-                    self._update_task(
-                        task_id,
-                        processed_count=processed_count,
-                        added_count=added_count,
-                        updated_count=updated_count,
-                        failed_count=failed_count
-                    )
-                    
-                    # 每处理5个客户打印一次进度（更频繁的日志）
-                    if processed_count % 5 == 0 or processed_count == 1:
-                        task_status = self.get_task_status(task_id)
-                        # 计算当前速度（每秒处理的客户数）
-                        elapsed_time = time.time() - task_status['start_time']
-                        speed = processed_count / elapsed_time if elapsed_time > 0 else 0
-                        print(f"⚡ [{processed_count:>5}/{len(customer_list)}] {task_status['progress']:>3.0f}% | "
-                              f"新增:{added_count:>3} 更新:{updated_count:>3} 失败:{failed_count:>3} | "
-                              f"速度: {speed:.1f}个/秒 | 10线程并发")
-                    
+                    result_type, item, attempt = future.result()
                 except Exception as e:
                     print(f"❌ 处理结果异常: {e}")
-                    failed_count += 1
+                    result_type = 'failed'
+                
+                if result_type == 'retry':
+                    if attempt < WECOM_API_RETRY_TIMES:
+                        retries.schedule(rate_limiter.backoff_delay(attempt), submit, item, attempt + 1)
+                        continue
+                    print(f"❌ 客户 {item[0]} 重试 {attempt} 次后仍被限流")
+                    result_type = 'failed'
+                
+                remaining -= 1
+                if result_type == 'failed':
+                    fetch_failed_count += 1
+                completed_count += 1
+                
+                # 更新任务进度（新增/更新/未变化以写线程实际提交的为准）
+                added_count, updated_count, unchanged_count, write_failed_count = writer.counts()
+                failed_count = fetch_failed_count + write_failed_count
+                processed_count = added_count + updated_count + unchanged_count + failed_count
+                self._update_task(
+                    task_id,
+                    processed_count=processed_count,
+                    added_count=added_count,
+                    updated_count=updated_count,
+                    unchanged_count=unchanged_count,
+                    failed_count=failed_count
+                )
+                
+                # 每处理5个客户打印一次进度（更频繁的日志）
+                if completed_count % 5 == 0 or completed_count == 1:
+                    task_status = self.get_task_status(task_id)
+                    # 计算当前速度（每秒处理的客户数）
+                    elapsed_time = time.time() - task_status['start_time']
+                    speed = processed_count / elapsed_time if elapsed_time > 0 else 0
+                    print(f"⚡ [{processed_count:>5}/{len(customer_list)}] {task_status['progress']:>3.0f}% | "
+                          f"新增:{added_count:>3} 更新:{updated_count:>3} 无变化:{unchanged_count:>3} 失败:{failed_count:>3} | "
+                          f"速度: {speed:.1f}个/秒 | 并发上限 {int(gate.limit)}")
+        finally:
+            retries.close()
+            executor.shutdown(wait=False)
+        
+        # 等待写线程提交剩余的客户，得到最终统计
+        writer.close()
+        added_count, updated_count, unchanged_count, write_failed_count = writer.counts()
+        failed_count = fetch_failed_count + write_failed_count
+        self._update_task(
+            task_id,
+            processed_count=added_count + updated_count + unchanged_count + failed_count,
+            added_count=added_count,
+            updated_count=updated_count,
+            unchanged_count=unchanged_count,
+            failed_count=failed_count
+        )
+        
+        # 列式快照增量刷新（只读取本次 updated_at 变化的客户）
+        try:
+            customer_snapshot.snapshot.refresh()
+        except Exception as e:
+            print(f"[警告] 客户列式快照刷新失败: {e}")
         
         # 任务完成
         end_time = time.time()
@@ -564,149 +1085,130 @@ class SyncService:
         print(f"   - 总客户数: {len(customer_list)}")
         print(f"   - 新增: {added_count}")
         print(f"   - 更新: {updated_count}")
+        print(f"   - 无变化: {unchanged_count}")
         print(f"   - 失败: {failed_count}")
         print(f"   - 耗时: {elapsed_time:.1f} 秒")
         print(f"   - 平均速度: {len(customer_list)/elapsed_time:.1f} 个/秒")
-        print(f"   - 并发线程: {self.max_workers}")
+        print(f"   - 并发上限: {int(gate.limit)} (线程池 {self.max_workers})")
         print(f"{'='*80}\n")
     
     def _save_customer(self, customer: Dict) -> tuple:
         """
-        保存客户到数据库
-        :return: ('added'/'updated'/'failed', customer_id)
+        保存单个客户到数据库（客户行、标签关联表、统计汇总表同一事务提交）
+        :return: ('added'/'updated'/'unchanged'/'failed', customer_id)
         """
+        if not customer.get('external_userid'):
+            return 'failed', None
+        conn = None
         try:
-            conn = sqlite3.connect(DB_PATH)
-            cursor = conn.cursor()
-            
-            external_userid = customer.get('external_userid')
-            if not external_userid:
+            conn = get_connection()
+            results = write_customers(conn.cursor(), [customer])
+            conn.commit()
+            conn.close()
+            _apply_committed([customer], results)
+            result_type, external_userid = results[0]
+            return result_type, external_userid
+        except Exception as e:
+            print(f"❌ 保存客户失败: {e}")
+            if conn is not None:
                 conn.close()
-                return 'failed', None
+            return 'failed', None
+
+    # ==================== 回调事件驱动同步 ====================
+    
+    def enqueue_changes(self, customers: Optional[Dict[str, str]] = None, chat_ids=None):
+        """
+        登记回调事件中变更的客户/客户群
+        同一合并窗口（CALLBACK_DEBOUNCE_SECONDS）内的事件去重合并，窗口结束后作为一个 'changed' 任务入队
+        :param customers: {external_userid: 事件中的跟进人 userid}
+        :param chat_ids: 客户群ID列表
+        """
+        with self._pending_lock:
+            self._pending_customers.update(customers or {})
+            self._pending_chats.update(chat_ids or ())
+            if self._flush_timer is None:
+                self._flush_timer = threading.Timer(CALLBACK_DEBOUNCE_SECONDS, self.flush_changes)
+                self._flush_timer.daemon = True
+                self._flush_timer.start()
+    
+    def flush_changes(self) -> Optional[str]:
+        """把合并窗口内的变更作为一个任务入队，没有变更时返回 None"""
+        with self._pending_lock:
+            if self._flush_timer is not None:
+                self._flush_timer.cancel()
+                self._flush_timer = None
+            customers, self._pending_customers = self._pending_customers, {}
+            chat_ids, self._pending_chats = sorted(self._pending_chats), set()
+        if not customers and not chat_ids:
+            return None
+        return self.start_sync_task('changed', changes={'customers': customers, 'chat_ids': chat_ids})
+    
+    def _sync_changed(self, task_id: str, changes: Dict):
+        """同步回调事件中变更的客户与客户群（只拉取这些ID的详情）"""
+        customers: Dict[str, str] = changes.get('customers') or {}
+        chat_ids: List[str] = changes.get('chat_ids') or []
+        try:
+            self._update_task(task_id, status='running', total_count=len(customers) + len(chat_ids))
+            print(f"🔔 回调变更同步: {len(customers)} 个客户, {len(chat_ids)} 个客户群 ({task_id})")
             
-            # 检查是否已存在
-            cursor.execute("SELECT id FROM customers WHERE id = ?", (external_userid,))
-            exists = cursor.fetchone()
+            # 客户群数量少，逐个拉取
+            group_counts = {'added': 0, 'updated': 0, 'failed': 0}
+            for chat_id in chat_ids:
+                try:
+                    group = self.wecom_client.get_group_chat_detail(chat_id, need_name=False)
+                    status = self._save_customer_group(group)[0] if group else 'failed'
+                except Exception as e:
+                    print(f"❌ 同步客户群 {chat_id} 失败: {e}")
+                    status = 'failed'
+                group_counts[status] += 1
             
-            # 准备数据
-            tags_json = json.dumps([tag.get('tag_name', '') for tag in customer.get('tags', [])], ensure_ascii=False)
-            
-            # 标签分类
-            enterprise_tags = []
-            personal_tags = []
-            rule_tags = []
-            
-            for tag in customer.get('tags', []):
-                tag_type = tag.get('type', 1)
-                tag_data = {
-                    'tag_id': tag.get('tag_id', ''),
-                    'tag_name': tag.get('tag_name', ''),
-                    'group_name': tag.get('group_name', '')
-                }
-                if tag_type == 1:
-                    enterprise_tags.append(tag_data)
-                elif tag_type == 2:
-                    personal_tags.append(tag_data)
-                elif tag_type == 3:
-                    rule_tags.append(tag_data)
-            
-            enterprise_tags_json = json.dumps(enterprise_tags, ensure_ascii=False)
-            personal_tags_json = json.dumps(personal_tags, ensure_ascii=False)
-            rule_tags_json = json.dumps(rule_tags, ensure_ascii=False)
+            if customers:
+                # 已存在的客户保持原跟进人，新客户以事件中的员工为跟进人
+                conn = get_connection()
+                try:
+                    cursor = conn.cursor()
+                    ids = list(customers)
+                    owners = {}
+                    for start in range(0, len(ids), 500):
+                        chunk = ids[start:start + 500]
+                        cursor.execute(
+                            f"SELECT id, owner_userid FROM customers WHERE id IN ({','.join('?' * len(chunk))})",
+                            chunk
+                        )
+                        owners.update({row[0]: row[1] for row in cursor.fetchall() if row[1]})
+                    cursor.execute("SELECT id, name FROM employees_contacts")
+                    names = {row[0]: row[1] for row in cursor.fetchall()}
+                finally:
+                    conn.close()
+                
+                customer_list = []
+                for external_userid, userid in customers.items():
+                    owner_userid = owners.get(external_userid) or userid
+                    customer_list.append((external_userid, owner_userid, names.get(owner_userid, '')))
+                self._sync_customers_concurrent(task_id, customer_list)
             
-            current_time = int(time.time())
+            # 客户群的结果并入任务统计
+            with self.lock:
+                task = self.active_tasks.get(task_id)
+                if task:
+                    task.added_count += group_counts['added']
+                    task.updated_count += group_counts['updated']
+                    task.failed_count += group_counts['failed']
+                    task.processed_count += len(chat_ids)
+                    if task.status != 'failed':  # 手动停止时保留 failed 状态
+                        task.status = 'completed'
+                        task.progress = 100
+                        task.end_time = time.time()
             
-            if exists:
-                # 更新
-                cursor.execute("""
-                    UPDATE customers SET
-                        name = ?, avatar = ?, gender = ?, type = ?,
-                        corp_name = ?, position = ?,
-                        owner_userid = ?, owner_name = ?,
-                        add_time = ?, tags = ?, remark = ?,
-                        description = ?, add_way = ?, im_status = ?, state = ?,
-                        remark_mobiles = ?, remark_corp_name = ?,
-                        enterprise_tags = ?, personal_tags = ?, rule_tags = ?,
-                        unionid = ?,
-                        updated_at = ?
-                    WHERE id = ?
-                """, (
-                    customer.get('name', ''),
-                    customer.get('avatar', ''),
-                    customer.get('gender', 0),
-                    customer.get('type', 1),
-                    customer.get('corp_name', ''),
-                    customer.get('position', ''),
-                    customer.get('owner_userid', ''),
-                    customer.get('owner_name', ''),
-                    customer.get('add_time', 0),
-                    tags_json,
-                    customer.get('remark', ''),
-                    customer.get('description', ''),
-                    customer.get('add_way', 0),
-                    customer.get('im_status', ''),
-                    customer.get('state', ''),
-                    json.dumps(customer.get('remark_mobiles', []), ensure_ascii=False),
-                    customer.get('remark_corp_name', ''),
-                    enterprise_tags_json,
-                    personal_tags_json,
-                    rule_tags_json,
-                    customer.get('unionid', ''),
-                    current_time,
-                    external_userid  # WHERE id = ?
-                ))
-                conn.commit()
-                conn.close()
-                return 'updated', external_userid
-            else:
-                # 新增
-                cursor.execute("""
-                    INSERT INTO customers (
-                        id, name, avatar, gender, type, unionid,
-                        position, corp_name, owner_userid, owner_name,
-                        add_time, tags, remark, description, add_way,
-                        im_status, state, remark_mobiles, remark_corp_name,
-                        enterprise_tags, personal_tags, rule_tags,
-                        created_at, updated_at
-                    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                """, (
-                    external_userid,
-                    customer.get('name', ''),
-                    customer.get('avatar', ''),
-                    customer.get('gender', 0),
-                    customer.get('type', 1),
-                    customer.get('unionid', ''),
-                    customer.get('position', ''),
-                    customer.get('corp_name', ''),
-                    customer.get('owner_userid', ''),
-                    customer.get('owner_name', ''),
-                    customer.get('add_time', 0),
-                    tags_json,
-                    customer.get('remark', ''),
-                    customer.get('description', ''),
-                    customer.get('add_way', 0),
-                    customer.get('im_status', ''),
-                    customer.get('state', ''),
-                    json.dumps(customer.get('remark_mobiles', []), ensure_ascii=False),
-                    customer.get('remark_corp_name', ''),
-                    enterprise_tags_json,
-                    personal_tags_json,
-                    rule_tags_json,
-                    current_time,
-                    current_time
-                ))
-                conn.commit()
-                conn.close()
-                return 'added', external_userid
-                
         except Exception as e:
-            print(f"❌ 保存客户失败: {e}")
-            try:
-                conn.close()
-            except:
-                pass
-            return 'failed', None
-
+            print(f"❌ 回调变更同步失败: {e}")
+            self._update_task(
+                task_id,
+                status='failed',
+                error_message=str(e),
+                end_time=time.time()
+            )
+    
     # ==================== 客户群同步方法 ====================
     
     def sync_customer_groups_async(self) -> str:
@@ -821,14 +1323,13 @@ class SyncService:
                         failed_count += 1
                     return 'failed', None
             
-            # 使用线程池并发处理（10个并发）
-            print(f"[同步策略] 使用10个线程并发处理")
+            # 使用线程池并发处理（实际并发由 groupchat 限流器自适应）
+            print(f"[同步策略] 线程池 {self.max_workers} 个线程，并发按限流自适应")
             
             from concurrent.futures import ThreadPoolExecutor, as_completed
             import time
             
-            # 使用线程池，10个并发
-            with ThreadPoolExecutor(max_workers=10) as executor:
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
                 # 提交所有任务
                 future_to_chat = {executor.submit(fetch_and_save_group, chat_id): chat_id for chat_id in chat_ids}
                 
@@ -887,7 +1388,7 @@ class SyncService:
         :return: ('added'/'updated'/'failed', chat_id)
         """
         try:
-            conn = sqlite3.connect(DB_PATH)
+            conn = get_connection()
             cursor = conn.cursor()
             
             chat_id = group.get('chat_id')
@@ -940,6 +1441,7 @@ class SyncService:
                 ))
                 conn.commit()
                 conn.close()
+                bump_generation()
                 return 'updated', chat_id
             else:
                 # 新增
@@ -969,6 +1471,7 @@ class SyncService:
                 ))
                 conn.commit()
                 conn.close()
+                bump_generation()
                 return 'added', chat_id
                 
         except Exception as e:
@@ -0,0 +1,274 @@
+"""
+客户标签位图索引
+每个客户分配一个稠密序号（按 customers.rowid 顺序，新客户追加在末尾），
+每个企业标签名（以及标签组名）对应一个分块压缩位图，多标签的交集/并集/计数/分页都是位运算。
+
+启动时后台构建，客户同步的写事务提交后按客户增量修补；
+未构建完成时查询会同步构建一次。
+"""
+import threading
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import customer_index
+from database import get_connection
+
+# 每个分块覆盖 2^16 个序号；空分块不存储，稀疏标签只占用命中的分块
+CHUNK_SHIFT = 16
+CHUNK_MASK = (1 << CHUNK_SHIFT) - 1
+
+# Python 3.10+ 有 int.bit_count
+_popcount = getattr(int, 'bit_count', None) or (lambda bits: bin(bits).count('1'))
+
+
+class Bitmap:
+    """分块位图：{分块号: Python int 位集}"""
+
+    __slots__ = ('chunks',)
+
+    def __init__(self, chunks: Optional[Dict[int, int]] = None):
+        self.chunks = chunks or {}
+
+    @classmethod
+    def from_positions(cls, positions: Iterable[int]) -> 'Bitmap':
+        chunks: Dict[int, int] = {}
+        for pos in positions:
+            key = pos >> CHUNK_SHIFT
+            chunks[key] = chunks.get(key, 0) | (1 << (pos & CHUNK_MASK))
+        return cls(chunks)
+
+    def add(self, pos: int):
+        key = pos >> CHUNK_SHIFT
+        self.chunks[key] = self.chunks.get(key, 0) | (1 << (pos & CHUNK_MASK))
+
+    def discard(self, pos: int):
+        key = pos >> CHUNK_SHIFT
+        bits = self.chunks.get(key)
+        if bits is None:
+            return
+        bits &= ~(1 << (pos & CHUNK_MASK))
+        if bits:
+            self.chunks[key] = bits
+        else:
+            del self.chunks[key]
+
+    def __contains__(self, pos: int) -> bool:
+        return bool(self.chunks.get(pos >> CHUNK_SHIFT, 0) >> (pos & CHUNK_MASK) & 1)
+
+    def __and__(self, other: 'Bitmap') -> 'Bitmap':
+        small, large = (self, other) if len(self.chunks) <= len(other.chunks) else (other, self)
+        chunks = {}
+        for key, bits in small.chunks.items():
+            both = bits & large.chunks.get(key, 0)
+            if both:
+                chunks[key] = both
+        return Bitmap(chunks)
+
+    def __or__(self, other: 'Bitmap') -> 'Bitmap':
+        chunks = dict(self.chunks)
+        for key, bits in other.chunks.items():
+            chunks[key] = chunks.get(key, 0) | bits
+        return Bitmap(chunks)
+
+    def copy(self) -> 'Bitmap':
+        return Bitmap(dict(self.chunks))
+
+    def count(self) -> int:
+        return sum(_popcount(bits) for bits in self.chunks.values())
+
+    def positions(self, offset: int = 0, limit: Optional[int] = None) -> List[int]:
+        """按序号升序取第 offset 个起的 limit 个位置（整块跳过，不逐位遍历）"""
+        result = []
+        for key in sorted(self.chunks):
+            bits = self.chunks[key]
+            if offset:
+                size = _popcount(bits)
+                if offset >= size:
+                    offset -= size
+                    continue
+            base = key << CHUNK_SHIFT
+            while bits:
+                low = bits & -bits
+                if offset:
+                    offset -= 1
+                else:
+                    result.append(base + low.bit_length() - 1)
+                    if limit is not None and len(result) >= limit:
+                        return result
+                bits ^= low
+        return result
+
+
+class TagBitmapIndex:
+    """企业标签名 -> 客户位图"""
+
+    def __init__(self, db_path: Optional[str] = None):
+        self.db_path = db_path
+        self._lock = threading.RLock()
+        self._built = False
+        self._building = False
+        self._building_lock = threading.Lock()
+        self._ids: List[str] = []
+        self._ordinals: Dict[str, int] = {}
+        self._bitmaps: Dict[str, Bitmap] = {}
+        # 标签组名 -> 拥有该组任一标签的客户（按类型筛选时标签组名也参与匹配）
+        self._group_bitmaps: Dict[str, Bitmap] = {}
+        # 客户序号 -> 当前所在的 (标签名, 标签组名)，修补时只从这些位图中移除
+        self._customer_tags: Dict[int, Tuple[Tuple[str, ...], Tuple[str, ...]]] = {}
+
+    # ---------- 构建与维护 ----------
+
+    def build(self):
+        """从 customers / customer_tag_links 全量构建"""
+        with self._lock:
+            conn = get_connection(self.db_path)
+            try:
+                cursor = conn.cursor()
+                cursor.execute("SELECT id FROM customers ORDER BY rowid")
+                ids = [row[0] for row in cursor.fetchall()]
+                ordinals = {customer_id: i for i, customer_id in enumerate(ids)}
+
+                positions: Dict[str, List[int]] = {}
+                group_positions: Dict[str, List[int]] = {}
+                customer_names: Dict[int, Tuple[set, set]] = {}
+                cursor.execute("""
+                    SELECT customer_id, tag_name, group_name FROM customer_tag_links
+                    WHERE tag_type = ? AND tag_name != ''
+                """, (customer_index.TAG_TYPE_ENTERPRISE,))
+                for customer_id, tag_name, group_name in cursor:
+                    pos = ordinals.get(customer_id)
+                    if pos is None:
+                        continue
+                    positions.setdefault(tag_name, []).append(pos)
+                    names = customer_names.setdefault(pos, (set(), set()))
+                    names[0].add(tag_name)
+                    if group_name:
+                        group_positions.setdefault(group_name, []).append(pos)
+                        names[1].add(group_name)
+            finally:
+                conn.close()
+
+            self._ids = ids
+            self._ordinals = ordinals
+            self._bitmaps = {name: Bitmap.from_positions(pos) for name, pos in positions.items()}
+            self._group_bitmaps = {name: Bitmap.from_positions(pos) for name, pos in group_positions.items()}
+            self._customer_tags = {
+                pos: (tuple(tag_names), tuple(group_names)) for pos, (tag_names, group_names) in customer_names.items()
+            }
+            self._built = True
+        print(f"[位图索引] 构建完成：{len(ids)} 个客户，{len(self._bitmaps)} 个标签")
+
+    def ensure_built(self):
+        if not self._built:
+            with self._lock:
+                if not self._built:
+                    self.build()
+
+    @property
+    def built(self) -> bool:
+        return self._built
+
+    def build_in_background(self):
+        """未构建时在后台线程构建，调用方不等待（同一时间只有一个构建线程）"""
+        with self._building_lock:
+            if self._built or self._building:
+                return
+            self._building = True
+
+        def run():
+            try:
+                self.ensure_built()
+            except Exception as e:
+                print(f"[位图索引] 后台构建失败: {e}")
+            finally:
+                with self._building_lock:
+                    self._building = False
+
+        threading.Thread(target=run, name="tag-bitmap-build", daemon=True).start()
+
+    def invalidate(self):
+        """批量写入后整体失效，下次查询时重建"""
+        with self._lock:
+            self._built = False
+
+    def update_customer(self, customer_id: str, tags: List[Dict]):
+        """客户标签变更后修补位图（在数据库事务提交之后调用）"""
+        with self._lock:
+            if not self._built:
+                return
+            pos = self._ordinals.get(customer_id)
+            if pos is None:
+                pos = len(self._ids)
+                self._ids.append(customer_id)
+                self._ordinals[customer_id] = pos
+            else:
+                # 只从客户原有标签、标签组的位图中移除
+                old_tag_names, old_group_names = self._customer_tags.pop(pos, ((), ()))
+                for bitmaps, names in ((self._bitmaps, old_tag_names), (self._group_bitmaps, old_group_names)):
+                    for name in names:
+                        bitmap = bitmaps.get(name)
+                        if bitmap is None:
+                            continue
+                        bitmap.discard(pos)
+                        if not bitmap.chunks:
+                            del bitmaps[name]
+
+            tag_names = {}
+            group_names = {}
+            for tag_id, tag_name, group_name, tag_type in customer_index.build_tag_links(tags):
+                if tag_type != customer_index.TAG_TYPE_ENTERPRISE or not tag_name:
+                    continue
+                tag_names[tag_name] = None
+                if group_name:
+                    group_names[group_name] = None
+            for name in tag_names:
+                self._bitmaps.setdefault(name, Bitmap()).add(pos)
+            for name in group_names:
+                self._group_bitmaps.setdefault(name, Bitmap()).add(pos)
+            if tag_names:
+                self._customer_tags[pos] = (tuple(tag_names), tuple(group_names))
+
+    # ---------- 查询 ----------
+
+    def tag_names(self) -> List[str]:
+        self.ensure_built()
+        with self._lock:
+            return list(self._bitmaps)
+
+    def customers_with_all(self, tag_names: List[str]) -> Bitmap:
+        """同时拥有全部标签的客户"""
+        self.ensure_built()
+        with self._lock:
+            result = None
+            for name in tag_names:
+                bitmap = self._bitmaps.get(name)
+                if bitmap is None:
+                    return Bitmap()
+                result = bitmap.copy() if result is None else result & bitmap
+            return result or Bitmap()
+
+    def customers_with_any(self, tag_names: Iterable[str], group_names: Iterable[str] = ()) -> Bitmap:
+        """拥有任一标签、或任一标签组下标签的客户"""
+        self.ensure_built()
+        with self._lock:
+            result = Bitmap()
+            for bitmaps, names in ((self._bitmaps, tag_names), (self._group_bitmaps, group_names)):
+                for name in names:
+                    bitmap = bitmaps.get(name)
+                    if bitmap is not None:
+                        result = result | bitmap
+            return result
+
+    def matching_tags(self, keywords: List[str]) -> List[str]:
+        """名称包含任一关键词的标签"""
+        self.ensure_built()
+        with self._lock:
+            return [name for name in self._bitmaps if any(keyword in name for keyword in keywords)]
+
+    def customer_ids(self, bitmap: Bitmap, offset: int = 0, limit: Optional[int] = None) -> List[str]:
+        """位图中第 offset 个起的 limit 个客户ID（按序号顺序）"""
+        with self._lock:
+            return [self._ids[pos] for pos in bitmap.positions(offset, limit)]
+
+
+# 全局实例
+tag_index = TagBitmapIndex()
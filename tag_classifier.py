@@ -0,0 +1,184 @@
+"""
+标签分类器
+把企业标签名归类为：重点标签卡片（用户标签/代理商/...）、增长趋势分类（user/agent/...）、省份。
+所有"包含关键词"规则编译进一个 Aho-Corasick 自动机，一次扫描标签名得到全部命中；
+分类结果在标签保存时写入 tag_classes 表，查询接口直接按索引列过滤，不再做字符串匹配。
+
+规则可通过 config.TAG_RULES_FILE 指向的 JSON 文件覆盖（键与 DEFAULT_RULES 相同，缺省的部分沿用默认值）。
+"""
+import hashlib
+import json
+import os
+from collections import deque
+from typing import Dict, Iterable, List, NamedTuple, Optional, Set
+
+from config import TAG_RULES_FILE
+
+DEFAULT_RULES = {
+    # 重点标签卡片，按顺序优先匹配（"原有老代理商"先于"代理商"）
+    # exact: 标签名完全相等；contains: 标签名包含任一关键词
+    "key_categories": [
+        {"name": "用户标签", "exact": ["用户", "客户", "用户标签"]},
+        {"name": "原有老代理", "contains": ["原有老代理商", "原有老代理", "老代理商"]},
+        {"name": "代理商", "exact": ["代理商", "代理"]},
+        {"name": "合伙人", "contains": ["合伙人"]},
+        {"name": "供应商", "contains": ["供应商"]},
+        {"name": "同行", "contains": ["同行"]},
+    ],
+    # 增长趋势/排行榜的标签分类，一个标签可属于多个分类
+    "growth_categories": {
+        "user": ["用户", "客户"],
+        "agent": ["代理商", "代理"],
+        "partner": ["合伙人"],
+        "supplier": ["供应商"],
+        "peer": ["同行", "上游同行"],
+        "old-agent": ["原有老代理", "历史-代理"],
+    },
+    # 省份标签：包含任一地名，或包含任一后缀
+    "provinces": [
+        "北京", "上海", "天津", "重庆", "河北", "山西", "辽宁", "吉林", "黑龙江",
+        "江苏", "浙江", "安徽", "福建", "江西", "山东", "河南", "湖北", "湖南",
+        "广东", "海南", "四川", "贵州", "云南", "陕西", "甘肃", "青海", "台湾",
+        "内蒙古", "广西", "西藏", "宁夏", "新疆", "香港", "澳门",
+    ],
+    "province_suffixes": ["省", "市"],
+}
+
+
+class AhoCorasick:
+    """多模式子串匹配：一次扫描文本，返回命中的全部模式"""
+
+    def __init__(self, patterns: Iterable[str]):
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._output: List[Set[str]] = [set()]
+
+        for pattern in patterns:
+            if not pattern:
+                continue
+            state = 0
+            for char in pattern:
+                next_state = self._goto[state].get(char)
+                if next_state is None:
+                    next_state = len(self._goto)
+                    self._goto[state][char] = next_state
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._output.append(set())
+                state = next_state
+            self._output[state].add(pattern)
+
+        # 广度优先构建失败指针，并把后缀状态的输出合并进来
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fail = self._fail[state]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[next_state] = self._goto[fail].get(char, 0)
+                self._output[next_state] |= self._output[self._fail[next_state]]
+
+    def find(self, text: str) -> Set[str]:
+        found: Set[str] = set()
+        state = 0
+        for char in text:
+            while state and char not in self._goto[state]:
+                state = self._fail[state]
+            state = self._goto[state].get(char, 0)
+            if self._output[state]:
+                found |= self._output[state]
+        return found
+
+
+class TagClass(NamedTuple):
+    key_category: str   # 重点标签卡片名，未命中为空字符串
+    province: str       # 省份名（命中地名时取地名，只命中后缀时取标签名），非省份为空字符串
+    category_mask: int  # 增长趋势分类位掩码，见 TagClassifier.category_bit
+
+
+class TagClassifier:
+    """按规则编译的标签分类器（分类结果按标签名缓存）"""
+
+    def __init__(self, rules: Optional[Dict] = None):
+        rules = dict(DEFAULT_RULES, **(rules or {}))
+        # 规则指纹：规则变化后依赖分类的持久化汇总（customer_daily_adds）需要重建
+        self.fingerprint = hashlib.md5(
+            json.dumps(rules, ensure_ascii=False, sort_keys=True).encode('utf-8')
+        ).hexdigest()
+        self.key_rules = rules["key_categories"]
+        self.growth_categories: Dict[str, List[str]] = rules["growth_categories"]
+        self.provinces: List[str] = rules["provinces"]
+        self.province_suffixes: List[str] = rules["province_suffixes"]
+
+        # 重点标签卡片名（按规则顺序）与增长分类的位
+        self.key_categories = [rule["name"] for rule in self.key_rules]
+        self._bits = {category: 1 << i for i, category in enumerate(self.growth_categories)}
+
+        patterns = set(self.provinces) | set(self.province_suffixes)
+        for rule in self.key_rules:
+            patterns.update(rule.get("contains", []))
+        for keywords in self.growth_categories.values():
+            patterns.update(keywords)
+        self._matcher = AhoCorasick(sorted(patterns))
+        self._cache: Dict[str, TagClass] = {}
+
+    def category_bit(self, category: str) -> int:
+        """增长分类对应的位，未知分类返回 0"""
+        return self._bits.get(category, 0)
+
+    def classify(self, tag_name: str) -> TagClass:
+        cached = self._cache.get(tag_name)
+        if cached is not None:
+            return cached
+
+        hits = self._matcher.find(tag_name)
+
+        key_category = ''
+        for rule in self.key_rules:
+            if tag_name in rule.get("exact", ()) or hits.intersection(rule.get("contains", ())):
+                key_category = rule["name"]
+                break
+
+        province = ''
+        for name in self.provinces:
+            if name in hits:
+                province = name
+                break
+        if not province and hits.intersection(self.province_suffixes):
+            province = tag_name
+
+        mask = 0
+        for category, keywords in self.growth_categories.items():
+            if hits.intersection(keywords):
+                mask |= self._bits[category]
+
+        result = TagClass(key_category, province, mask)
+        self._cache[tag_name] = result
+        return result
+
+    def categories(self, tag_names: Iterable[str]) -> List[str]:
+        """标签名集合命中的增长分类"""
+        mask = 0
+        for name in tag_names:
+            mask |= self.classify(name).category_mask
+        return [category for category, bit in self._bits.items() if mask & bit]
+
+
+def load_rules(path: str = TAG_RULES_FILE) -> Dict:
+    """读取规则覆盖文件，未配置或读取失败时使用默认规则"""
+    if not path or not os.path.exists(path):
+        return {}
+    try:
+        with open(path, encoding='utf-8') as f:
+            rules = json.load(f)
+        print(f"[标签分类] 已加载规则文件: {path}")
+        return {key: value for key, value in rules.items() if key in DEFAULT_RULES}
+    except (OSError, ValueError) as e:
+        print(f"[警告] 标签分类规则文件读取失败，使用默认规则: {e}")
+        return {}
+
+
+# 全局实例
+classifier = TagClassifier(load_rules())
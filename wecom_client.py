@@ -5,12 +5,66 @@ import time
 import json
 import requests
 from pathlib import Path
-from typing import Dict, List, Optional
+from typing import Dict, Iterator, List, Optional
+from urllib.parse import urlsplit
+from requests.adapters import HTTPAdapter
 from config import (
     CORP_ID, CONTACT_SECRET, CUSTOMER_SECRET, APP_SECRET, AGENT_ID,
     WECOM_API_BASE, CACHE_DIR,
-    ACCESS_TOKEN_CACHE_KEY, ACCESS_TOKEN_EXPIRES
+    ACCESS_TOKEN_CACHE_KEY, ACCESS_TOKEN_EXPIRES, WECOM_API_MAX_CONCURRENCY
 )
+import rate_limiter
+from rate_limiter import THROTTLE_ERRCODES, WeComRateLimited
+
+# 批量获取客户详情接口的限制：每次最多 100 个成员、每页最多 100 条
+BATCH_DETAIL_USERS = 100
+BATCH_DETAIL_LIMIT = 100
+
+def _errcode(response: requests.Response) -> Optional[int]:
+    try:
+        return response.json().get('errcode')
+    except (ValueError, AttributeError):
+        return None
+
+
+class WeComSession(requests.Session):
+    """
+    企业微信接口会话：每个请求先经过所属接口族的限流器，
+    返回限流错误码时按带抖动的指数退避重试（deferred_retries() 中改为抛出 WeComRateLimited）
+    """
+    
+    def __init__(self):
+        super().__init__()
+        adapter = HTTPAdapter(pool_maxsize=WECOM_API_MAX_CONCURRENCY * 2)
+        self.mount('https://', adapter)
+        self.mount('http://', adapter)
+    
+    def request(self, method, url, *args, **kwargs):
+        family = rate_limiter.family_for_path(urlsplit(url).path)
+        gate = rate_limiter.limiter(family)
+        attempt = 0
+        while True:
+            gate.acquire()
+            errcode = None
+            try:
+                response = super().request(method, url, *args, **kwargs)
+                errcode = _errcode(response)
+            finally:
+                gate.release(throttled=errcode in THROTTLE_ERRCODES)
+            if errcode not in THROTTLE_ERRCODES:
+                return response
+            
+            retries = rate_limiter.max_retries()
+            if retries == 0:
+                raise WeComRateLimited(family, errcode)
+            if attempt >= retries:
+                print(f"[限流] {family} 接口达到重试上限: errcode={errcode}")
+                return response
+            delay = rate_limiter.backoff_delay(attempt)
+            attempt += 1
+            print(f"[限流] {family} 接口 errcode={errcode}，{delay:.1f} 秒后第 {attempt} 次重试")
+            time.sleep(delay)
+
 
 class WeComClient:
     """企业微信 API 客户端"""
@@ -22,6 +76,7 @@ class WeComClient:
         self.app_secret = APP_SECRET  # 自建应用 Secret
         self.agent_id = AGENT_ID  # 应用 AgentId
         self.api_base = WECOM_API_BASE
+        self.http = WeComSession()  # 所有接口请求共用（连接复用 + 按接口族限流）
         
         # 禁用代理
         self.proxies = {
@@ -116,7 +171,7 @@ class WeComClient:
         print(f"[Token] Secret 长度: {len(secret)}")
         
         try:
-            response = requests.get(url, params=params, timeout=10, proxies=self.proxies)
+            response = self.http.get(url, params=params, timeout=10, proxies=self.proxies)
             result = response.json()
             
             print(f"[Token] HTTP 状态码: {response.status_code}")
@@ -179,7 +234,7 @@ class WeComClient:
         params = {'access_token': access_token}
         
         try:
-            response = requests.get(url, params=params, timeout=10, proxies=self.proxies)
+            response = self.http.get(url, params=params, timeout=10, proxies=self.proxies)
             result = response.json()
             
             if result.get('errcode') == 0:
@@ -213,7 +268,7 @@ class WeComClient:
         }
         
         try:
-            response = requests.get(url, params=params, timeout=10, proxies=self.proxies)
+            response = self.http.get(url, params=params, timeout=10, proxies=self.proxies)
             result = response.json()
             
             print(f"[成员] API 响应: errcode={result.get('errcode')}, errmsg={result.get('errmsg')}")
@@ -262,7 +317,7 @@ class WeComClient:
         params = {'access_token': access_token, 'userid': userid}
         
         try:
-            response = requests.get(url, params=params, timeout=10, proxies=self.proxies)
+            response = self.http.get(url, params=params, timeout=10, proxies=self.proxies)
             result = response.json()
             
             print(f"[客户列表] API 响应: errcode={result.get('errcode')}, errmsg={result.get('errmsg')}")
@@ -292,7 +347,7 @@ class WeComClient:
         params = {'access_token': access_token, 'external_userid': external_userid}
         
         try:
-            response = requests.get(url, params=params, timeout=10, proxies=self.proxies)
+            response = self.http.get(url, params=params, timeout=10, proxies=self.proxies)
             result = response.json()
             
             if result.get('errcode') == 0:
@@ -300,10 +355,76 @@ class WeComClient:
             else:
                 print(f"[客户详情] 获取失败: {result.get('errmsg')}")
                 return None
+        except WeComRateLimited:
+            raise
         except Exception as e:
             print(f"[客户详情] 请求异常: {e}")
             return None
     
+    def batch_get_external_contacts(self, userid_list: List[str], cursor: str = "",
+                                    limit: int = BATCH_DETAIL_LIMIT) -> Optional[Dict]:
+        """
+        批量获取客户详情（一页），每个 (客户, 跟进成员) 一条记录
+        :param userid_list: 成员 userid 列表（最多 100 个）
+        :param cursor: 分页游标，首页为空
+        :param limit: 每页条数（最多 100）
+        :return: {'external_contact_list': [...], 'next_cursor': ''}，失败返回 None
+        """
+        # 优先使用应用 Token，其次客户联系 Token
+        access_token = self.get_access_token("app") or self.get_access_token("customer")
+        if not access_token:
+            return None
+        
+        url = f"{self.api_base}/externalcontact/batch/get_by_user"
+        params = {'access_token': access_token}
+        data = {'userid_list': userid_list, 'cursor': cursor, 'limit': limit}
+        
+        try:
+            response = self.http.post(url, params=params, json=data, timeout=15, proxies=self.proxies)
+            result = response.json()
+            
+            if result.get('errcode') == 0:
+                return result
+            else:
+                print(f"[批量客户详情] 获取失败: errcode={result.get('errcode')}, errmsg={result.get('errmsg')}")
+                return None
+        except Exception as e:
+            print(f"[批量客户详情] 请求异常: {e}")
+            return None
+    
+    def iter_external_contact_details(self, userid_list: List[str]) -> Iterator[Dict]:
+        """
+        按成员分页批量获取客户详情，逐条返回与 get_external_contact_detail 相同结构的结果：
+        {'external_contact': {...}, 'follow_user': [跟进记录]}（每条只含一个跟进成员）
+        
+        批量接口的跟进记录只返回企业标签ID，这里按企业标签库补全为 tags；个人标签和规则标签不返回。
+        某一页获取失败时停止该批成员的迭代，调用方按未返回的客户逐个补拉。
+        """
+        tag_map = {}
+        for group in self.get_corp_tag_list():
+            for tag in group.get('tag', []):
+                tag_map[tag.get('id')] = {
+                    'group_name': group.get('group_name', ''),
+                    'tag_name': tag.get('name', ''),
+                    'tag_id': tag.get('id'),
+                    'type': 1
+                }
+        
+        for start in range(0, len(userid_list), BATCH_DETAIL_USERS):
+            chunk = userid_list[start:start + BATCH_DETAIL_USERS]
+            cursor = ""
+            while True:
+                result = self.batch_get_external_contacts(chunk, cursor)
+                if result is None:
+                    break
+                for item in result.get('external_contact_list', []):
+                    follow = dict(item.get('follow_info', {}))
+                    follow['tags'] = [tag_map[tag_id] for tag_id in follow.pop('tag_id', []) if tag_id in tag_map]
+                    yield {'external_contact': item.get('external_contact', {}), 'follow_user': [follow]}
+                cursor = result.get('next_cursor', '')
+                if not cursor:
+                    break
+    
     def get_corp_tag_list(self, tag_id: List[str] = None) -> List[Dict]:
         """
         获取企业标签库
@@ -321,7 +442,7 @@ class WeComClient:
             data['tag_id'] = tag_id
         
         try:
-            response = requests.post(url, params=params, json=data, timeout=10, proxies=self.proxies)
+            response = self.http.post(url, params=params, json=data, timeout=10, proxies=self.proxies)
             result = response.json()
             
             if result.get('errcode') == 0:
@@ -362,7 +483,7 @@ class WeComClient:
         
         try:
             print(f"[客户群标签] 尝试专用API: {url}")
-            response = requests.post(url, params=params, json=data, timeout=10, proxies=self.proxies)
+            response = self.http.post(url, params=params, json=data, timeout=10, proxies=self.proxies)
             
             print(f"[客户群标签] 响应状态码: {response.status_code}")
             
@@ -406,7 +527,7 @@ class WeComClient:
         
         try:
             print(f"[客户群标签-备选] 使用企业标签API: {url}")
-            response = requests.post(url, params=params, json=data, timeout=10, proxies=self.proxies)
+            response = self.http.post(url, params=params, json=data, timeout=10, proxies=self.proxies)
             result = response.json()
             
             if result.get('errcode') == 0:
@@ -446,7 +567,7 @@ class WeComClient:
             }
             
             try:
-                response = requests.post(url, params=params, json=data, timeout=10, proxies=self.proxies)
+                response = self.http.post(url, params=params, json=data, timeout=10, proxies=self.proxies)
                 result = response.json()
                 
                 if result.get('errcode') == 0:
@@ -499,7 +620,7 @@ class WeComClient:
         for attempt in range(retry_count):
             try:
                 # 关键修复：降低超时时间到15秒，快速失败
-                response = requests.post(url, params=params, json=data, timeout=15, proxies=self.proxies)
+                response = self.http.post(url, params=params, json=data, timeout=15, proxies=self.proxies)
                 result = response.json()
                 
                 print(f"[客户群详情] API响应: errcode={result.get('errcode')}, errmsg={result.get('errmsg')}")
@@ -539,16 +660,10 @@ class WeComClient:
                         'status': 0,  # 默认正常状态
                         'version': group_chat.get('version', 0)
                     }
-                elif result.get('errcode') == 84061:  # 限流
-                    wait_time = (attempt + 1) * 2  # 逐步增加等待时间
-                    if attempt < retry_count - 1:
-                        import time
-                        print(f"[限流] 遇到限流，等待 {wait_time} 秒后重试 (第{attempt + 1}次)...")
-                        time.sleep(wait_time)
-                        continue
-                    else:
-                        print(f"[客户群详情] 获取失败 ({chat_id}): 达到限流重试上限")
-                        return None
+                elif result.get('errcode') in THROTTLE_ERRCODES:
+                    # 限流已由 WeComSession 按退避重试过，这里不再重复等待
+                    print(f"[客户群详情] 获取失败 ({chat_id}): 达到限流重试上限")
+                    return None
                 elif result.get('errcode') == 40014:  # 无效的access_token
                     print(f"[客户群详情] access_token 无效，尝试重新获取")
                     # 清除token缓存
@@ -598,7 +713,7 @@ class WeComClient:
             url = f"{self.api_base}/user/get"
             params = {'access_token': access_token, 'userid': userid}
             
-            response = requests.get(url, params=params, timeout=5, proxies=self.proxies)
+            response = self.http.get(url, params=params, timeout=5, proxies=self.proxies)
             result = response.json()
             
             if result.get('errcode') == 0:
@@ -630,7 +745,7 @@ class WeComClient:
         }
         
         try:
-            response = requests.post(url, params=params, json=data, timeout=10, proxies=self.proxies)
+            response = self.http.post(url, params=params, json=data, timeout=10, proxies=self.proxies)
             result = response.json()
             
             print(f"[更新备注] API响应: {result}")
@@ -672,7 +787,7 @@ class WeComClient:
             data['remove_tag'] = remove_tag
         
         try:
-            response = requests.post(url, params=params, json=data, timeout=10, proxies=self.proxies)
+            response = self.http.post(url, params=params, json=data, timeout=10, proxies=self.proxies)
             result = response.json()
             
             print(f"[更新标签] API响应: {result}")
@@ -784,7 +899,7 @@ class WeComClient:
         url = f"{self.api_base}/wedoc/get_space_list"
         
         try:
-            response = requests.post(
+            response = self.http.post(
                 url,
                 params={'access_token': access_token},
                 json={},
@@ -860,7 +975,7 @@ class WeComClient:
         print(f"[表格] 请求参数: {json.dumps(data, ensure_ascii=False)}")
         
         try:
-            response = requests.post(
+            response = self.http.post(
                 url, 
                 params={'access_token': access_token},
                 json=data,
@@ -905,7 +1020,7 @@ class WeComClient:
         print(f"[表格] 删除文档: {docid}")
         
         try:
-            response = requests.post(
+            response = self.http.post(
                 url,
                 params={'access_token': access_token},
                 json=data,
@@ -950,7 +1065,7 @@ class WeComClient:
         print(f"[表格] API 路径: {get_sheet_url}")
         
         try:
-            sheet_response = requests.post(
+            sheet_response = self.http.post(
                 get_sheet_url,
                 params={'access_token': access_token},
                 json={"docid": docid},
@@ -1015,7 +1130,7 @@ class WeComClient:
             # Step 2.1: 查询现有字段
             get_fields_url = f"{self.api_base}/wedoc/smartsheet/get_fields"
             try:
-                get_fields_response = requests.post(
+                get_fields_response = self.http.post(
                     get_fields_url,
                     params={'access_token': access_token},
                     json={"docid": docid, "sheet_id": sheet_id},
@@ -1038,7 +1153,7 @@ class WeComClient:
                         delete_fields_url = f"{self.api_base}/wedoc/smartsheet/delete_fields"
                         
                         try:
-                            delete_response = requests.post(
+                            delete_response = self.http.post(
                                 delete_fields_url,
                                 params={'access_token': access_token},
                                 json={
@@ -1083,7 +1198,7 @@ class WeComClient:
                     }
                     
                     try:
-                        fields_response = requests.post(
+                        fields_response = self.http.post(
                             add_fields_url,
                             params={'access_token': access_token},
                             json=fields_data,
@@ -1103,7 +1218,7 @@ class WeComClient:
                             
                             # 重新查询字段列表，验证实际顺序
                             print(f"[表格] 🔍 查询实际字段顺序...")
-                            verify_response = requests.post(
+                            verify_response = self.http.post(
                                 get_fields_url,
                                 params={'access_token': access_token},
                                 json={"docid": docid, "sheet_id": sheet_id},
@@ -1208,7 +1323,7 @@ class WeComClient:
             print(f"[表格] 示例记录（前3个字段）: {preview_dict}")
         
         try:
-            response = requests.post(
+            response = self.http.post(
                 url,
                 params={'access_token': access_token},
                 json=data,
@@ -1247,7 +1362,7 @@ class WeComClient:
                 if sheet_id:
                     try:
                         get_fields_url = f"{self.api_base}/wedoc/smartsheet/get_fields"
-                        get_fields_response = requests.post(
+                        get_fields_response = self.http.post(
                             get_fields_url,
                             params={'access_token': access_token},
                             json={"docid": docid, "sheet_id": sheet_id},
@@ -1324,7 +1439,7 @@ class WeComClient:
         print(f"[表格] 设置权限，docid={docid}, auth_type={auth_type}")
         
         try:
-            response = requests.post(
+            response = self.http.post(
                 url,
                 params={'access_token': access_token},
                 json=data,
@@ -1372,7 +1487,7 @@ class WeComClient:
         print(f"[表格] 读取数据，docid={docid}, 范围={range_str or '全部'}")
         
         try:
-            response = requests.post(
+            response = self.http.post(
                 url,
                 params={'access_token': access_token},
                 json=data,
@@ -1424,7 +1539,7 @@ class WeComClient:
         print(f"[表格] API 路径: {url}")
         
         try:
-            response = requests.post(
+            response = self.http.post(
                 url,
                 params={'access_token': access_token},
                 json=data,
@@ -1497,7 +1612,7 @@ class WeComClient:
             print(f"  - fields 数量: {len(fields)}")
             print(f"  - 添加顺序（倒序，前10个）: {[f['field_title'] for f in fields[:10]]}")
             
-            response = requests.post(
+            response = self.http.post(
                 url,
                 params={'access_token': access_token},
                 json=data,
@@ -1539,7 +1654,7 @@ class WeComClient:
             if sheet_id:
                 get_fields_data["sheet_id"] = sheet_id
             
-            response = requests.post(
+            response = self.http.post(
                 get_fields_url,
                 params={'access_token': access_token},
                 json=get_fields_data,
@@ -1576,7 +1691,7 @@ class WeComClient:
             if sheet_id:
                 delete_data["sheet_id"] = sheet_id
             
-            response = requests.post(
+            response = self.http.post(
                 delete_url,
                 params={'access_token': access_token},
                 json=delete_data,
@@ -1606,7 +1721,7 @@ class WeComClient:
             if sheet_id:
                 get_fields_data["sheet_id"] = sheet_id
             
-            response = requests.post(
+            response = self.http.post(
                 get_fields_url,
                 params={'access_token': access_token},
                 json=get_fields_data,
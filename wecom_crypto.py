@@ -0,0 +1,91 @@
+"""
+企业微信回调消息加解密
+- 签名：SHA1(排序后的 token、timestamp、nonce、密文)
+- 加密：AES-256-CBC，密钥为 EncodingAESKey 补 '=' 后 Base64 解码的 32 字节，IV 取密钥前 16 字节，
+  PKCS#7 按 32 字节补位；明文结构为 16 字节随机串 + 4 字节网络序长度 + 消息 + ReceiveId（企业ID）
+
+依赖 pycryptodome，未安装时回调功能不可用，其余功能不受影响。
+"""
+import base64
+import hashlib
+import os
+import socket
+import struct
+from typing import Optional
+
+try:
+    from Crypto.Cipher import AES
+    CRYPTO_AVAILABLE = True
+except ImportError:
+    AES = None
+    CRYPTO_AVAILABLE = False
+
+BLOCK_SIZE = 32
+
+
+class WeComCryptoError(Exception):
+    """签名校验或解密失败"""
+
+
+def _pad(data: bytes) -> bytes:
+    amount = BLOCK_SIZE - len(data) % BLOCK_SIZE
+    return data + bytes([amount]) * amount
+
+
+def _unpad(data: bytes) -> bytes:
+    amount = data[-1] if data else 0
+    if not 1 <= amount <= BLOCK_SIZE:
+        raise WeComCryptoError("补位长度不合法")
+    return data[:-amount]
+
+
+class WeComCrypto:
+    """企业微信回调加解密（与官方 WXBizMsgCrypt 兼容）"""
+
+    def __init__(self, token: str, encoding_aes_key: str, receive_id: str):
+        if not CRYPTO_AVAILABLE:
+            raise WeComCryptoError("未安装 pycryptodome，无法解密企业微信回调。安装方法: pip install pycryptodome")
+        try:
+            self.key = base64.b64decode(encoding_aes_key + "=")
+        except ValueError as e:
+            raise WeComCryptoError(f"EncodingAESKey 格式错误: {e}")
+        if len(self.key) != 32:
+            raise WeComCryptoError("EncodingAESKey 长度必须为 43 个字符")
+        self.token = token
+        self.receive_id = receive_id
+
+    def signature(self, timestamp: str, nonce: str, encrypt: str) -> str:
+        parts = sorted([self.token, timestamp, nonce, encrypt])
+        return hashlib.sha1("".join(parts).encode("utf-8")).hexdigest()
+
+    def verify(self, msg_signature: str, timestamp: str, nonce: str, encrypt: str):
+        if self.signature(timestamp, nonce, encrypt) != msg_signature:
+            raise WeComCryptoError("签名校验失败")
+
+    def decrypt(self, encrypt: str) -> str:
+        """解密密文，返回消息明文（校验 ReceiveId）"""
+        try:
+            cipher = AES.new(self.key, AES.MODE_CBC, self.key[:16])
+            plain = _unpad(cipher.decrypt(base64.b64decode(encrypt)))
+            length = socket.ntohl(struct.unpack("I", plain[16:20])[0])
+            message = plain[20:20 + length]
+            receive_id = plain[20 + length:]
+        except WeComCryptoError:
+            raise
+        except Exception as e:
+            raise WeComCryptoError(f"解密失败: {e}")
+        if self.receive_id and receive_id.decode("utf-8", "replace") != self.receive_id:
+            raise WeComCryptoError("ReceiveId 不匹配")
+        return message.decode("utf-8")
+
+    def encrypt(self, message: str, random_bytes: Optional[bytes] = None) -> str:
+        """加密消息（被动回复、联调时使用）"""
+        data = message.encode("utf-8")
+        plain = (random_bytes or os.urandom(16)) + struct.pack("I", socket.htonl(len(data))) \
+            + data + self.receive_id.encode("utf-8")
+        cipher = AES.new(self.key, AES.MODE_CBC, self.key[:16])
+        return base64.b64encode(cipher.encrypt(_pad(plain))).decode("ascii")
+
+    def verify_and_decrypt(self, msg_signature: str, timestamp: str, nonce: str, encrypt: str) -> str:
+        self.verify(msg_signature, timestamp, nonce, encrypt)
+        return self.decrypt(encrypt)